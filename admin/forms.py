@@ -1,9 +1,11 @@
 """Admin forms"""
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileRequired, FileAllowed
-from wtforms import StringField, TextAreaField, SelectField, BooleanField, SubmitField, SelectMultipleField
-from wtforms.validators import DataRequired, Email, Length, Optional
+from wtforms import (StringField, TextAreaField, SelectField, BooleanField, SubmitField, SelectMultipleField,
+                     IntegerField)
+from wtforms.validators import DataRequired, Email, Length, Optional, NumberRange
 from wtforms.fields import DateTimeLocalField
+from wtforms.widgets import CheckboxInput, ListWidget
 
 
 class CustomerCreateForm(FlaskForm):
@@ -94,11 +96,24 @@ class BulkAssignmentForm(FlaskForm):
     file_id = SelectField('File', coerce=int, validators=[
         DataRequired(message='Please select a file')
     ])
-    customer_ids = SelectMultipleField('Customers', coerce=int, validators=[
-        DataRequired(message='Please select at least one customer')
-    ])
+    customer_ids = SelectMultipleField('Customers', coerce=int,
+                                       widget=ListWidget(prefix_label=False), option_widget=CheckboxInput(),
+                                       validators=[DataRequired(message='Please select at least one customer')])
     expiration_date = DateTimeLocalField('Expiration Date (optional)', 
                                         format='%Y-%m-%dT%H:%M',
                                         validators=[Optional()])
     send_notification = BooleanField('Send Email Notification', default=True)
     submit = SubmitField('Assign to Selected Customers')
+
+
+class ProfileTriggerForm(FlaskForm):
+    """Form for profiling a customer's next requests"""
+    customer_id = SelectField('Customer', coerce=int, validators=[
+        DataRequired(message='Please select a customer')
+    ])
+    endpoint = StringField('Endpoint (optional)', validators=[Optional(), Length(max=100)])
+    mode = SelectField('Mode', choices=[('cpu', 'CPU (sampled stacks)'), ('memory', 'Memory (tracemalloc)')])
+    count = IntegerField('Requests to Capture', default=1, validators=[
+        DataRequired(), NumberRange(min=1, max=20)
+    ])
+    submit = SubmitField('Arm Profiler')
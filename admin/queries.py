@@ -0,0 +1,187 @@
+"""Read-only projections for the admin list views
+
+Each query selects only the columns its template shows, joined in a
+single statement, and returns small slotted row objects instead of ORM
+instances: no identity map, no change tracking and no lazy loads per row.
+The row objects keep the attribute names the templates already use
+(log.user.username, assignment.is_expired(), ...).
+"""
+from datetime import datetime
+from sqlalchemy import func, desc, select
+from models import db
+from models.user import User
+from models.file import File
+from models.file_assignment import FileAssignment
+from models.download_log import DownloadLog
+from models.login_attempt import LoginAttempt
+
+
+class UserSummary:
+    __slots__ = ('id', 'username', 'company_name')
+
+    def __init__(self, id, username, company_name):
+        self.id = id
+        self.username = username
+        self.company_name = company_name
+
+
+class FileSummary:
+    __slots__ = ('id', 'original_filename', 'category')
+
+    def __init__(self, id, original_filename, category):
+        self.id = id
+        self.original_filename = original_filename
+        self.category = category
+
+
+class DownloadRow:
+    __slots__ = ('id', 'download_date', 'ip_address', 'success', 'error_message', 'user', 'file')
+
+    def __init__(self, id, download_date, ip_address, success, error_message, user, file):
+        self.id = id
+        self.download_date = download_date
+        self.ip_address = ip_address
+        self.success = success
+        self.error_message = error_message
+        self.user = user
+        self.file = file
+
+
+class AssignmentRow:
+    __slots__ = ('id', 'assigned_date', 'expiration_date', 'user', 'file')
+
+    def __init__(self, id, assigned_date, expiration_date, user=None, file=None):
+        self.id = id
+        self.assigned_date = assigned_date
+        self.expiration_date = expiration_date
+        self.user = user
+        self.file = file
+
+    def is_expired(self):
+        """Same rule as FileAssignment.is_expired"""
+        if not self.expiration_date:
+            return False
+        return datetime.utcnow() > self.expiration_date
+
+
+class LoginRow:
+    __slots__ = ('username', 'ip_address', 'timestamp', 'success')
+
+    def __init__(self, username, ip_address, timestamp, success):
+        self.username = username
+        self.ip_address = ip_address
+        self.timestamp = timestamp
+        self.success = success
+
+
+_USER_COLUMNS = (User.id, User.username, User.company_name)
+_FILE_COLUMNS = (File.id, File.original_filename, File.category)
+_DOWNLOAD_COLUMNS = (DownloadLog.id, DownloadLog.download_date, DownloadLog.ip_address,
+                     DownloadLog.success, DownloadLog.error_message)
+_ASSIGNMENT_COLUMNS = (FileAssignment.id, FileAssignment.assigned_date, FileAssignment.expiration_date)
+
+
+def _download_row(row):
+    return DownloadRow(*row[:5], user=UserSummary(*row[5:8]), file=FileSummary(*row[8:11]))
+
+
+def _assignment_row(row):
+    return AssignmentRow(*row[:3], user=UserSummary(*row[3:6]), file=FileSummary(*row[6:9]))
+
+
+def _download_query():
+    return db.session.query(*_DOWNLOAD_COLUMNS, *_USER_COLUMNS, *_FILE_COLUMNS)\
+        .select_from(DownloadLog)\
+        .join(User, DownloadLog.user_id == User.id)\
+        .join(File, DownloadLog.file_id == File.id)
+
+
+def _project_page(pagination, factory):
+    """Swap a pagination's result rows for row objects"""
+    pagination.items = [factory(row) for row in pagination.items]
+    return pagination
+
+
+def get_dashboard_counts():
+    """Customer, file and download totals in one round trip"""
+    def count(*criteria, model):
+        return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+    return db.session.execute(select(
+        count(User.role == 'customer', model=User).label('total_customers'),
+        count(User.role == 'customer', User.is_active == True, model=User).label('active_customers'),
+        count(File.is_active == True, model=File).label('total_files'),
+        count(DownloadLog.success == True, model=DownloadLog).label('total_downloads'),
+    )).one()._asdict()
+
+
+def get_recent_downloads(limit, user_id=None, successful_only=False):
+    """Newest downloads, optionally for one customer"""
+    query = _download_query()
+    if user_id is not None:
+        query = query.filter(DownloadLog.user_id == user_id)
+    if successful_only:
+        query = query.filter(DownloadLog.success == True)
+    return [_download_row(row) for row in query.order_by(desc(DownloadLog.download_date)).limit(limit)]
+
+
+def get_download_page(page, per_page, user_id=None, file_id=None):
+    """One page of the activity log"""
+    query = _download_query()
+    if user_id:
+        query = query.filter(DownloadLog.user_id == user_id)
+    if file_id:
+        query = query.filter(DownloadLog.file_id == file_id)
+    return _project_page(query.order_by(desc(DownloadLog.download_date))
+                         .paginate(page=page, per_page=per_page, error_out=False), _download_row)
+
+
+def get_recent_logins(limit, username=None):
+    query = db.session.query(LoginAttempt.username, LoginAttempt.ip_address,
+                             LoginAttempt.timestamp, LoginAttempt.success)
+    if username is not None:
+        query = query.filter(LoginAttempt.username == username)
+    return [LoginRow(*row) for row in query.order_by(desc(LoginAttempt.timestamp)).limit(limit)]
+
+
+def get_top_files(limit):
+    """[(file, download count)] for the most downloaded files"""
+    rows = db.session.query(*_FILE_COLUMNS, func.count(DownloadLog.id).label('download_count'))\
+        .join(DownloadLog, DownloadLog.file_id == File.id)\
+        .group_by(*_FILE_COLUMNS)\
+        .order_by(desc('download_count'))\
+        .limit(limit)
+    return [(FileSummary(*row[:3]), row[3]) for row in rows]
+
+
+def get_assignment_page(page, per_page):
+    """One page of active assignments with their customer and file"""
+    query = db.session.query(*_ASSIGNMENT_COLUMNS, *_USER_COLUMNS, *_FILE_COLUMNS)\
+        .select_from(FileAssignment)\
+        .join(User, FileAssignment.user_id == User.id)\
+        .join(File, FileAssignment.file_id == File.id)\
+        .filter(FileAssignment.is_active == True)\
+        .order_by(desc(FileAssignment.assigned_date))
+    return _project_page(query.paginate(page=page, per_page=per_page, error_out=False), _assignment_row)
+
+
+def get_customer_assignments(customer_id):
+    """[(file, assignment)] for a customer's active assignments"""
+    rows = db.session.query(*_FILE_COLUMNS, *_ASSIGNMENT_COLUMNS)\
+        .select_from(FileAssignment)\
+        .join(File, FileAssignment.file_id == File.id)\
+        .filter(FileAssignment.user_id == customer_id, FileAssignment.is_active == True)
+    return [(FileSummary(*row[:3]), AssignmentRow(*row[3:6])) for row in rows]
+
+
+def get_customer_choices():
+    """(id, label) pairs of active customers for assignment forms"""
+    rows = db.session.query(User.id, User.username, User.company_name)\
+        .filter(User.role == 'customer', User.is_active == True)
+    return [(id, f"{username} - {company_name}") for id, username, company_name in rows]
+
+
+def get_file_choices():
+    """(id, label) pairs of active files for assignment forms"""
+    rows = db.session.query(File.id, File.original_filename, File.category).filter(File.is_active == True)
+    return [(id, f"{original_filename} ({category})") for id, original_filename, category in rows]
@@ -1,64 +1,51 @@
 """Admin routes for customer and file management"""
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, Response, abort
 from flask_login import login_required, current_user
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import partial
 from sqlalchemy import func, desc
+from sqlalchemy.orm import joinedload
 from admin import admin_bp
 from admin.decorators import admin_required, audit_log
+from admin.queries import (get_dashboard_counts, get_recent_downloads, get_recent_logins, get_top_files,
+                           get_download_page, get_assignment_page, get_customer_assignments,
+                           get_customer_choices, get_file_choices)
 from admin.forms import (CustomerCreateForm, CustomerEditForm, FileUploadForm,
-                        FileEditForm, FileAssignmentForm, BulkAssignmentForm)
+                        FileEditForm, FileAssignmentForm, BulkAssignmentForm, ProfileTriggerForm)
 from models import db
 from models.user import User
 from models.file import File
 from models.file_assignment import FileAssignment
-from models.download_log import DownloadLog
 from models.login_attempt import LoginAttempt
-from utils.file_handler import save_uploaded_file, delete_file, get_file_size
-from utils.email_service import send_welcome_email, send_new_file_notification
+from models.file_integrity import FileIntegrityCheck
+from models.job import Job
+from models.profile import Profile
+from models.profile_trigger import ProfileTrigger
+from utils.file_handler import save_uploaded_file, delete_file, format_file_size
+from utils.email_service import send_welcome_email, queue_new_file_notification
+from utils.database import read_from_replica, get_latency_stats, REPLICA_BIND
+from utils.jobs import enqueue, retry_job, get_queue_stats
+from utils.tracing import span
+from utils.slow_queries import get_slow_query_summary
+from utils.profiler import (load_capture, to_collapsed, to_speedscope, to_memory_report,
+                            refresh_triggers, PROFILE_PARAM)
+from utils.previews import is_previewable, previews_available, PREVIEW_PENDING
+from utils.tiering import get_tier_stats, get_popular_cold_files
 from auth.utils import generate_activation_token, generate_secure_password
 
 
 @admin_bp.route('/dashboard')
 @login_required
 @admin_required
+@read_from_replica
 def dashboard():
     """Admin dashboard with statistics"""
-    # Get statistics
-    total_customers = User.query.filter_by(role='customer').count()
-    active_customers = User.query.filter_by(role='customer', is_active=True).count()
-    total_files = File.query.filter_by(is_active=True).count()
-    total_downloads = DownloadLog.query.filter_by(success=True).count()
-    
-    # Recent downloads
-    recent_downloads = DownloadLog.query.filter_by(success=True)\
-        .order_by(desc(DownloadLog.download_date))\
-        .limit(10)\
-        .all()
-    
-    # Recent login attempts
-    recent_logins = LoginAttempt.query\
-        .order_by(desc(LoginAttempt.timestamp))\
-        .limit(10)\
-        .all()
-    
-    # Top downloaded files
-    top_files = db.session.query(
-        File,
-        func.count(DownloadLog.id).label('download_count')
-    ).join(DownloadLog)\
-     .group_by(File.id)\
-     .order_by(desc('download_count'))\
-     .limit(5)\
-     .all()
-    
+    # The lists are loaded inside the template's cached fragments, so a cache hit skips their queries
     return render_template('admin/dashboard.html',
-                         total_customers=total_customers,
-                         active_customers=active_customers,
-                         total_files=total_files,
-                         total_downloads=total_downloads,
-                         recent_downloads=recent_downloads,
-                         recent_logins=recent_logins,
-                         top_files=top_files)
+                         load_recent_downloads=partial(get_recent_downloads, 10, successful_only=True),
+                         load_recent_logins=partial(get_recent_logins, 10),
+                         load_top_files=partial(get_top_files, 5),
+                         **get_dashboard_counts())
 
 
 @admin_bp.route('/customers')
@@ -137,34 +124,16 @@ def create_customer():
 @admin_bp.route('/customers/<int:customer_id>')
 @login_required
 @admin_required
+@read_from_replica
 def customer_detail(customer_id):
     """View customer details"""
     customer = User.query.filter_by(id=customer_id, role='customer').first_or_404()
     
-    # Get assigned files
-    assigned_files = db.session.query(File, FileAssignment)\
-        .join(FileAssignment, File.id == FileAssignment.file_id)\
-        .filter(FileAssignment.user_id == customer_id)\
-        .filter(FileAssignment.is_active == True)\
-        .all()
-    
-    # Get download history
-    downloads = DownloadLog.query.filter_by(user_id=customer_id)\
-        .order_by(desc(DownloadLog.download_date))\
-        .limit(20)\
-        .all()
-    
-    # Get login history
-    logins = LoginAttempt.query.filter_by(username=customer.username)\
-        .order_by(desc(LoginAttempt.timestamp))\
-        .limit(20)\
-        .all()
-    
     return render_template('admin/customer_detail.html',
                          customer=customer,
-                         assigned_files=assigned_files,
-                         downloads=downloads,
-                         logins=logins)
+                         assigned_files=get_customer_assignments(customer_id),
+                         downloads=get_recent_downloads(20, user_id=customer_id),
+                         logins=get_recent_logins(20, username=customer.username))
 
 
 @admin_bp.route('/customers/<int:customer_id>/edit', methods=['GET', 'POST'])
@@ -261,14 +230,13 @@ def upload_file():
         file = form.file.data
         
         # Save file
-        success, filename, filepath, error = save_uploaded_file(file, form.category.data)
+        success, stored, error = save_uploaded_file(file, form.category.data)
         
         if not success:
             flash(error, 'danger')
             return render_template('admin/file_upload.html', form=form)
         
-        # Get file size
-        file_size = get_file_size(filepath)
+        filename = stored.filename
         
         # Determine display name
         display_name = form.original_filename.data if form.original_filename.data else file.filename
@@ -277,8 +245,10 @@ def upload_file():
         file_record = File(
             filename=filename,
             original_filename=display_name,
-            file_path=filepath,
-            file_size=file_size,
+            file_path=stored.storage_key,
+            storage_backend=stored.storage_backend,
+            file_size=stored.size,
+            checksum=stored.checksum,
             file_type=filename.rsplit('.', 1)[1].lower() if '.' in filename else '',
             category=form.category.data,
             product_type=form.product_type.data,
@@ -287,8 +257,20 @@ def upload_file():
             uploaded_by_id=current_user.id
         )
         
-        db.session.add(file_record)
-        db.session.commit()
+        # Without PyMuPDF no preview is queued, so the file never sits in 'pending'
+        previewable = is_previewable(file_record) and previews_available()
+        if previewable:
+            file_record.preview_status = PREVIEW_PENDING
+        
+        with span('file.insert'):
+            db.session.add(file_record)
+            db.session.commit()
+        
+        # Verification and previews run on the job worker; the upload response does not wait
+        with span('jobs.enqueue'):
+            enqueue('verify_file', {'file_id': file_record.id}, dedupe_key=f"verify:{file_record.id}")
+            if previewable:
+                enqueue('generate_preview', {'file_id': file_record.id}, dedupe_key=f"preview:{file_record.id}")
         
         flash('File uploaded successfully!', 'success')
         return redirect(url_for('admin.files'))
@@ -343,13 +325,7 @@ def delete_file_record(file_id):
 def assignments():
     """View all file assignments"""
     page = request.args.get('page', 1, type=int)
-    
-    assignments = db.session.query(FileAssignment, User, File)\
-        .join(User, FileAssignment.user_id == User.id)\
-        .join(File, FileAssignment.file_id == File.id)\
-        .filter(FileAssignment.is_active == True)\
-        .order_by(desc(FileAssignment.assigned_date))\
-        .paginate(page=page, per_page=20, error_out=False)
+    assignments = get_assignment_page(page, per_page=20)
     
     return render_template('admin/assignments.html', assignments=assignments)
 
@@ -363,10 +339,8 @@ def create_assignment():
     form = FileAssignmentForm()
     
     # Populate choices
-    form.customer_id.choices = [(u.id, f"{u.username} - {u.company_name}") 
-                                 for u in User.query.filter_by(role='customer', is_active=True).all()]
-    form.file_id.choices = [(f.id, f"{f.original_filename} ({f.category})") 
-                            for f in File.query.filter_by(is_active=True).all()]
+    form.customer_id.choices = get_customer_choices()
+    form.file_id.choices = get_file_choices()
     
     if form.validate_on_submit():
         # Check if assignment already exists
@@ -391,12 +365,12 @@ def create_assignment():
         db.session.add(assignment)
         db.session.commit()
         
-        # Send notification email
+        # Queue notification email
         user = User.query.get(form.customer_id.data)
         file = File.query.get(form.file_id.data)
-        send_new_file_notification(user, file, current_user)
+        queue_new_file_notification(user, file, current_user)
         
-        flash('File assigned successfully! Notification email sent.', 'success')
+        flash('File assigned successfully! Notification email queued.', 'success')
         return redirect(url_for('admin.assignments'))
     
     return render_template('admin/assignment_create.html', form=form)
@@ -411,39 +385,43 @@ def bulk_assignment():
     form = BulkAssignmentForm()
     
     # Populate choices
-    form.file_id.choices = [(f.id, f"{f.original_filename} ({f.category})") 
-                            for f in File.query.filter_by(is_active=True).all()]
-    form.customer_ids.choices = [(u.id, f"{u.username} - {u.company_name}") 
-                                  for u in User.query.filter_by(role='customer', is_active=True).all()]
+    form.file_id.choices = get_file_choices()
+    form.customer_ids.choices = get_customer_choices()
     
     if form.validate_on_submit():
         file = File.query.get(form.file_id.data)
         assigned_count = 0
+        notify_users = []
         
-        for customer_id in form.customer_ids.data:
-            # Check if assignment already exists
-            existing = FileAssignment.query.filter_by(
-                user_id=customer_id,
-                file_id=form.file_id.data,
-                is_active=True
-            ).first()
-            
-            if not existing:
-                assignment = FileAssignment(
+        with span('assignments.create', **{'assignment.customers': len(form.customer_ids.data)}):
+            for customer_id in form.customer_ids.data:
+                # Check if assignment already exists
+                existing = FileAssignment.query.filter_by(
                     user_id=customer_id,
                     file_id=form.file_id.data,
-                    assigned_by_id=current_user.id,
-                    expiration_date=form.expiration_date.data
-                )
-                db.session.add(assignment)
-                assigned_count += 1
+                    is_active=True
+                ).first()
                 
-                # Send notification if requested
-                if form.send_notification.data:
-                    user = User.query.get(customer_id)
-                    send_new_file_notification(user, file, current_user)
+                if not existing:
+                    assignment = FileAssignment(
+                        user_id=customer_id,
+                        file_id=form.file_id.data,
+                        assigned_by_id=current_user.id,
+                        expiration_date=form.expiration_date.data
+                    )
+                    db.session.add(assignment)
+                    assigned_count += 1
+                    
+                    # Send notification if requested
+                    if form.send_notification.data:
+                        notify_users.append(User.query.get(customer_id))
+            
+            db.session.commit()
         
-        db.session.commit()
+        # Queued once the assignments are committed
+        with span('notifications.enqueue', **{'notification.count': len(notify_users)}):
+            for user in notify_users:
+                queue_new_file_notification(user, file, current_user)
         
         flash(f'File assigned to {assigned_count} customer(s) successfully!', 'success')
         return redirect(url_for('admin.assignments'))
@@ -468,23 +446,14 @@ def revoke_assignment(assignment_id):
 @admin_bp.route('/activity')
 @login_required
 @admin_required
+@read_from_replica
 def activity():
     """View download activity logs"""
     page = request.args.get('page', 1, type=int)
     user_id = request.args.get('user_id', type=int)
     file_id = request.args.get('file_id', type=int)
     
-    query = DownloadLog.query
-    
-    if user_id:
-        query = query.filter_by(user_id=user_id)
-    
-    if file_id:
-        query = query.filter_by(file_id=file_id)
-    
-    logs = query.order_by(desc(DownloadLog.download_date)).paginate(
-        page=page, per_page=50, error_out=False
-    )
+    logs = get_download_page(page, per_page=50, user_id=user_id, file_id=file_id)
     
     return render_template('admin/activity.html', logs=logs)
 
@@ -492,6 +461,7 @@ def activity():
 @admin_bp.route('/audit')
 @login_required
 @admin_required
+@read_from_replica
 def audit():
     """View security audit logs"""
     page = request.args.get('page', 1, type=int)
@@ -507,3 +477,256 @@ def audit():
     )
     
     return render_template('admin/audit.html', logs=logs, username=username)
+
+
+@admin_bp.route('/integrity')
+@login_required
+@admin_required
+@read_from_replica
+def integrity():
+    """View integrity scrub results for stored files"""
+    page = request.args.get('page', 1, type=int)
+    status = request.args.get('status', '')
+    
+    # Latest verdict per active file
+    status_counts = db.session.query(
+        File.integrity_status,
+        func.count(File.id)
+    ).filter(File.is_active == True)\
+     .group_by(File.integrity_status)\
+     .all()
+    status_counts = {s or 'unchecked': count for s, count in status_counts}
+    
+    # Files whose latest verdict is not OK
+    problem_files = File.query.filter_by(is_active=True)\
+        .filter(File.integrity_status.in_(FileIntegrityCheck.FAILED_STATUSES + (FileIntegrityCheck.STATUS_ERROR,)))\
+        .order_by(desc(File.integrity_checked_at))\
+        .all()
+    
+    # Check history; the file is loaded in the same query instead of once per row
+    query = FileIntegrityCheck.query.options(joinedload(FileIntegrityCheck.file))
+    
+    if status:
+        query = query.filter_by(status=status)
+    
+    checks = query.order_by(desc(FileIntegrityCheck.checked_at)).paginate(
+        page=page, per_page=50, error_out=False
+    )
+    
+    return render_template('admin/integrity.html',
+                         status_counts=status_counts,
+                         problem_files=problem_files,
+                         checks=checks,
+                         status=status)
+
+
+@admin_bp.route('/integrity/run', methods=['POST'])
+@login_required
+@admin_required
+@audit_log('run_integrity_scrub')
+def run_integrity_scrub():
+    """Start a background integrity scrub of all active files"""
+    enqueue('scrub_files', dedupe_key='scrub_files')
+    
+    flash('Integrity scrub queued. Results will appear as files are checked.', 'info')
+    return redirect(url_for('admin.integrity'))
+
+
+@admin_bp.route('/storage')
+@login_required
+@admin_required
+@read_from_replica
+def storage():
+    """View storage tier placement and hit ratios"""
+    stats = get_tier_stats()
+    
+    # Cold files that are still being downloaded (promotion candidates)
+    since = datetime.utcnow() - current_app.config['TIER_WINDOW']
+    cold_files = get_popular_cold_files(since, limit=50)
+    
+    return render_template('admin/storage.html',
+                         stats=stats,
+                         cold_files=cold_files,
+                         format_file_size=format_file_size)
+
+
+@admin_bp.route('/storage/tiering/run', methods=['POST'])
+@login_required
+@admin_required
+@audit_log('run_storage_tiering')
+def run_storage_tiering():
+    """Start a background tiering pass"""
+    enqueue('tier_files', dedupe_key='tier_files')
+    
+    flash('Storage tiering queued. Cold files will be moved in the background.', 'info')
+    return redirect(url_for('admin.storage'))
+
+
+@admin_bp.route('/jobs')
+@login_required
+@admin_required
+def jobs():
+    """View background job queue depth, latency and failures"""
+    since = datetime.utcnow() - timedelta(hours=24)
+    stats = get_queue_stats(since)
+    
+    failed_jobs = Job.query.filter_by(status=Job.STATUS_FAILED)\
+        .order_by(desc(Job.finished_at))\
+        .limit(50)\
+        .all()
+    recent_jobs = Job.query.order_by(desc(Job.created_at)).limit(50).all()
+    
+    return render_template('admin/jobs.html',
+                         stats=stats,
+                         failed_jobs=failed_jobs,
+                         recent_jobs=recent_jobs)
+
+
+@admin_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+@admin_required
+@audit_log('retry_job')
+def retry_failed_job(job_id):
+    """Put a failed job back in the queue"""
+    if retry_job(job_id):
+        flash(f'Job {job_id} queued for retry.', 'success')
+    else:
+        flash(f'Job {job_id} is not in a failed state.', 'warning')
+    
+    return redirect(url_for('admin.jobs'))
+
+
+@admin_bp.route('/database')
+@login_required
+@admin_required
+def database():
+    """View database binds, pool usage and per-bind statement latency"""
+    latency = get_latency_stats()
+    
+    binds = []
+    for key, engine in db.engines.items():
+        name = key or 'primary'
+        binds.append({
+            'name': name,
+            'url': engine.url.render_as_string(hide_password=True),
+            'dialect': engine.dialect.name,
+            'pool': engine.pool.status(),
+            'latency': latency.get(name, {}),
+        })
+    
+    return render_template('admin/database.html',
+                         binds=binds,
+                         replica_enabled=REPLICA_BIND in db.engines)
+
+
+@admin_bp.route('/slow-queries')
+@login_required
+@admin_required
+@read_from_replica
+def slow_queries():
+    """Slow SQL statements grouped by fingerprint, with their latest query plan"""
+    return render_template('admin/slow_queries.html',
+                         groups=get_slow_query_summary(),
+                         threshold_ms=current_app.config['SLOW_QUERY_THRESHOLD_MS'],
+                         enabled=current_app.config['SLOW_QUERY_ENABLED'])
+
+
+@admin_bp.route('/profiles')
+@login_required
+@admin_required
+def profiles():
+    """List captured request profiles and armed profiler triggers"""
+    form = ProfileTriggerForm()
+    form.customer_id.choices = [(u.id, f"{u.username} - {u.company_name}")
+                                for u in User.query.filter_by(role='customer').order_by(User.username).all()]
+    
+    captures = Profile.query.order_by(desc(Profile.created_at)).limit(100).all()
+    triggers = ProfileTrigger.query.filter(ProfileTrigger.remaining > 0,
+                                           ProfileTrigger.expires_at > datetime.utcnow())\
+        .order_by(desc(ProfileTrigger.created_at))\
+        .all()
+    
+    return render_template('admin/profiles.html',
+                         form=form,
+                         captures=captures,
+                         triggers=triggers,
+                         profile_param=PROFILE_PARAM)
+
+
+@admin_bp.route('/profiles/triggers', methods=['POST'])
+@login_required
+@admin_required
+@audit_log('arm_profiler')
+def arm_profiler():
+    """Profile a customer's next requests"""
+    form = ProfileTriggerForm()
+    form.customer_id.choices = [(u.id, u.username) for u in User.query.filter_by(role='customer').all()]
+    
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'danger')
+        return redirect(url_for('admin.profiles'))
+    
+    endpoint = (form.endpoint.data or '').strip() or None
+    if endpoint and endpoint not in current_app.view_functions:
+        flash(f'Unknown endpoint: {endpoint}', 'danger')
+        return redirect(url_for('admin.profiles'))
+    
+    trigger = ProfileTrigger(
+        user_id=form.customer_id.data,
+        endpoint=endpoint,
+        mode=form.mode.data,
+        remaining=form.count.data,
+        created_by_id=current_user.id,
+        expires_at=datetime.utcnow() + timedelta(hours=current_app.config['PROFILE_TRIGGER_TTL_HOURS'])
+    )
+    db.session.add(trigger)
+    db.session.commit()
+    refresh_triggers(current_app)
+    
+    flash(f'Profiler armed for the next {trigger.remaining} matching request(s).', 'success')
+    return redirect(url_for('admin.profiles'))
+
+
+@admin_bp.route('/profiles/triggers/<int:trigger_id>/cancel', methods=['POST'])
+@login_required
+@admin_required
+@audit_log('cancel_profiler')
+def cancel_profiler(trigger_id):
+    """Disarm a profiler trigger"""
+    trigger = ProfileTrigger.query.get_or_404(trigger_id)
+    trigger.remaining = 0
+    db.session.commit()
+    refresh_triggers(current_app)
+    
+    flash('Profiler trigger cancelled.', 'info')
+    return redirect(url_for('admin.profiles'))
+
+
+@admin_bp.route('/profiles/<int:profile_id>/<fmt>')
+@login_required
+@admin_required
+def download_profile(profile_id, fmt):
+    """Download a capture as speedscope JSON, collapsed stacks, SQL timings or a memory report"""
+    profile = Profile.query.get_or_404(profile_id)
+    try:
+        capture = load_capture(profile)
+    except OSError:
+        abort(404)
+    
+    name = f"{profile.method} {profile.path}"
+    if fmt == 'speedscope.json' and profile.mode == Profile.MODE_CPU:
+        body, mimetype = jsonify(to_speedscope(capture, name)).get_data(), 'application/json'
+    elif fmt == 'collapsed.txt' and profile.mode == Profile.MODE_CPU:
+        body, mimetype = to_collapsed(capture), 'text/plain'
+    elif fmt == 'memory.txt' and profile.mode == Profile.MODE_MEMORY:
+        body, mimetype = to_memory_report(capture), 'text/plain'
+    elif fmt == 'sql.json':
+        body, mimetype = jsonify(capture['sql']).get_data(), 'application/json'
+    else:
+        abort(404)
+    
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="profile-{profile.id}.{fmt}"'
+    })
@@ -0,0 +1,6 @@
+"""JSON API blueprint initialization"""
+from flask import Blueprint
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+from api import routes
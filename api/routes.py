@@ -0,0 +1,198 @@
+"""Files API for customers syncing their manuals - cursor-paginated JSON under /api/v1"""
+import base64
+import json
+import time
+from datetime import datetime
+from functools import wraps
+from flask import jsonify, request, redirect, url_for, current_app
+from flask_login import current_user
+from flask_limiter.util import get_remote_address
+from sqlalchemy import and_, or_, desc
+from api import api_bp
+from customer.queries import entitled_files_query
+from models import limiter
+from models.file import File
+
+
+def _timestamp(value):
+    """Naive UTC datetimes as ISO 8601 with a Z suffix"""
+    return value.isoformat() + 'Z' if value else None
+
+
+# Everything a file can expose, by field name; ?fields= picks a subset
+FILE_FIELDS = {
+    'id': lambda file, assignment: file.id,
+    'filename': lambda file, assignment: file.original_filename,
+    'file_type': lambda file, assignment: file.file_type,
+    'size': lambda file, assignment: file.file_size,
+    'sha256': lambda file, assignment: file.checksum,
+    'category': lambda file, assignment: file.category,
+    'product_type': lambda file, assignment: file.product_type,
+    'version': lambda file, assignment: file.version,
+    'description': lambda file, assignment: file.description,
+    'page_count': lambda file, assignment: file.page_count,
+    'uploaded_at': lambda file, assignment: _timestamp(file.upload_date),
+    'updated_at': lambda file, assignment: _timestamp(file.updated_at),
+    'assigned_at': lambda file, assignment: _timestamp(assignment.assigned_date),
+    'expires_at': lambda file, assignment: _timestamp(assignment.expiration_date),
+    'download_url': lambda file, assignment: url_for('api.download_file', file_id=file.id, _external=True),
+}
+
+
+def api_error(status, code, message):
+    """JSON error body: {"error": {"code": ..., "message": ...}}"""
+    return jsonify({'error': {'code': code, 'message': message}}), status
+
+
+def api_customer_required(f):
+    """Like login_required plus customer_required and the terms check, answering in JSON"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return api_error(401, 'unauthorized', 'Log in to use the API.')
+        if current_user.is_admin():
+            return api_error(403, 'forbidden', 'The files API is for customer accounts.')
+        if not current_user.terms_accepted:
+            return api_error(403, 'terms_not_accepted', 'Accept the terms of service in the portal first.')
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+def rate_limit():
+    return current_app.config['API_RATE_LIMIT']
+
+
+def rate_limit_key():
+    """Count signed-in customers per account, whatever address they sync from"""
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    return get_remote_address()
+
+
+def encode_cursor(file):
+    """Opaque position after `file` in (upload_date, id) descending order"""
+    position = json.dumps([file.upload_date.isoformat(), file.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(position).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(upload_date, id) from encode_cursor, or None when it is not one"""
+    try:
+        position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        upload_date, file_id = json.loads(position)
+        upload_date, file_id = datetime.fromisoformat(upload_date), int(file_id)
+    except (ValueError, TypeError, OverflowError):
+        return None
+    # Ids are BIGINT-sized at most; anything larger would fail when bound in SQL
+    if not 0 <= file_id < 2 ** 63:
+        return None
+    return upload_date, file_id
+
+
+def requested_fields():
+    """Fields named by ?fields=a,b (all by default), or None when one is unknown"""
+    fields = request.args.get('fields')
+    if not fields:
+        return list(FILE_FIELDS)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    if not fields or any(field not in FILE_FIELDS for field in fields):
+        return None
+    return fields
+
+
+def invalid_fields():
+    return api_error(400, 'invalid_fields', f"fields must be a comma-separated subset of: {', '.join(FILE_FIELDS)}")
+
+
+def serialize_file(file, assignment, fields):
+    return {field: FILE_FIELDS[field](file, assignment) for field in fields}
+
+
+@api_bp.errorhandler(429)
+def rate_limited(error):
+    response, status = api_error(429, 'rate_limited', f"Rate limit exceeded ({error.description}).")
+    if limiter.current_limit is not None:
+        response.headers['Retry-After'] = str(max(1, int(limiter.current_limit.reset_at - time.time())))
+    return response, status
+
+
+@api_bp.route('/files')
+@limiter.limit(rate_limit, key_func=rate_limit_key)
+@api_customer_required
+def list_files():
+    """
+    Files the customer is entitled to, newest upload first
+
+    Query parameters: limit (page size), cursor (next_cursor of the previous
+    page), fields (comma-separated), search and category (as on the files page).
+    """
+    fields = requested_fields()
+    if fields is None:
+        return invalid_fields()
+
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+    query = entitled_files_query(current_user.id, request.args.get('search', ''), request.args.get('category', ''))
+
+    # Keyset pagination: each page starts after the last row of the previous one,
+    # so it costs the same at any depth and uploads in between never shift it
+    cursor = request.args.get('cursor')
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            return api_error(400, 'invalid_cursor', 'cursor must be a next_cursor value from this API.')
+        upload_date, file_id = position
+        query = query.filter(or_(File.upload_date < upload_date,
+                                 and_(File.upload_date == upload_date, File.id < file_id)))
+
+    # One row more than the page shows whether another page follows
+    rows = query.order_by(desc(File.upload_date), desc(File.id)).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = encode_cursor(rows[-1][0]) if has_more else None
+    next_url = None
+    if next_cursor:
+        next_url = url_for('api.list_files', _external=True, **{**request.args.to_dict(), 'cursor': next_cursor})
+
+    return jsonify({
+        'data': [serialize_file(file, assignment, fields) for file, assignment in rows],
+        'next_cursor': next_cursor,
+        'next': next_url,
+    })
+
+
+@api_bp.route('/files/<int:file_id>')
+@limiter.limit(rate_limit, key_func=rate_limit_key)
+@api_customer_required
+def get_file(file_id):
+    """One entitled file"""
+    fields = requested_fields()
+    if fields is None:
+        return invalid_fields()
+
+    row = entitled_files_query(current_user.id).filter(File.id == file_id).first()
+    if row is None:
+        return api_error(404, 'not_found', 'No such file, or it is not assigned to you.')
+
+    return jsonify({'data': serialize_file(*row, fields)})
+
+
+@api_bp.route('/files/<int:file_id>/download')
+@limiter.limit(rate_limit, key_func=rate_limit_key)
+@api_customer_required
+def download_file(file_id):
+    """
+    Redirect to a freshly signed secure download link
+
+    download_url points here rather than at a signed link, so listings stay
+    cacheable (and their ETags stable) while download links never go stale.
+    """
+    row = entitled_files_query(current_user.id).filter(File.id == file_id).first()
+    if row is None:
+        return api_error(404, 'not_found', 'No such file, or it is not assigned to you.')
+
+    file = row[0]
+    return redirect(url_for('customer.secure_download', token=file.get_download_token(current_user.id)))
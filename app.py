@@ -3,8 +3,16 @@ import os
 from flask import Flask, render_template, redirect, url_for
 from flask_login import current_user
 from config import config
-from models import db, login_manager, mail, migrate, limiter
+from models import db, login_manager, mail, limiter
 from models.user import User
+from utils.database import init_engine_options, configure_engine
+from utils.metrics import init_metrics
+from utils.profiler import init_profiler
+from utils.tracing import init_tracing
+from utils.slow_queries import init_slow_query_log
+from utils.assets import init_assets
+from utils.fragments import init_fragment_cache
+from utils.compression import init_compression
 
 
 def create_app(config_name='default'):
@@ -15,12 +23,19 @@ def create_app(config_name='default'):
     app.config.from_object(config[config_name])
     
     # Initialize extensions
+    init_engine_options(app)
     db.init_app(app)
+    configure_engine(app, db)
     login_manager.init_app(app)
     mail.init_app(app)
-    migrate.init_app(app, db)
     limiter.init_app(app)
     
+    # Flask-Migrate pulls in alembic, the largest import in the app, and only
+    # serves the `flask db` commands: register it for the flask CLI alone
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    
     # Configure Flask-Login
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
@@ -34,10 +49,34 @@ def create_app(config_name='default'):
     from auth import auth_bp
     from admin import admin_bp
     from customer import customer_bp
+    from api import api_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(customer_bp)
+    app.register_blueprint(api_bp)
+    
+    # Prometheus metrics and /metrics endpoint
+    init_metrics(app)
+    
+    # On-demand request profiler for admins
+    init_profiler(app)
+    
+    # Request tracing spans
+    init_tracing(app)
+    
+    # Slow-query log with query plans
+    init_slow_query_log(app)
+    
+    # Fingerprinted, precompressed static assets
+    init_assets(app)
+    
+    # Jinja bytecode cache and {% cache %} fragments
+    init_fragment_cache(app)
+    
+    # Compressed pages and JSON, weak ETags and 304s; after_request hooks run in
+    # reverse order, so metrics, profiles and traces include the compression time
+    init_compression(app)
     
     # Root route
     @app.route('/')
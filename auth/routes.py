@@ -1,5 +1,5 @@
 """Authentication routes"""
-from flask import render_template, redirect, url_for, flash, request, session
+from flask import render_template, redirect, url_for, flash, request, session, abort, make_response
 from flask_login import login_user, logout_user, current_user, login_required
 from datetime import datetime
 from auth import auth_bp
@@ -8,15 +8,14 @@ from auth.forms import (LoginForm, PasswordResetRequestForm, PasswordResetForm,
 from auth.utils import (validate_password_strength, generate_password_reset_token,
                         verify_password_reset_token, generate_mfa_secret,
                         generate_mfa_qr_uri, verify_mfa_token, get_client_ip,
-                        get_user_agent, verify_activation_token)
+                        get_user_agent, verify_activation_token, mfa_qr_digest,
+                        render_mfa_qr, discard_mfa_qr, MFA_QR_CONTENT_TYPES)
 from models import db
 from models.user import User
 from models.login_attempt import LoginAttempt
 from utils.email_service import send_email
+from utils.log_ingest import record_log
 from flask import current_app
-import qrcode
-import io
-import base64
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
@@ -41,14 +40,14 @@ def login():
         
         # Check if user exists
         if not user:
-            log_attempt = LoginAttempt(
+            record_log(
+                LoginAttempt,
                 username=username,
                 ip_address=ip_address,
                 user_agent=user_agent,
                 success=False,
                 failure_reason='Invalid username'
             )
-            db.session.add(log_attempt)
             db.session.commit()
             
             flash('Invalid username or password', 'danger')
@@ -56,14 +55,14 @@ def login():
         
         # Check if account is locked
         if user.is_account_locked():
-            log_attempt = LoginAttempt(
+            record_log(
+                LoginAttempt,
                 username=username,
                 ip_address=ip_address,
                 user_agent=user_agent,
                 success=False,
                 failure_reason='Account locked'
             )
-            db.session.add(log_attempt)
             db.session.commit()
             
             flash('Account is locked due to too many failed login attempts. Please try again later or contact support.', 'danger')
@@ -71,14 +70,14 @@ def login():
         
         # Check if account is active
         if not user.is_active:
-            log_attempt = LoginAttempt(
+            record_log(
+                LoginAttempt,
                 username=username,
                 ip_address=ip_address,
                 user_agent=user_agent,
                 success=False,
                 failure_reason='Account inactive'
             )
-            db.session.add(log_attempt)
             db.session.commit()
             
             flash('Account is inactive. Please contact support.', 'danger')
@@ -88,14 +87,14 @@ def login():
         if not user.check_password(password):
             user.increment_failed_login()
             
-            log_attempt = LoginAttempt(
+            record_log(
+                LoginAttempt,
                 username=username,
                 ip_address=ip_address,
                 user_agent=user_agent,
                 success=False,
                 failure_reason='Invalid password'
             )
-            db.session.add(log_attempt)
             db.session.commit()
             
             # Check if we should lock the account
@@ -119,13 +118,13 @@ def login():
             return redirect(url_for('auth.verify_mfa'))
         
         # Log successful login
-        log_attempt = LoginAttempt(
+        record_log(
+            LoginAttempt,
             username=username,
             ip_address=ip_address,
             user_agent=user_agent,
             success=True
         )
-        db.session.add(log_attempt)
         
         # Update last login
         user.last_login = datetime.utcnow()
@@ -191,7 +190,7 @@ def activate_account(token):
         flash('Account activated successfully! You can now log in.', 'success')
         return redirect(url_for('auth.login'))
     
-    return render_template('auth/activate.html', form=form, user=user)
+    return render_template('auth/set_password.html', form=form, user=user)
 
 
 @auth_bp.route('/forgot-password', methods=['GET', 'POST'])
@@ -272,14 +271,10 @@ def setup_mfa():
     
     mfa_secret = session['mfa_secret']
     
-    # Generate QR code
+    # The QR code is a separate, cacheable image; failed attempts don't re-render it
     qr_uri = generate_mfa_qr_uri(current_user.username, mfa_secret)
-    qr = qrcode.make(qr_uri)
-    
-    # Convert QR code to base64 for display
-    buffer = io.BytesIO()
-    qr.save(buffer, format='PNG')
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode()
+    image_format = current_app.config['MFA_QR_FORMAT']
+    qr_url = url_for('auth.setup_mfa_qr', digest=mfa_qr_digest(qr_uri, image_format))
     
     if form.validate_on_submit():
         if verify_mfa_token(mfa_secret, form.token.data):
@@ -289,6 +284,7 @@ def setup_mfa():
             
             # Clear session
             session.pop('mfa_secret', None)
+            discard_mfa_qr(qr_uri, image_format)
             
             flash('MFA enabled successfully!', 'success')
             return redirect(url_for('customer.dashboard'))
@@ -296,7 +292,29 @@ def setup_mfa():
             flash('Invalid verification code. Please try again.', 'danger')
     
     return render_template('auth/setup_mfa.html', form=form, 
-                         qr_code=qr_base64, secret=mfa_secret)
+                         qr_url=qr_url, secret=mfa_secret)
+
+
+@auth_bp.route('/setup-mfa/qr/<digest>')
+@login_required
+def setup_mfa_qr(digest):
+    """QR code image for the pending MFA secret; its URL changes with the secret"""
+    mfa_secret = session.get('mfa_secret')
+    if current_user.mfa_enabled or not mfa_secret:
+        abort(404)
+    
+    qr_uri = generate_mfa_qr_uri(current_user.username, mfa_secret)
+    image_format = current_app.config['MFA_QR_FORMAT']
+    if digest != mfa_qr_digest(qr_uri, image_format):
+        abort(404)
+    
+    response = make_response(render_mfa_qr(qr_uri, image_format))
+    response.content_type = MFA_QR_CONTENT_TYPES[image_format]
+    # The image encodes the secret: browsers may keep it, shared caches may not
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    response.set_etag(digest)
+    return response.make_conditional(request)
 
 
 @auth_bp.route('/verify-mfa', methods=['GET', 'POST'])
@@ -320,13 +338,13 @@ def verify_mfa():
     if form.validate_on_submit():
         if verify_mfa_token(user.mfa_secret, form.token.data):
             # Log successful login
-            log_attempt = LoginAttempt(
+            record_log(
+                LoginAttempt,
                 username=user.username,
                 ip_address=get_client_ip(),
                 user_agent=get_user_agent(),
                 success=True
             )
-            db.session.add(log_attempt)
             
             # Update last login
             user.last_login = datetime.utcnow()
@@ -1,11 +1,21 @@
 """Authentication utilities for password validation, token generation, and security"""
+import hashlib
 import re
-import jwt
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from flask import current_app, request
-import pyotp
 import secrets
 
+# jwt, pyotp and qrcode are imported where they are used: most requests need
+# none of them, and leaving them out of the module import shortens worker start-up
+
+MFA_QR_CONTENT_TYPES = {'svg': 'image/svg+xml', 'png': 'image/png'}
+
+_qr_cache = OrderedDict()  # digest -> (expires at, image bytes), least recently used first
+_qr_cache_lock = threading.Lock()
+
 
 def validate_password_strength(password):
     """
@@ -38,6 +48,8 @@ def validate_password_strength(password):
 
 def generate_password_reset_token(user_id):
     """Generate a secure token for password reset"""
+    import jwt
+
     expiration = datetime.utcnow() + current_app.config['PASSWORD_RESET_EXPIRATION']
     
     payload = {
@@ -58,6 +70,8 @@ def generate_password_reset_token(user_id):
 
 def verify_password_reset_token(token):
     """Verify and decode a password reset token"""
+    import jwt
+
     try:
         payload = jwt.decode(
             token,
@@ -77,11 +91,15 @@ def verify_password_reset_token(token):
 
 def generate_mfa_secret():
     """Generate a new MFA secret for TOTP"""
+    import pyotp
+
     return pyotp.random_base32()
 
 
 def generate_mfa_qr_uri(username, secret):
     """Generate a QR code URI for MFA setup"""
+    import pyotp
+
     company_name = current_app.config['COMPANY_NAME']
     totp = pyotp.TOTP(secret)
     return totp.provisioning_uri(
@@ -90,8 +108,91 @@ def generate_mfa_qr_uri(username, secret):
     )
 
 
+def mfa_qr_digest(uri, image_format):
+    """Cache key for one provisioning URI's QR image; also part of the image URL"""
+    return hashlib.sha256(f"{image_format}:{uri}".encode()).hexdigest()[:32]
+
+
+def render_mfa_qr(uri, image_format):
+    """
+    QR image bytes for a provisioning URI, rendered once per process
+
+    Images are kept in an LRU cache of MFA_QR_CACHE_SIZE entries for at
+    most MFA_QR_CACHE_TTL_SECONDS. SVG needs only qrcode; PNG also needs Pillow.
+    """
+    from utils.metrics import record_cache
+
+    key = mfa_qr_digest(uri, image_format)
+    now = time.monotonic()
+    with _qr_cache_lock:
+        entry = _qr_cache.get(key)
+        if entry is not None and entry[0] < now:
+            del _qr_cache[key]
+            entry = None
+        if entry is not None:
+            _qr_cache.move_to_end(key)
+    record_cache('mfa_qr', entry is not None)
+    if entry is not None:
+        return entry[1]
+
+    image = _qr_svg(uri) if image_format == 'svg' else _qr_png(uri)
+    with _qr_cache_lock:
+        _qr_cache[key] = (now + current_app.config['MFA_QR_CACHE_TTL_SECONDS'], image)
+        while len(_qr_cache) > current_app.config['MFA_QR_CACHE_SIZE']:
+            _qr_cache.popitem(last=False)
+    return image
+
+
+def discard_mfa_qr(uri, image_format):
+    """
+    Drop a QR image from this process's cache once its secret is enabled
+
+    Other processes that served the image still hold it until it expires,
+    so MFA_QR_CACHE_TTL_SECONDS bounds how long the secret stays in memory.
+    """
+    with _qr_cache_lock:
+        _qr_cache.pop(mfa_qr_digest(uri, image_format), None)
+
+
+def _qr_svg(uri):
+    """Compact SVG: one path with a rectangle per horizontal run of dark modules"""
+    import qrcode
+
+    qr = qrcode.QRCode(border=4)
+    qr.add_data(uri)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            runs.append(f"M{start} {y}h{x - start}v1H{start}z")
+
+    size = len(matrix)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+            f'<rect width="{size}" height="{size}" fill="#fff"/><path d="{"".join(runs)}"/></svg>').encode()
+
+
+def _qr_png(uri):
+    import io
+    import qrcode
+
+    buffer = io.BytesIO()
+    qrcode.make(uri).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
 def verify_mfa_token(secret, token):
     """Verify a TOTP token"""
+    import pyotp
+
     totp = pyotp.TOTP(secret)
     # Allow 1 period before and after for clock skew
     return totp.verify(token, valid_window=1)
@@ -115,6 +216,8 @@ def get_user_agent():
 
 def generate_activation_token(user_id):
     """Generate a secure token for account activation"""
+    import jwt
+
     expiration = datetime.utcnow() + timedelta(days=7)  # 7 days to activate
     
     payload = {
@@ -135,6 +238,8 @@ def generate_activation_token(user_id):
 
 def verify_activation_token(token):
     """Verify and decode an account activation token"""
+    import jwt
+
     try:
         payload = jwt.decode(
             token,
@@ -0,0 +1,73 @@
+"""Admin page benchmark - per-request latency, SQL statements and peak memory for the admin list views"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+from app import create_app
+from config import config
+from models import db
+from check_query_budgets import QueryBudgetConfig, seed, ADMIN_PASSWORD
+
+
+PAGES = ['/admin/dashboard', '/admin/activity', '/admin/assignments', '/admin/customers/{customer}']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the admin list views against a seeded in-memory database.')
+    parser.add_argument('--rows', type=int, default=200, help='Seeded customers, files, logs and jobs')
+    parser.add_argument('--requests', type=int, default=50, help='Timed requests per page')
+    args = parser.parse_args()
+
+    config['query_budget'] = QueryBudgetConfig
+    app = create_app('query_budget')
+    statements = []
+
+    with app.app_context():
+        db.create_all()
+        ids = seed(args.rows)
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', lambda *a: statements.append(1))
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+
+    print(f"{args.rows} seeded rows, {args.requests} requests per page\n")
+    print(f"{'page':<28} {'status':>6} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8} {'peak KiB':>9}")
+
+    for page in PAGES:
+        url = page.format(customer=ids['customer'])
+        client.get(url).close()  # Warm up templates and statement caches
+
+        del statements[:]
+        response = client.get(url)
+        response.close()
+        queries = len(statements)
+
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            client.get(url).close()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        tracemalloc.start()
+        client.get(url).close()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{page:<28} {response.status_code:>6} {queries:>8} {statistics.median(timings):>8.2f} "
+              f"{p95:>8.2f} {peak / 1024:>9.1f}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Micro-benchmarks for per-request hot paths and worker start-up - tokens, MFA, passwords, filenames, templates and compression"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bcrypt
+import pyotp
+from flask import template_rendered
+from flask_login import login_user
+from app import create_app
+from config import config
+from models import db
+from models.user import User
+from models.file import File
+from auth.utils import verify_mfa_token, validate_password_strength, get_client_ip
+from utils.file_handler import generate_unique_filename, allowed_file
+from utils.compression import available_encodings, compress
+from check_query_budgets import QueryBudgetConfig, seed, ADMIN_PASSWORD, CUSTOMER_PASSWORD
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY = os.path.join(ROOT, 'benchmark_history.jsonl')
+DEFAULT_THRESHOLDS = os.path.join(ROOT, 'benchmark_thresholds.json')
+
+# Pages whose templates are rendered on their own, with the context their view produced
+RENDERED_PAGES = [
+    ('anonymous', '/auth/login'),
+    ('customer', '/customer/dashboard'),
+    ('customer', '/customer/files'),
+    ('admin', '/admin/dashboard'),
+    ('admin', '/admin/activity'),
+]
+
+# Pages compressed at each level, to weigh the CPU per request against the bytes saved
+COMPRESSED_PAGES = [
+    ('customer', '/customer/files'),
+    ('admin', '/admin/customers'),
+    ('admin', '/admin/files'),
+]
+COMPRESSION_LEVELS = {'gzip': (1, 6, 9), 'br': (1, 4, 11)}
+
+# Run in a fresh interpreter per sample: what a newly spawned worker pays before its first request
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app('production')
+print(imported - start, time.perf_counter() - imported)
+"""
+STARTUP_BENCHMARKS = ('startup.import', 'startup.create_app')
+
+
+class BenchmarkConfig(QueryBudgetConfig):
+    """Seeded in-memory database with the background features off"""
+    METRICS_ENABLED = False
+
+
+def logged_in_client(app, role):
+    client = app.test_client()
+    if role != 'anonymous':
+        client.post('/auth/login', data={'username': role,
+                                         'password': ADMIN_PASSWORD if role == 'admin' else CUSTOMER_PASSWORD})
+    return client
+
+
+def capture_templates(app, role, path):
+    """Request a page once and return the (template, context) pairs it rendered"""
+    client = logged_in_client(app, role)
+    rendered = []
+
+    def record(sender, template, context, **extra):
+        rendered.append((template, dict(context)))
+
+    with template_rendered.connected_to(record, app):
+        response = client.get(path)
+        response.close()
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} returned HTTP {response.status_code}")
+    return rendered
+
+
+def build_benchmarks(app, ids):
+    """{name: zero-argument callable, or (request context, callable) for the request-bound ones}"""
+    benchmarks = {}
+
+    file = db.session.get(File, ids['file'])
+    token = file.get_download_token(ids['customer'])
+    benchmarks['token.sign'] = lambda: file.get_download_token(ids['customer'])
+    benchmarks['token.verify'] = lambda: File.verify_download_token(token)
+
+    secret = pyotp.random_base32()
+    code = pyotp.TOTP(secret).now()
+    benchmarks['mfa.verify'] = lambda: verify_mfa_token(secret, code)
+
+    benchmarks['password.strength'] = lambda: validate_password_strength('Corr3ct-Horse-Battery!')
+    benchmarks['filename.unique'] = lambda: generate_unique_filename('Pump Model X Service Manual (Rev C).pdf')
+    benchmarks['filename.allowed'] = lambda: allowed_file('Pump Model X Service Manual (Rev C).pdf')
+
+    request_context = app.test_request_context('/', headers={'X-Forwarded-For': '203.0.113.7, 10.0.0.1'})
+    benchmarks['request.client_ip'] = (request_context, get_client_ip)
+
+    # Password checks at several bcrypt costs: production cost is bcrypt's default (12)
+    for rounds in (4, 10, 12):
+        user = User(username=f'bench{rounds}')
+        user.password_hash = bcrypt.hashpw(b'Customer@123', bcrypt.gensalt(rounds)).decode()
+        benchmarks[f'password.check.cost{rounds}'] = (lambda user=user: user.check_password('Customer@123'))
+
+    return benchmarks
+
+
+def build_render_benchmarks(app, ids):
+    """
+    One benchmark per page template, rendered with the context its view produced
+
+    Runs outside any app context of ours, so each captured request gets a fresh session and g.
+    """
+    benchmarks = {}
+    for role, path in RENDERED_PAGES:
+        for template, context in capture_templates(app, role, path):
+            if template.name == 'base.html':
+                continue
+            context_manager = app.test_request_context(path)
+            name = f"render.{template.name.removesuffix('.html').replace('/', '.')}"
+
+            def render(template=template, context=context):
+                return template.render(context)
+
+            benchmarks[name] = (context_manager, render, ids.get(role))
+
+    return benchmarks
+
+
+def build_compression_benchmarks(app):
+    """
+    One benchmark per page, encoding and level, compressing the page's uncompressed HTML
+
+    Also returns each benchmark's (original, compressed) size for the bytes-saved report.
+    """
+    benchmarks, sizes = {}, {}
+    for role, path in COMPRESSED_PAGES:
+        client = logged_in_client(app, role)
+        client.get(path).close()  # Consumes the login flash message
+        response = client.get(path, headers={'Accept-Encoding': 'identity'})
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned HTTP {response.status_code}")
+        page = response.get_data()
+
+        for encoding in available_encodings():
+            for level in COMPRESSION_LEVELS[encoding]:
+                name = f"compress.{path.strip('/').replace('/', '.')}.{encoding}{level}"
+                benchmarks[name] = (lambda page=page, encoding=encoding, level=level: compress(page, encoding, level))
+                sizes[name] = (len(page), len(compress(page, encoding, level)))
+
+    return benchmarks, sizes
+
+
+def measure(function, repeat, min_time):
+    """Per-call seconds for `repeat` runs of as many loops as fill min_time"""
+    timer = timeit.Timer(function)
+    loops = 1
+    while timer.timeit(loops) < min_time:
+        loops *= 2 if loops < 1000 else 10
+    return [elapsed / loops for elapsed in timer.repeat(repeat, loops)], loops
+
+
+def measure_startup(repeat):
+    """Seconds to import the app and to run create_app, one new interpreter per sample"""
+    timings = {name: [] for name in STARTUP_BENCHMARKS}
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout
+        for name, seconds in zip(STARTUP_BENCHMARKS, output.split()):
+            timings[name].append(float(seconds))
+    return {name: (samples, 1) for name, samples in timings.items()}
+
+
+def run_benchmark(app, entry, repeat, min_time):
+    if not isinstance(entry, tuple):
+        with app.app_context():
+            return measure(entry, repeat, min_time)
+
+    request_context, function, *user_id = entry
+    with request_context:
+        if user_id and user_id[0] is not None:
+            login_user(db.session.get(User, user_id[0]))
+        return measure(function, repeat, min_time)
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def find_baseline(history_path, run, against):
+    """Latest earlier run on this host and Python, from another commit (or the given one)"""
+    if not os.path.exists(history_path):
+        return None
+
+    baseline = None
+    with open(history_path) as f:
+        for line in f:
+            previous = json.loads(line)
+            if previous['host'] != run['host'] or previous['python'] != run['python']:
+                continue
+            if against and not previous['commit'].startswith(against):
+                continue
+            if not against and previous['commit'] == run['commit']:
+                continue
+            baseline = previous
+    return baseline
+
+
+def threshold_for(name, thresholds):
+    for pattern, allowed in thresholds.get('benchmarks', {}).items():
+        if fnmatch.fnmatch(name, pattern):
+            return allowed
+    return thresholds.get('default', 0.15)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the per-request hot paths and flag slowdowns between commits.')
+    parser.add_argument('--filter', default='*', help="Only run benchmarks matching this pattern, e.g. 'token.*'")
+    parser.add_argument('--repeat', type=int, default=7, help='Timed runs per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per timed run')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON lines file of past runs')
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS, help='Allowed slowdown per benchmark')
+    parser.add_argument('--against', metavar='COMMIT', help='Compare with this commit instead of the latest other one')
+    parser.add_argument('--no-save', action='store_true', help="Don't append this run to the history")
+    args = parser.parse_args()
+
+    config['benchmark'] = BenchmarkConfig
+    app = create_app('benchmark')
+    with app.app_context():
+        db.create_all()
+        ids = seed(10)
+        benchmarks = build_benchmarks(app, ids)
+    benchmarks.update(build_render_benchmarks(app, ids))
+    compression_benchmarks, compressed_sizes = build_compression_benchmarks(app)
+    benchmarks.update(compression_benchmarks)
+
+    run = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'commit': git_revision(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'results': {},
+    }
+
+    measured = {}
+    for name, entry in sorted(benchmarks.items()):
+        if fnmatch.fnmatch(name, args.filter):
+            measured[name] = run_benchmark(app, entry, args.repeat, args.min_time)
+    if fnmatch.filter(STARTUP_BENCHMARKS, args.filter):
+        measured.update(measure_startup(args.repeat))
+
+    print(f"{'benchmark':<36} {'median':>10} {'min':>10} {'stdev':>8} {'loops':>7}")
+    for name, (timings, loops) in measured.items():
+        result = {
+            'median_us': statistics.median(timings) * 1e6,
+            'min_us': min(timings) * 1e6,
+            'stdev_us': statistics.stdev(timings) * 1e6 if len(timings) > 1 else 0.0,
+            'loops': loops,
+        }
+        if name in compressed_sizes:
+            result['bytes_in'], result['bytes_out'] = compressed_sizes[name]
+        run['results'][name] = result
+        print(f"{name:<36} {result['median_us']:>8.1f}us {result['min_us']:>8.1f}us "
+              f"{result['stdev_us']:>6.1f}us {loops:>7}")
+
+    compressed = [(name, result) for name, result in run['results'].items() if 'bytes_in' in result]
+    if compressed:
+        print(f"\n{'compression':<36} {'bytes':>10} {'saved':>16} {'us per KB saved':>16}")
+        for name, result in compressed:
+            saved = result['bytes_in'] - result['bytes_out']
+            print(f"{name:<36} {result['bytes_out']:>10,} {saved:>9,} {saved / result['bytes_in']:>6.1%} "
+                  f"{result['median_us'] / max(saved / 1024, 1e-9):>16.1f}")
+
+    with open(args.thresholds) as f:
+        thresholds = json.load(f)
+
+    baseline = find_baseline(args.history, run, args.against)
+    regressions = []
+    if baseline:
+        print(f"\nCompared with {baseline['commit']} ({baseline['timestamp'][:19]}):")
+        for name, result in run['results'].items():
+            before = baseline['results'].get(name)
+            if not before:
+                continue
+            change = result['median_us'] / before['median_us'] - 1
+            allowed = threshold_for(name, thresholds)
+            flag = '  ✗' if change > allowed else ''
+            print(f"  {name:<34} {before['median_us']:>10.1f}us -> {result['median_us']:>10.1f}us "
+                  f"{change:>+7.1%} (allowed {allowed:+.0%}){flag}")
+            if change > allowed:
+                regressions.append(name)
+    else:
+        print('\nNo earlier run from another commit on this host to compare with')
+
+    if not args.no_save:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+        print(f"Run appended to {args.history}")
+
+    if regressions:
+        print(f"\nSlower than allowed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""SQLite write-contention benchmark - commit latency with default vs tuned connection settings"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event, insert, select, func
+from sqlalchemy.exc import OperationalError
+from config import Config
+from utils.database import get_sqlite_pragmas, apply_sqlite_pragmas
+
+
+def make_engine(path, tuned):
+    """Create an engine for the benchmark database, optionally with the app's pragmas"""
+    if not tuned:
+        # Engine defaults, as before the tuning layer: rollback journal, FULL sync
+        return create_engine(f"sqlite:///{path}")
+
+    settings = {name: getattr(Config, name) for name in dir(Config) if name.startswith('SQLITE_')}
+    engine = create_engine(f"sqlite:///{path}",
+                           connect_args={'timeout': settings['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0})
+    pragmas = get_sqlite_pragmas(settings)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    return engine
+
+
+def writer(path, tuned, commits, results):
+    """Insert download log rows one transaction at a time, like concurrent download requests"""
+    from models.download_log import DownloadLog
+
+    engine = make_engine(path, tuned)
+    latencies = []
+    errors = 0
+
+    for i in range(commits):
+        start = time.perf_counter()
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(DownloadLog.__table__).values(
+                    user_id=1, file_id=1 + i % 50, download_date=datetime.utcnow(),
+                    ip_address='127.0.0.1', success=True))
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+
+    engine.dispose()
+    results.put(('write', latencies, errors))
+
+
+def reader(path, tuned, stop, results):
+    """Run dashboard-style count queries until told to stop"""
+    from models.download_log import DownloadLog
+
+    engine = make_engine(path, tuned)
+    queries = errors = 0
+
+    while not stop.is_set():
+        try:
+            with engine.connect() as connection:
+                connection.execute(select(func.count()).select_from(DownloadLog.__table__)).scalar()
+            queries += 1
+        except OperationalError:
+            errors += 1
+
+    engine.dispose()
+    results.put(('read', queries, errors))
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(max(int(round(percent / 100.0 * len(ordered))) - 1, 0), len(ordered) - 1)]
+
+
+def run(tuned, args):
+    """Run one benchmark round against a fresh database and return its summary"""
+    from models import db
+    import models  # noqa: F401 - registers all tables on db.metadata
+
+    workdir = tempfile.mkdtemp(prefix='sqlite-bench-')
+    path = os.path.join(workdir, 'bench.db')
+    try:
+        engine = make_engine(path, tuned)
+        db.metadata.create_all(engine)
+        engine.dispose()
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        stop = context.Event()
+        started = time.perf_counter()
+
+        processes = [context.Process(target=writer, args=(path, tuned, args.commits, results))
+                     for _ in range(args.writers)]
+        processes += [context.Process(target=reader, args=(path, tuned, stop, results))
+                      for _ in range(args.readers)]
+        for process in processes:
+            process.start()
+
+        latencies, write_errors = [], 0
+        for _ in range(args.writers):
+            _, worker_latencies, errors = results.get()
+            latencies.extend(worker_latencies)
+            write_errors += errors
+        elapsed = time.perf_counter() - started
+
+        # Writers are done; stop the readers
+        stop.set()
+        reads = read_errors = 0
+        for _ in range(args.readers):
+            _, queries, errors = results.get()
+            reads += queries
+            read_errors += errors
+        for process in processes:
+            process.join()
+
+        return {
+            'commits': len(latencies),
+            'errors': write_errors,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': (max(latencies) if latencies else float('nan')) * 1000,
+            'commits_per_second': len(latencies) / elapsed,
+            'reads_per_second': reads / elapsed,
+            'read_errors': read_errors,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure SQLite commit latency under multi-process write contention.')
+    parser.add_argument('--writers', type=int, default=8, help='Concurrent writer processes')
+    parser.add_argument('--readers', type=int, default=2, help='Concurrent reader processes')
+    parser.add_argument('--commits', type=int, default=200, help='Commits per writer')
+    parser.add_argument('--only', choices=['default', 'tuned'], help='Run a single configuration')
+    args = parser.parse_args()
+
+    rounds = [('default', False), ('tuned', True)]
+    if args.only:
+        rounds = [r for r in rounds if r[0] == args.only]
+
+    print(f"{args.writers} writers x {args.commits} commits, {args.readers} readers\n")
+    print(f"{'settings':<10} {'commits':>8} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'commits/s':>10} {'reads/s':>9} {'read errs':>9}")
+
+    for label, tuned in rounds:
+        summary = run(tuned, args)
+        print(f"{label:<10} {summary['commits']:>8} {summary['errors']:>7} {summary['p50_ms']:>8.2f} "
+              f"{summary['p99_ms']:>8.2f} {summary['max_ms']:>8.2f} {summary['commits_per_second']:>10.1f} "
+              f"{summary['reads_per_second']:>9.1f} {summary['read_errors']:>9}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
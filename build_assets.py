@@ -0,0 +1,151 @@
+"""Static asset build - minify, fingerprint and precompress static/ into static/dist with a manifest"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_FOLDER = os.path.join(ROOT, 'static')
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.html')
+MIN_COMPRESS_BYTES = 256
+
+
+def minify_css(source):
+    """Drop comments and the whitespace around punctuation"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    """
+    Drop comments, indentation and blank lines; statements keep their own lines
+
+    Conservative on purpose: line breaks stay, so automatic semicolon insertion
+    behaves as before, and anything inside string literals is left alone.
+    """
+    source = re.sub(r'^\s*/\*.*?\*/', '', source, flags=re.S | re.M)
+    lines = []
+    for line in source.splitlines():
+        line = _strip_line_comment(line).strip()
+        if line:
+            lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def _strip_line_comment(line):
+    """Cut a // comment that starts outside string literals (and after whitespace, to spare regex literals)"""
+    quote = None
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quote:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in '\'"`':
+            quote = char
+        elif line.startswith('//', i) and (i == 0 or line[i - 1].isspace()):
+            return line[:i]
+        i += 1
+    return line
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def fingerprinted_name(path, content):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def compress(path, content):
+    """Write .gz (and .br when brotli is installed) next to path when they are smaller; returns their sizes"""
+    sizes = {}
+    if not path.endswith(COMPRESSIBLE) or len(content) < MIN_COMPRESS_BYTES:
+        return sizes
+
+    variants = [('gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('br', lambda data: brotli.compress(data, quality=11)))
+
+    for suffix, compressor in variants:
+        compressed = compressor(content)
+        if len(compressed) < len(content):
+            with open(f"{path}.{suffix}", 'wb') as f:
+                f.write(compressed)
+            sizes[suffix] = len(compressed)
+    return sizes
+
+
+def build(static_folder, minify=True):
+    """Rebuild static/dist from scratch; returns the manifest (source path -> fingerprinted path)"""
+    dist = os.path.join(static_folder, DIST)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    manifest = {}
+    for directory, subdirectories, filenames in os.walk(static_folder):
+        if os.path.abspath(directory) == os.path.abspath(static_folder):
+            subdirectories[:] = [name for name in subdirectories if name != DIST]
+        subdirectories.sort()
+
+        for filename in sorted(filenames):
+            source = os.path.join(directory, filename)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+
+            minifier = MINIFIERS.get(os.path.splitext(filename)[1]) if minify else None
+            if minifier is not None:
+                content = minifier(content.decode('utf-8')).encode('utf-8')
+
+            target = f"{DIST}/{fingerprinted_name(relative, content)}"
+            path = os.path.join(static_folder, target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+
+            sizes = compress(path, content)
+            manifest[relative] = target
+            original = os.path.getsize(source)
+            compressed = ', '.join(f"{suffix} {size:,}" for suffix, size in sizes.items())
+            print(f"  {relative} -> {target}  {original:,} -> {len(content):,} bytes"
+                  f"{f' ({compressed})' if compressed else ''}")
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Minify, fingerprint and precompress static assets.')
+    parser.add_argument('--static-folder', default=STATIC_FOLDER, help='Folder to build (default: static/)')
+    parser.add_argument('--no-minify', action='store_true', help='Copy CSS and JS unchanged')
+    args = parser.parse_args()
+
+    print(f"Building {os.path.join(args.static_folder, DIST)}")
+    if brotli is None:
+        print("  brotli is not installed: writing gzip variants only (pip install brotli)")
+    manifest = build(args.static_folder, minify=not args.no_minify)
+    print(f"✓ {len(manifest)} assets, manifest at {os.path.join(args.static_folder, DIST, MANIFEST)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
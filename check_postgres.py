@@ -0,0 +1,239 @@
+"""PostgreSQL check - COPY log ingestion, the log buffer and migrate_database.py against a real server"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, select, func, text
+from sqlalchemy.engine import make_url
+from app import create_app
+from config import config
+from models import db
+from models.user import User
+from models.login_attempt import LoginAttempt
+from models.download_log import DownloadLog
+from utils.database import normalize_database_uri
+from utils.log_ingest import bulk_insert, record_log, flush_logs
+from check_query_budgets import QueryBudgetConfig, seed
+import migrate_database
+
+
+# Values COPY's text format has to escape, plus NULLs, booleans and timestamps
+AWKWARD_STRINGS = ['plain', 'tab\there', 'new\nline', 'carriage\rreturn', 'back\\slash', '\\N', 'ünïcødé', '']
+
+
+def postgres_driver():
+    """'psycopg2' or 'psycopg' when one is installed, else None"""
+    for driver in ('psycopg2', 'psycopg'):
+        try:
+            __import__(driver)
+            return driver
+        except ImportError:
+            continue
+    return None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def temporary_cluster(driver):
+    """Start a throwaway PostgreSQL cluster with initdb/pg_ctl and yield its URL"""
+    directory = tempfile.mkdtemp(prefix='durinsgate-pg-')
+    data, port = os.path.join(directory, 'data'), free_port()
+    try:
+        subprocess.run(['initdb', '-D', data, '-U', 'postgres', '--auth=trust'], check=True,
+                       stdout=subprocess.DEVNULL)
+        subprocess.run(['pg_ctl', '-D', data, '-l', os.path.join(directory, 'server.log'), '-w',
+                        '-o', f"-p {port} -k {directory} -c listen_addresses=127.0.0.1", 'start'],
+                       check=True, stdout=subprocess.DEVNULL)
+        try:
+            yield f"postgresql+{driver}://postgres@127.0.0.1:{port}/postgres"
+        finally:
+            subprocess.run(['pg_ctl', '-D', data, '-m', 'fast', '-w', 'stop'], stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextmanager
+def scratch_database(server_url):
+    """Create an empty database next to server_url's and drop it afterwards, leaving the original untouched"""
+    name = f"durinsgate_check_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(server_url, isolation_level='AUTOCOMMIT')
+    with admin.connect() as connection:
+        connection.execute(text(f'CREATE DATABASE "{name}"'))
+    try:
+        yield make_url(server_url).set(database=name).render_as_string(hide_password=False)
+    finally:
+        with admin.connect() as connection:
+            connection.execute(text("SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                                    "WHERE datname = :name AND pid <> pg_backend_pid()"), {'name': name})
+            connection.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+        admin.dispose()
+
+
+def make_app(name, url, **settings):
+    """An app on `url` with the query budget check's quiet background features"""
+    config[name] = type(name, (QueryBudgetConfig,), {'SQLALCHEMY_DATABASE_URI': url, **settings})
+    return create_app(name)
+
+
+def check_copy(url):
+    """bulk_insert's COPY path must round-trip every value it has to escape"""
+    app = make_app('postgres_check_copy', url)
+    failures = []
+
+    with app.app_context():
+        db.create_all()
+        stamp = datetime(2024, 2, 29, 23, 59, 58, 123456)
+        rows = [{'username': value, 'ip_address': '203.0.113.7', 'user_agent': None if i % 2 else value,
+                 'success': bool(i % 2), 'failure_reason': value, 'timestamp': stamp}
+                for i, value in enumerate(AWKWARD_STRINGS)]
+
+        with db.engine.begin() as connection:
+            inserted = bulk_insert(connection, LoginAttempt.__table__, rows)
+
+        stored = [
+            {column: getattr(attempt, column) for column in rows[0]}
+            for attempt in LoginAttempt.query.order_by(LoginAttempt.id).all()
+        ]
+        if inserted != len(rows) or stored != rows:
+            failures.append(f"COPY round trip: wrote {rows!r}, read back {stored!r}")
+
+        db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+
+    return failures
+
+
+def check_log_buffer(url, rows):
+    """Buffered download logs must all arrive through COPY in one flush"""
+    app = make_app('postgres_check_buffer', url, LOG_BUFFER_SIZE=rows * 2, LOG_FLUSH_INTERVAL=3600)
+    failures = []
+
+    with app.app_context():
+        db.create_all()
+        ids = seed(1)
+        for i in range(rows):
+            record_log(DownloadLog, user_id=ids['customer'], file_id=ids['file'], ip_address='203.0.113.7',
+                       user_agent=AWKWARD_STRINGS[i % len(AWKWARD_STRINGS)], success=True)
+
+        before = DownloadLog.query.count()
+        flushed = flush_logs()
+        after = DownloadLog.query.count()
+        if flushed != rows or after - before != rows:
+            failures.append(f"Log buffer: flushed {flushed} of {rows} rows, table grew by {after - before}")
+
+        db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+
+    return failures
+
+
+def check_migration(url, rows):
+    """migrate_database.py must copy a seeded SQLite database and leave sequences past the copied ids"""
+    directory = tempfile.mkdtemp(prefix='durinsgate-sqlite-')
+    source_url = f"sqlite:///{os.path.join(directory, 'source.db')}"
+    source = make_app('postgres_check_source', source_url)
+    failures = []
+
+    try:
+        with source.app_context():
+            db.create_all()
+            seed(rows)
+            with db.engine.connect() as connection:
+                expected = {table.name: migrate_database.count_rows(connection, table)
+                            for table in db.metadata.sorted_tables}
+            db.engine.dispose()
+
+        argv, sys.argv = sys.argv, ['migrate_database.py', '--config', 'postgres_check_source',
+                                    '--target', url, '--chunk-size', str(max(1, rows // 3))]
+        try:
+            status = migrate_database.main()
+        finally:
+            sys.argv = argv
+        if status:
+            failures.append(f"migrate_database.py exited with {status}")
+
+        target = create_engine(url)
+        with target.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                copied = migrate_database.count_rows(connection, table)
+                if copied != expected[table.name]:
+                    failures.append(f"Migration: {table.name} has {copied}/{expected[table.name]} rows")
+
+            # A reset sequence hands out an id past the copied ones instead of colliding
+            highest = connection.execute(select(func.max(User.__table__.c.id))).scalar() or 0
+            new_id = connection.execute(text("SELECT nextval(pg_get_serial_sequence('users', 'id'))")).scalar()
+            if new_id <= highest:
+                failures.append(f"Migration: users sequence returns {new_id}, copied ids go up to {highest}")
+
+            db.metadata.drop_all(connection)
+        target.dispose()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return failures
+
+
+def run_checks(url, rows):
+    failures = []
+    for name, check in (('COPY ingestion', lambda: check_copy(url)),
+                        ('Log buffer flush', lambda: check_log_buffer(url, rows)),
+                        ('migrate_database.py', lambda: check_migration(url, rows))):
+        problems = check()
+        print(f"  {'✗' if problems else '✓'} {name}")
+        for problem in problems:
+            print(f"      {problem}")
+        failures.extend(problems)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check COPY log ingestion and migrate_database.py against PostgreSQL.')
+    parser.add_argument('--url', default=os.environ.get('DATABASE_URL', ''),
+                        help='PostgreSQL server to create a scratch database on (default: DATABASE_URL); '
+                             'without one a temporary cluster is started with initdb/pg_ctl')
+    parser.add_argument('--rows', type=int, default=200, help='Log rows and seeded records to copy')
+    args = parser.parse_args()
+
+    driver = postgres_driver()
+    if driver is None:
+        print("Skipped: neither psycopg2 nor psycopg is installed")
+        return 0
+
+    url = normalize_database_uri(args.url)
+    if url.startswith('postgresql'):
+        if '+' not in url.split('://', 1)[0]:
+            url = url.replace('postgresql://', f"postgresql+{driver}://", 1)
+        server = nullcontext(url)
+    elif shutil.which('initdb') and shutil.which('pg_ctl'):
+        server = temporary_cluster(driver)
+    else:
+        print("Skipped: no PostgreSQL DATABASE_URL and no initdb/pg_ctl on PATH")
+        return 0
+
+    with server as server_url, scratch_database(server_url) as scratch_url:
+        print(f"Checking against {make_url(scratch_url).render_as_string(hide_password=True)}")
+        failures = run_checks(scratch_url, args.rows)
+
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nAll PostgreSQL checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""Query budget check - render every page against a seeded in-memory database and count its SQL statements"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import url_for, current_app
+from sqlalchemy import event
+from app import create_app
+from config import config, TestingConfig
+from models import db
+from models.user import User
+from models.file import File
+from models.file_assignment import FileAssignment
+from models.download_log import DownloadLog
+from models.login_attempt import LoginAttempt
+from models.file_integrity import FileIntegrityCheck
+from models.job import Job
+from models.profile import Profile
+from models.slow_query import SlowQuery
+from auth.utils import generate_activation_token, generate_password_reset_token, generate_mfa_qr_uri, mfa_qr_digest
+from utils.slow_queries import normalize_sql
+from utils.previews import get_preview_dir, THUMBNAIL_NAME
+from utils.storage import get_storage
+
+
+BLUEPRINTS = ('auth', 'admin', 'customer', 'api')
+DEFAULT_BUDGETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_budgets.json')
+
+ADMIN_PASSWORD = 'Admin@12345678'
+CUSTOMER_PASSWORD = 'Customer@123'
+PENDING_MFA_SECRET = 'JBSWY3DPEHPK3PXPJBSWY3DPEHPK3PXP'  # What setup_mfa would have put in the session
+
+# Pages whose budget only means something on the success path, not on a redirect or 404
+EXPECTED_STATUS = {
+    'customer.secure_download': (200, 206),
+    'customer.preview_image': (200,),
+    'admin.download_profile': (200,),
+}
+
+
+class QueryBudgetConfig(TestingConfig):
+    """In-memory database with background features that would add their own statements turned off"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    PROPAGATE_EXCEPTIONS = False  # Report broken pages as HTTP 500 instead of stopping
+    SQLITE_READ_REPLICA = False
+    RATELIMIT_ENABLED = False
+    LOG_BUFFER_SIZE = 0
+    SLOW_QUERY_ENABLED = False
+    PROFILE_ENABLED = False
+    TRACING_ENABLED = False
+
+
+def seed(rows):
+    """Fill the database with `rows` customers, files, logs and jobs so per-row queries show up"""
+    admin = User(username='admin', email='admin@example.com', role='admin', is_active=True, terms_accepted=True)
+    admin.set_password(ADMIN_PASSWORD)
+    customer = User(username='customer', email='customer@example.com', role='customer', company_name='Acme',
+                    is_active=True, terms_accepted=True)
+    customer.set_password(CUSTOMER_PASSWORD)
+    pending = User(username='pending', email='pending@example.com', role='customer', company_name='Acme',
+                   password_hash='!', is_active=False)
+    db.session.add_all([admin, customer, pending])
+    db.session.flush()
+
+    # One bcrypt hash shared by every other customer keeps seeding fast
+    customers = [customer] + [
+        User(username=f'customer{i}', email=f'customer{i}@example.com', role='customer',
+             company_name=f'Company {i}', password_hash=customer.password_hash,
+             is_active=True, terms_accepted=True)
+        for i in range(1, rows)
+    ]
+    files = [
+        File(filename=f'file{i}.pdf', original_filename=f'Manual {i}.pdf', file_path=f'manuals/file{i}.pdf',
+             file_size=1024 * (i + 1), file_type='pdf', checksum='0' * 64, category='User Manual',
+             product_type=f'Model {i % 5}', version='v1', uploaded_by_id=admin.id,
+             integrity_status='ok', integrity_checked_at=datetime.utcnow())
+        for i in range(rows)
+    ]
+    files[0].preview_status, files[0].page_count, files[0].preview_pages = 'ready', 3, 3
+    db.session.add_all(customers[1:] + files)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    for i, user in enumerate(customers):
+        for file in files[i % rows:i % rows + 5]:
+            db.session.add(FileAssignment(user_id=user.id, file_id=file.id, assigned_by_id=admin.id))
+        db.session.add(DownloadLog(user_id=user.id, file_id=files[i].id, ip_address='127.0.0.1',
+                                   download_date=now - timedelta(minutes=i), success=True))
+        db.session.add(DownloadLog(user_id=customer.id, file_id=files[i].id, ip_address='127.0.0.1',
+                                   download_date=now - timedelta(hours=i), success=i % 7 != 0))
+        db.session.add(LoginAttempt(username=user.username, ip_address='127.0.0.1', success=i % 5 != 0,
+                                    timestamp=now - timedelta(minutes=i)))
+        db.session.add(FileIntegrityCheck(file_id=files[i].id, status='ok', expected_size=files[i].file_size,
+                                          actual_size=files[i].file_size, duration_ms=1,
+                                          checked_at=now - timedelta(minutes=i)))
+        db.session.add(Job(name='verify_file', payload=json.dumps({'file_id': files[i].id}),
+                           status=Job.STATUS_FAILED if i % 4 == 0 else Job.STATUS_SUCCEEDED,
+                           attempts=1, started_at=now, finished_at=now))
+        db.session.add(SlowQuery(bind='primary', fingerprint=f'{i % 3:016x}', normalized_sql='SELECT ?',
+                                 duration_ms=150.0, endpoint='customer.files', plan='SCAN files'))
+
+    db.session.add(Profile(mode='cpu', method='GET', path='/customer/files', endpoint='customer.files',
+                           user_id=customer.id, status_code=200, duration_ms=10.0, result_file='capture.json'))
+    db.session.commit()
+
+    return {'admin': admin.id, 'customer': customer.id, 'pending': pending.id, 'file': files[0].id,
+            'job': Job.query.filter_by(status=Job.STATUS_FAILED).first().id,
+            'profile': Profile.query.first().id}
+
+
+def seed_artifacts(ids):
+    """Write the blob, preview image and profile capture the seeded rows point at (requires app context)"""
+    file = db.session.get(File, ids['file'])
+    data = b'%PDF-1.4\n' + b'0' * 1024
+    get_storage(file.storage_backend).put(file.file_path, io.BytesIO(data))
+    file.file_size = len(data)
+
+    preview_dir = get_preview_dir(file)
+    os.makedirs(preview_dir, exist_ok=True)
+    with open(os.path.join(preview_dir, f"{THUMBNAIL_NAME}.{current_app.config['PREVIEW_FORMAT']}"), 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+
+    profile = db.session.get(Profile, ids['profile'])
+    os.makedirs(current_app.config['PROFILE_FOLDER'], exist_ok=True)
+    with open(os.path.join(current_app.config['PROFILE_FOLDER'], profile.result_file), 'w') as f:
+        json.dump({'frames': [], 'stacks': [], 'sql': [{'sql': 'SELECT 1', 'count': 1, 'ms': 0.1}]}, f)
+
+    db.session.commit()
+
+
+def build_url(rule, ids):
+    """Fill a rule's URL arguments with seeded ids and freshly signed tokens"""
+    values = {}
+    for argument in rule.arguments:
+        if argument in ('customer_id', 'user_id'):
+            values[argument] = ids['customer']
+        elif argument == 'file_id':
+            values[argument] = ids['file']
+        elif argument == 'job_id':
+            values[argument] = ids['job']
+        elif argument == 'profile_id':
+            values[argument] = ids['profile']
+        elif argument == 'fmt':
+            values[argument] = 'sql.json'
+        elif argument == 'name':
+            values[argument] = 'thumbnail'
+        elif argument == 'digest':
+            uri = generate_mfa_qr_uri('customer', PENDING_MFA_SECRET)
+            values[argument] = mfa_qr_digest(uri, current_app.config['MFA_QR_FORMAT'])
+        elif argument == 'token' and rule.endpoint == 'auth.activate_account':
+            values[argument] = generate_activation_token(ids['pending'])
+        elif argument == 'token' and rule.endpoint == 'auth.reset_password':
+            values[argument] = generate_password_reset_token(ids['customer'])
+        elif argument == 'token':
+            values[argument] = File.query.get(ids['file']).get_download_token(ids['customer'])
+        else:
+            return None
+    return url_for(rule.endpoint, **values)
+
+
+def role_for(endpoint):
+    """Which user renders a page: admins for admin pages, customers for customer pages"""
+    if endpoint.startswith('admin.'):
+        return 'admin'
+    if endpoint.startswith(('customer.', 'api.')) or endpoint in ('auth.setup_mfa', 'auth.setup_mfa_qr', 'auth.logout'):
+        return 'customer'
+    return 'anonymous'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail when a page runs more SQL statements than its budget allows.')
+    parser.add_argument('--budgets', default=DEFAULT_BUDGETS, help='Budget file (default: query_budgets.json)')
+    parser.add_argument('--output', default='query_counts.json', help='Where to write the query count report')
+    parser.add_argument('--rows', type=int, default=25, help='Seeded customers, files, logs and jobs')
+    parser.add_argument('--strict', action='store_true', help='Also fail on pages without a budget')
+    parser.add_argument('--write-budgets', action='store_true',
+                        help='Save the measured counts as the new budgets instead of checking')
+    args = parser.parse_args()
+
+    with open(args.budgets) as f:
+        budget_file = json.load(f)
+    budgets, skipped = budget_file.get('budgets', {}), budget_file.get('skip', {})
+
+    config['query_budget'] = QueryBudgetConfig
+    app = create_app('query_budget')
+
+    # Blobs, previews and captures go to a scratch directory that is removed at exit
+    workspace = tempfile.TemporaryDirectory(prefix='query-budgets-')
+    for folder in ('UPLOAD_FOLDER', 'PREVIEW_FOLDER', 'PROFILE_FOLDER'):
+        app.config[folder] = os.path.join(workspace.name, folder.split('_')[0].lower())
+
+    statements = []
+
+    with app.app_context():
+        db.create_all()
+        ids = seed(args.rows)
+        seed_artifacts(ids)
+
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute',
+                         lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    # Requests run outside any app context of ours, so each gets a fresh session and g
+    clients = {'anonymous': app.test_client(), 'admin': app.test_client(), 'customer': app.test_client()}
+    clients['admin'].post('/auth/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+    clients['customer'].post('/auth/login', data={'username': 'customer', 'password': CUSTOMER_PASSWORD})
+    with clients['anonymous'].session_transaction() as session:
+        session['mfa_user_id'] = ids['customer']
+    with clients['customer'].session_transaction() as session:
+        session['mfa_secret'] = PENDING_MFA_SECRET
+
+    rules = [rule for rule in app.url_map.iter_rules()
+             if rule.endpoint.split('.')[0] in BLUEPRINTS and 'GET' in rule.methods]
+    # Log out last so the other customer pages stay signed in
+    rules.sort(key=lambda rule: (rule.endpoint == 'auth.logout', rule.endpoint))
+
+    results, failures = {}, []
+    for rule in rules:
+        if rule.endpoint in skipped:
+            results[rule.endpoint] = {'skipped': skipped[rule.endpoint]}
+            continue
+
+        with app.test_request_context():
+            url = build_url(rule, ids)
+        if url is None:
+            failures.append(f"{rule.endpoint}: don't know how to fill {sorted(rule.arguments)}")
+            continue
+
+        del statements[:]
+        response = clients[role_for(rule.endpoint)].get(url)
+        response.close()
+
+        count = len(statements)
+        budget = budgets.get(rule.endpoint)
+        repeated = Counter(normalize_sql(statement) for statement in statements).most_common(3)
+        results[rule.endpoint] = {
+            'url': url,
+            'role': role_for(rule.endpoint),
+            'status': response.status_code,
+            'queries': count,
+            'budget': budget,
+            'most_repeated': [{'sql': sql, 'count': n} for sql, n in repeated if n > 1],
+        }
+
+        if response.status_code >= 500:
+            failures.append(f"{rule.endpoint}: HTTP {response.status_code}")
+        elif response.status_code not in EXPECTED_STATUS.get(rule.endpoint, (response.status_code,)):
+            failures.append(f"{rule.endpoint}: HTTP {response.status_code}, expected "
+                            f"{' or '.join(map(str, EXPECTED_STATUS[rule.endpoint]))}")
+        elif budget is None and args.strict:
+            failures.append(f"{rule.endpoint}: no budget ({count} queries)")
+        elif budget is not None and count > budget:
+            failures.append(f"{rule.endpoint}: {count} queries, budget {budget}")
+
+    print(f"{'endpoint':<32} {'status':>6} {'queries':>8} {'budget':>7}")
+    for endpoint, result in sorted(results.items()):
+        if 'skipped' in result:
+            print(f"{endpoint:<32} {'-':>6} {'-':>8} {'-':>7}  skipped: {result['skipped']}")
+            continue
+        budget = result['budget'] if result['budget'] is not None else '-'
+        flag = '  ✗' if isinstance(budget, int) and result['queries'] > budget else ''
+        print(f"{endpoint:<32} {result['status']:>6} {result['queries']:>8} {budget:>7}{flag}")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'generated_at': datetime.utcnow().isoformat(),
+            'rows': args.rows,
+            'endpoints': results,
+            'failures': failures,
+        }, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+    if args.write_budgets:
+        budget_file['budgets'] = {endpoint: result['queries'] for endpoint, result in sorted(results.items())
+                                  if 'queries' in result}
+        with open(args.budgets, 'w') as f:
+            json.dump(budget_file, f, indent=2)
+            f.write('\n')
+        print(f"Budgets written to {args.budgets}")
+        return 0
+
+    if failures:
+        print('\nQuery budget check failed:')
+        for failure in failures:
+            print(f"  ✗ {failure}")
+        return 1
+
+    print('\nAll pages within their query budgets')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""S3 storage check - put, ranged reads, presigned URLs and migrate_storage.py against moto or MinIO"""
+import argparse
+import io
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import urllib.request
+import uuid
+from contextlib import contextmanager, nullcontext
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from config import config
+from models import db
+from models.file import File
+from utils.file_handler import get_relative_storage_key
+from utils.storage import S3Storage, LocalStorage, content_disposition
+from check_query_budgets import QueryBudgetConfig, seed
+import migrate_storage
+
+
+DOWNLOAD_NAME = 'Wartungshandbuch "Ölpumpe" v2.pdf'  # Quotes and non-ASCII exercise content_disposition
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def moto_server():
+    """Run moto's S3 server on a free local port and yield its endpoint URL"""
+    import logging
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # Its per-request lines would bury the results
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.stop()
+
+
+@contextmanager
+def scratch_bucket(endpoint, credentials):
+    """Create an empty bucket and remove it with everything in it afterwards"""
+    import boto3
+
+    name = f"durinsgate-check-{uuid.uuid4().hex[:8]}"
+    client = boto3.client('s3', endpoint_url=endpoint, region_name=credentials['region'] or 'us-east-1',
+                          aws_access_key_id=credentials['access_key_id'],
+                          aws_secret_access_key=credentials['secret_access_key'])
+    client.create_bucket(Bucket=name)
+    try:
+        yield name
+    finally:
+        for page in client.get_paginator('list_objects_v2').paginate(Bucket=name):
+            for item in page.get('Contents', []):
+                client.delete_object(Bucket=name, Key=item['Key'])
+        client.delete_bucket(Bucket=name)
+
+
+def make_storage(endpoint, bucket, credentials, prefix='check'):
+    return S3Storage(bucket, prefix=prefix, endpoint_url=endpoint, region=credentials['region'] or 'us-east-1',
+                     access_key_id=credentials['access_key_id'], secret_access_key=credentials['secret_access_key'])
+
+
+def read_all(stream):
+    try:
+        return stream.read()
+    finally:
+        stream.close()
+
+
+def check_put_and_read(storage, size):
+    """put must stream a multipart-sized blob and report its size; ranged opens must return exact slices"""
+    failures = []
+    data = os.urandom(size)
+
+    written = storage.put('manuals/big.bin', io.BytesIO(data))
+    if written != size or storage.size('manuals/big.bin') != size:
+        failures.append(f"put: wrote {written}, size() {storage.size('manuals/big.bin')}, expected {size}")
+    if read_all(storage.open('manuals/big.bin')) != data:
+        failures.append("open: full read differs from what was put")
+
+    # The last range starts just before boto3's first part boundary
+    ranges = [(0, 0), (100, 199), (size - 10, size - 1), (size - 10, None), (8 * 1024 * 1024 - 1, None)]
+    for start, end in [(start, end) for start, end in ranges if 0 <= start < size]:
+        expected = data[start:] if end is None else data[start:end + 1]
+        if read_all(storage.open('manuals/big.bin', start, end)) != expected:
+            failures.append(f"open: range {start}-{'' if end is None else end} returned the wrong bytes")
+
+    for method in (storage.open, storage.size):
+        try:
+            method('manuals/missing.bin')
+            failures.append(f"{method.__name__}: no FileNotFoundError for a missing key")
+        except FileNotFoundError:
+            pass
+
+    storage.delete('manuals/big.bin')
+    storage.delete('manuals/big.bin')  # Deleting a missing key is not an error
+    return failures
+
+
+def check_presigned_url(storage):
+    """A presigned URL must serve the blob with the download name in Content-Disposition"""
+    from datetime import timedelta
+
+    failures = []
+    data = os.urandom(64 * 1024)
+    storage.put('manuals/presigned.pdf', io.BytesIO(data))
+
+    url = storage.presigned_url('manuals/presigned.pdf', DOWNLOAD_NAME, timedelta(minutes=5))
+    with urllib.request.urlopen(url) as response:
+        body, disposition = response.read(), response.headers.get('Content-Disposition')
+    if body != data:
+        failures.append("presigned_url: body differs from what was put")
+    if disposition != content_disposition(DOWNLOAD_NAME):
+        failures.append(f"presigned_url: Content-Disposition {disposition!r}, "
+                        f"expected {content_disposition(DOWNLOAD_NAME)!r}")
+
+    storage.delete('manuals/presigned.pdf')
+    return failures
+
+
+def check_migration(endpoint, bucket, credentials, rows):
+    """migrate_storage.py must copy every local blob to S3, repoint the rows and delete the sources"""
+    directory = tempfile.mkdtemp(prefix='durinsgate-s3-')
+    config['s3_check'] = type('S3CheckConfig', (QueryBudgetConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'check.db')}",
+        'UPLOAD_FOLDER': os.path.join(directory, 'uploads'),
+        'STORAGE_BACKEND': 'local',
+        'S3_BUCKET': bucket,
+        'S3_PREFIX': 'migrated',
+        'S3_ENDPOINT_URL': endpoint,
+        'S3_REGION': credentials['region'] or 'us-east-1',
+        'S3_ACCESS_KEY_ID': credentials['access_key_id'],
+        'S3_SECRET_ACCESS_KEY': credentials['secret_access_key'],
+    })
+    app = create_app('s3_check')
+    failures = []
+
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(rows)
+            local = LocalStorage(app.config['UPLOAD_FOLDER'])
+            blobs = {}
+            for file in File.query.all():
+                blobs[file.id] = os.urandom(1024 + file.id)
+                local.put(file.file_path, io.BytesIO(blobs[file.id]))
+            db.engine.dispose()
+
+        argv, sys.argv = sys.argv, ['migrate_storage.py', '--config', 's3_check', '--from', 'local', '--to', 's3',
+                                    '--workers', '4', '--batch-size', str(max(1, rows // 3)), '--delete-source']
+        try:
+            status = migrate_storage.main()
+        finally:
+            sys.argv = argv
+        if status:
+            failures.append(f"migrate_storage.py exited with {status}")
+
+        with app.app_context():
+            storage = make_storage(endpoint, bucket, credentials, prefix='migrated')
+            for file in File.query.all():
+                if file.storage_backend != 's3' or file.file_path != get_relative_storage_key(file):
+                    failures.append(f"Migration: file {file.id} is on {file.storage_backend} at {file.file_path}")
+                    continue
+                if read_all(storage.open(file.file_path)) != blobs[file.id]:
+                    failures.append(f"Migration: file {file.id} differs in S3")
+                if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], *file.file_path.split('/'))):
+                    failures.append(f"Migration: local copy of file {file.id} was not deleted")
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the S3 storage backend against moto or an S3-compatible server.')
+    parser.add_argument('--endpoint', default=os.environ.get('S3_ENDPOINT_URL', ''),
+                        help='S3-compatible endpoint to create a scratch bucket on, e.g. MinIO at '
+                             'http://localhost:9000 (default: S3_ENDPOINT_URL); without one moto is used')
+    parser.add_argument('--size-mb', type=float, default=9,
+                        help='Size of the blob put and read back; above 8 MB boto3 uploads it in parts')
+    parser.add_argument('--rows', type=int, default=6, help='Files to migrate from local storage')
+    args = parser.parse_args()
+
+    try:
+        import boto3  # noqa: F401
+    except ImportError:
+        print("Skipped: boto3 is not installed")
+        return 0
+
+    if args.endpoint:
+        credentials = {'access_key_id': os.environ.get('S3_ACCESS_KEY_ID'),
+                       'secret_access_key': os.environ.get('S3_SECRET_ACCESS_KEY'),
+                       'region': os.environ.get('S3_REGION')}
+        server = nullcontext(args.endpoint)
+    else:
+        try:
+            import moto  # noqa: F401
+        except ImportError:
+            print("Skipped: no S3_ENDPOINT_URL and moto is not installed (pip install 'moto[server]')")
+            return 0
+        credentials = {'access_key_id': 'testing', 'secret_access_key': 'testing', 'region': 'us-east-1'}
+        server = moto_server()
+
+    failures = []
+    with server as endpoint, scratch_bucket(endpoint, credentials) as bucket:
+        print(f"Checking against bucket {bucket} at {endpoint}")
+        storage = make_storage(endpoint, bucket, credentials)
+        for name, check in (('put and ranged open', lambda: check_put_and_read(storage, int(args.size_mb * 1024 * 1024))),
+                            ('presigned_url', lambda: check_presigned_url(storage)),
+                            ('migrate_storage.py', lambda: check_migration(endpoint, bucket, credentials, args.rows))):
+            problems = check()
+            print(f"  {'✗' if problems else '✓'} {name}")
+            for problem in problems:
+                print(f"      {problem}")
+            failures.extend(problems)
+
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nAll S3 storage checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
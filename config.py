@@ -13,6 +13,37 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///durinsgate_portal.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # SQLite tuning (ignored for other databases)
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', 'True').lower() == 'true'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable under WAL except on power loss
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536))  # Per connection
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE_MB', 256)) * 1024 * 1024
+    SQLITE_CHECKPOINT_SCHEDULE = os.environ.get('SQLITE_CHECKPOINT_SCHEDULE', '*/10 * * * *')
+    SQLITE_ANALYZE_SCHEDULE = os.environ.get('SQLITE_ANALYZE_SCHEDULE', '30 2 * * *')
+    
+    # Connection pooling (PostgreSQL)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))  # Per process
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT_SECONDS', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE_SECONDS', 1800))
+    DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 0))  # Budget shared by all processes; 0 = no cap
+    DB_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', 1))  # Processes sharing DB_MAX_CONNECTIONS
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    DB_IDLE_IN_TRANSACTION_TIMEOUT_MS = int(os.environ.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000))
+    
+    # Read replica for admin reports (SQLite: a read-only pool on the same file)
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL', '')
+    SQLITE_READ_REPLICA = os.environ.get('SQLITE_READ_REPLICA', 'True').lower() == 'true'
+    REPLICA_POOL_SIZE = int(os.environ.get('REPLICA_POOL_SIZE', 3))
+    REPLICA_MAX_OVERFLOW = int(os.environ.get('REPLICA_MAX_OVERFLOW', 2))
+    REPLICA_STATEMENT_TIMEOUT_MS = int(os.environ.get('REPLICA_STATEMENT_TIMEOUT_MS', 15000))
+    
+    # Audit log ingestion
+    LOG_BUFFER_SIZE = int(os.environ.get('LOG_BUFFER_SIZE', 0))  # Rows per bulk insert; 0 = insert with each request
+    LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL_SECONDS', 2))
+    LOG_BUFFER_MAX_ROWS = int(os.environ.get('LOG_BUFFER_MAX_ROWS', 50000))  # Oldest rows dropped past this while flushes fail
+    
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=int(os.environ.get('SESSION_TIMEOUT_MINUTES', 15)))
     SESSION_COOKIE_SECURE = True  # Require HTTPS
@@ -32,6 +63,9 @@ class Config:
     ACCOUNT_LOCKOUT_DURATION = timedelta(minutes=int(os.environ.get('ACCOUNT_LOCKOUT_DURATION_MINUTES', 30)))
     DOWNLOAD_TOKEN_EXPIRATION = timedelta(minutes=int(os.environ.get('DOWNLOAD_TOKEN_EXPIRATION_MINUTES', 30)))
     PASSWORD_RESET_EXPIRATION = timedelta(hours=int(os.environ.get('PASSWORD_RESET_TOKEN_EXPIRATION_HOURS', 24)))
+    MFA_QR_FORMAT = os.environ.get('MFA_QR_FORMAT', 'svg')  # 'svg' or 'png' (needs Pillow)
+    MFA_QR_CACHE_SIZE = int(os.environ.get('MFA_QR_CACHE_SIZE', 256))  # Rendered QR images kept per process
+    MFA_QR_CACHE_TTL_SECONDS = int(os.environ.get('MFA_QR_CACHE_TTL_SECONDS', 600))  # Bounds how long other workers keep a secret
     
     # File Upload
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_FILE_SIZE_MB', 500)) * 1024 * 1024  # Convert to bytes
@@ -40,6 +74,77 @@ class Config:
     ALLOWED_EXTENSIONS = set(os.environ.get('ALLOWED_EXTENSIONS', 
                                             'pdf,zip,docx,doc,xlsx,xls,dwg,dxf,step,stp,iges,igs').split(','))
     
+    # Static assets: serve the fingerprinted build_assets.py output when it exists
+    ASSETS_USE_MANIFEST = os.environ.get('ASSETS_USE_MANIFEST', 'True').lower() == 'true'
+    
+    # Templates: compiled templates cached on disk for all workers, and {% cache %} fragments per process
+    JINJA_BYTECODE_CACHE = os.environ.get('JINJA_BYTECODE_CACHE', 'True').lower() == 'true'
+    JINJA_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      os.environ.get('JINJA_CACHE_FOLDER', 'jinja_cache'))
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', 'True').lower() == 'true'
+    FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 60))  # Also bounds staleness in other workers
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 2000))
+    
+    # Response compression and revalidation for rendered pages (downloads and static files are never touched)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'True').lower() == 'true'
+    COMPRESS_ALGORITHMS = os.environ.get('COMPRESS_ALGORITHMS', 'br,gzip').split(',')  # Preferred first; br needs brotli
+    COMPRESS_MIMETYPES = os.environ.get('COMPRESS_MIMETYPES', 'text/html,text/plain,text/csv,text/css,'
+                                        'application/json,application/javascript,image/svg+xml').split(',')
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # Smaller bodies fit a packet or two anyway
+    COMPRESS_MAX_SIZE = int(os.environ.get('COMPRESS_MAX_SIZE', 8 * 1024 * 1024))  # Larger ones would hold the worker
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+    RESPONSE_ETAGS = os.environ.get('RESPONSE_ETAGS', 'True').lower() == 'true'
+    ETAG_MIMETYPES = os.environ.get('ETAG_MIMETYPES', 'text/html,application/json').split(',')
+    
+    # Storage
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')  # 'local' or 's3'
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+    STORAGE_PRESIGNED_REDIRECTS = os.environ.get('STORAGE_PRESIGNED_REDIRECTS', 'True').lower() == 'true'
+    PRESIGNED_URL_EXPIRATION = timedelta(seconds=int(os.environ.get('PRESIGNED_URL_EXPIRATION_SECONDS', 300)))
+    
+    # Storage Tiering
+    COLD_STORAGE_BACKEND = os.environ.get('COLD_STORAGE_BACKEND', 'cold')  # 'cold' = COLD_STORAGE_FOLDER on disk
+    COLD_STORAGE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                       os.environ.get('COLD_STORAGE_FOLDER', 'cold_storage'))
+    TIER_COMPRESS_COLD = os.environ.get('TIER_COMPRESS_COLD', 'True').lower() == 'true'
+    TIER_WINDOW = timedelta(days=int(os.environ.get('TIER_WINDOW_DAYS', 90)))
+    TIER_COLD_MAX_DOWNLOADS = int(os.environ.get('TIER_COLD_MAX_DOWNLOADS', 0))  # Demote at or below this many downloads
+    TIER_MIN_AGE = timedelta(days=int(os.environ.get('TIER_MIN_AGE_DAYS', 30)))  # Never demote newer uploads
+    TIER_PROMOTE_ON_ACCESS = os.environ.get('TIER_PROMOTE_ON_ACCESS', 'True').lower() == 'true'
+    TIER_DELETE_GRACE_SECONDS = int(os.environ.get('TIER_DELETE_GRACE_SECONDS', 300))  # Let in-flight downloads finish
+    TIER_SCHEDULE = os.environ.get('TIER_SCHEDULE', '0 4 * * *')  # Cron expression; empty disables
+    
+    # Document Previews (PDF rendering requires PyMuPDF)
+    PREVIEW_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  os.environ.get('PREVIEW_FOLDER', 'preview_cache'))
+    PREVIEW_MAX_WORKERS = int(os.environ.get('PREVIEW_MAX_WORKERS', 2))
+    PREVIEW_MAX_PAGES = int(os.environ.get('PREVIEW_MAX_PAGES', 5))
+    PREVIEW_THUMBNAIL_WIDTH = int(os.environ.get('PREVIEW_THUMBNAIL_WIDTH', 240))
+    PREVIEW_PAGE_WIDTH = int(os.environ.get('PREVIEW_PAGE_WIDTH', 800))
+    PREVIEW_FORMAT = os.environ.get('PREVIEW_FORMAT', 'png')  # 'png' or 'webp' (webp requires Pillow)
+    PREVIEW_CACHE_MAX_AGE = 31536000  # 1 year; preview URLs change with the file checksum
+    
+    # Integrity Scrubber
+    SCRUB_MAX_WORKERS = int(os.environ.get('SCRUB_MAX_WORKERS', 4))
+    SCRUB_MAX_BYTES_PER_SECOND = int(os.environ.get('SCRUB_MAX_MB_PER_SECOND', 50)) * 1024 * 1024  # 0 disables throttling
+    SCRUB_SCHEDULE = os.environ.get('SCRUB_SCHEDULE', '0 3 * * 0')  # Cron expression; empty disables
+    
+    # Background Jobs (run by worker.py)
+    JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', 4))
+    JOB_WORKER_MODE = os.environ.get('JOB_WORKER_MODE', 'thread')  # 'thread' or 'process'
+    JOB_POLL_INTERVAL_SECONDS = float(os.environ.get('JOB_POLL_INTERVAL_SECONDS', 1))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_BACKOFF_SECONDS = int(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', 30))  # Doubles on each retry
+    JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 30))  # Workers mark their running jobs alive
+    JOB_TIMEOUT_SECONDS = int(os.environ.get('JOB_TIMEOUT_SECONDS', 300))  # Recover running jobs without a heartbeat this long
+    JOBS_EAGER = False  # Run jobs inline when enqueued instead of via the worker
+    
     # reCAPTCHA
     RECAPTCHA_SITE_KEY = os.environ.get('RECAPTCHA_SITE_KEY', '')
     RECAPTCHA_SECRET_KEY = os.environ.get('RECAPTCHA_SECRET_KEY', '')
@@ -49,15 +154,55 @@ class Config:
     COMPANY_NAME = os.environ.get('COMPANY_NAME', 'DurinsGate')
     SUPPORT_EMAIL = os.environ.get('SUPPORT_EMAIL', 'support@durinsgate.com')
     
+    # Metrics (Prometheus text format)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Bearer token for scrapers; admins can always view
+    
+    # Request Profiler (admins add ?_profile=cpu|memory or an X-Profile header)
+    PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', 'True').lower() == 'true'
+    PROFILE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  os.environ.get('PROFILE_FOLDER', 'profiles'))
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))  # Stack sampling interval
+    PROFILE_MAX_CAPTURES = int(os.environ.get('PROFILE_MAX_CAPTURES', 200))  # Oldest captures are pruned
+    PROFILE_TRACEMALLOC_FRAMES = int(os.environ.get('PROFILE_TRACEMALLOC_FRAMES', 10))
+    PROFILE_TRIGGER_TTL_HOURS = int(os.environ.get('PROFILE_TRIGGER_TTL_HOURS', 24))  # Armed triggers expire
+    PROFILE_TRIGGER_REFRESH_SECONDS = int(os.environ.get('PROFILE_TRIGGER_REFRESH_SECONDS', 5))
+    
+    # Tracing (spans per request, SQL statement, file I/O, email and job)
+    TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'False').lower() == 'true'
+    TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'jsonl')  # 'jsonl' or 'otlp'
+    TRACING_JSONL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      os.environ.get('TRACING_JSONL_PATH', 'traces/spans.jsonl'))
+    TRACING_OTLP_ENDPOINT = os.environ.get('TRACING_OTLP_ENDPOINT', 'http://localhost:4318')  # OTLP/HTTP collector
+    TRACING_SERVICE_NAME = os.environ.get('TRACING_SERVICE_NAME', 'durinsgate')
+    TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', 1.0))  # Fraction of new traces kept
+    TRACING_EXPORT_INTERVAL_SECONDS = float(os.environ.get('TRACING_EXPORT_INTERVAL_SECONDS', 5))
+    
+    # Slow-Query Log (System > Slow Queries)
+    SLOW_QUERY_ENABLED = os.environ.get('SLOW_QUERY_ENABLED', 'True').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'True').lower() == 'true'
+    SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = int(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS', 600))  # Per fingerprint
+    SLOW_QUERY_MAX_ROWS = int(os.environ.get('SLOW_QUERY_MAX_ROWS', 10000))  # Oldest rows are rotated out
+    
     # Rate Limiting
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'True').lower() == 'true'  # Turn off for load tests only
     RATELIMIT_STORAGE_URL = "memory://"
     RATELIMIT_STRATEGY = "fixed-window"
+    
+    # Files API (/api/v1) for customers syncing their files
+    API_RATE_LIMIT = os.environ.get('API_RATE_LIMIT', '60 per minute;2000 per hour')  # Per customer account
+    API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 50))
+    API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 200))
 
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     SESSION_COOKIE_SECURE = False  # Allow HTTP in development
+    # Edited CSS/JS show up without rerunning build_assets.py
+    ASSETS_USE_MANIFEST = os.environ.get('ASSETS_USE_MANIFEST', 'False').lower() == 'true'
 
 
 class ProductionConfig(Config):
@@ -67,9 +212,11 @@ class ProductionConfig(Config):
     
     # Enforce HTTPS
     SESSION_COOKIE_SECURE = True
-    
-    # Stricter security headers
-    SEND_FILE_MAX_AGE_DEFAULT = 31536000  # 1 year for static files
+
+
+class PostgresConfig(ProductionConfig):
+    """Production configuration on PostgreSQL"""
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'postgresql+psycopg2://durinsgate@localhost/durinsgate'
 
 
 class TestingConfig(Config):
@@ -78,11 +225,13 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test.db'
     WTF_CSRF_ENABLED = False
     SESSION_COOKIE_SECURE = False
+    JOBS_EAGER = True
 
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'postgres': PostgresConfig,
     'testing': TestingConfig,
     'default': DevelopmentConfig
 }
@@ -0,0 +1,37 @@
+"""Entitlement queries shared by the customer pages and the files API"""
+from datetime import datetime
+from sqlalchemy import or_
+from models import db
+from models.file import File
+from models.file_assignment import FileAssignment
+
+
+def entitled_files_query(user_id, search='', category=''):
+    """
+    (File, FileAssignment) rows for the files a customer may download
+
+    Active files with an active, unexpired assignment to the user, narrowed
+    by an optional search term and category. Unordered; callers add theirs.
+    """
+    query = db.session.query(File, FileAssignment)\
+        .join(FileAssignment, File.id == FileAssignment.file_id)\
+        .filter(FileAssignment.user_id == user_id)\
+        .filter(FileAssignment.is_active == True)\
+        .filter(or_(FileAssignment.expiration_date.is_(None),
+                    FileAssignment.expiration_date > datetime.utcnow()))\
+        .filter(File.is_active == True)
+
+    if search:
+        query = query.filter(
+            or_(
+                File.original_filename.ilike(f'%{search}%'),
+                File.description.ilike(f'%{search}%'),
+                File.product_type.ilike(f'%{search}%'),
+                File.category.ilike(f'%{search}%')
+            )
+        )
+
+    if category:
+        query = query.filter(File.category == category)
+
+    return query
@@ -1,17 +1,25 @@
 """Customer routes for file access and profile management"""
-from flask import render_template, redirect, url_for, flash, request, send_file, abort
+from flask import render_template, redirect, url_for, flash, request, abort, current_app, send_from_directory
 from flask_login import login_required, current_user
 from datetime import datetime
-from sqlalchemy import desc, or_
+from functools import partial
+from sqlalchemy import desc
 from customer import customer_bp
 from customer.forms import ProfileUpdateForm, TermsAcceptanceForm
+from customer.queries import entitled_files_query
 from models import db
 from models.user import User
 from models.file import File
 from models.file_assignment import FileAssignment
 from models.download_log import DownloadLog
 from auth.utils import get_client_ip, get_user_agent
-import os
+from utils.file_handler import send_stored_file
+from utils.previews import get_preview_dir, THUMBNAIL_NAME
+from utils.jobs import enqueue
+from utils.log_ingest import record_log
+from utils.metrics import record_download, record_cache
+from utils.tiering import TIER_COLD
+from utils.tracing import span
 
 
 def customer_required(f):
@@ -37,21 +45,11 @@ def dashboard():
     if not current_user.terms_accepted:
         return redirect(url_for('customer.accept_terms'))
     
-    # Get assigned files
-    assigned_files = db.session.query(File, FileAssignment)\
-        .join(FileAssignment, File.id == FileAssignment.file_id)\
-        .filter(FileAssignment.user_id == current_user.id)\
-        .filter(FileAssignment.is_active == True)\
-        .filter(File.is_active == True)\
+    # Get assigned files (expired assignments are filtered out by the query)
+    available_files = entitled_files_query(current_user.id)\
         .order_by(desc(FileAssignment.assigned_date))\
         .all()
     
-    # Filter out expired assignments
-    available_files = []
-    for file, assignment in assigned_files:
-        if not assignment.is_expired():
-            available_files.append((file, assignment))
-    
     # Get recent downloads
     recent_downloads = DownloadLog.query.filter_by(
         user_id=current_user.id,
@@ -84,54 +82,33 @@ def files():
     search = request.args.get('search', '')
     category = request.args.get('category', '')
     
-    # Base query for assigned files
-    query = db.session.query(File, FileAssignment)\
-        .join(FileAssignment, File.id == FileAssignment.file_id)\
-        .filter(FileAssignment.user_id == current_user.id)\
-        .filter(FileAssignment.is_active == True)\
-        .filter(File.is_active == True)
-    
-    # Apply search filter
-    if search:
-        query = query.filter(
-            or_(
-                File.original_filename.ilike(f'%{search}%'),
-                File.description.ilike(f'%{search}%'),
-                File.product_type.ilike(f'%{search}%'),
-                File.category.ilike(f'%{search}%')
-            )
-        )
-    
-    # Apply category filter
-    if category:
-        query = query.filter(File.category == category)
+    # Assigned files, shared with the files API; expired assignments are
+    # filtered out in SQL so every page holds a full 20 files
+    query = entitled_files_query(current_user.id, search, category)
     
     # Get paginated results
     files_page = query.order_by(desc(File.upload_date)).paginate(
         page=page, per_page=20, error_out=False
     )
     
-    # Filter out expired assignments
-    filtered_items = []
-    for file, assignment in files_page.items:
-        if not assignment.is_expired():
-            filtered_items.append((file, assignment))
-    
-    # Get available categories for this user
-    categories_query = db.session.query(File.category.distinct())\
-        .join(FileAssignment, File.id == FileAssignment.file_id)\
-        .filter(FileAssignment.user_id == current_user.id)\
-        .filter(FileAssignment.is_active == True)\
-        .filter(File.is_active == True)
-    
-    categories = [c[0] for c in categories_query.all() if c[0]]
-    
+    # Categories are loaded inside the template's cached fragment, so a cache hit skips the query
     return render_template('customer/files.html',
-                         files=filtered_items,
+                         files=files_page.items,
                          pagination=files_page,
                          search=search,
                          category=category,
-                         categories=categories)
+                         load_categories=partial(get_assigned_categories, current_user.id))
+
+
+def get_assigned_categories(user_id):
+    """Categories of the active files assigned to a customer"""
+    categories_query = db.session.query(File.category).distinct()\
+        .join(FileAssignment, File.id == FileAssignment.file_id)\
+        .filter(FileAssignment.user_id == user_id)\
+        .filter(FileAssignment.is_active == True)\
+        .filter(File.is_active == True)
+    
+    return [c[0] for c in categories_query.all() if c[0]]
 
 
 @customer_bp.route('/download/<int:file_id>')
@@ -143,25 +120,83 @@ def download_file(file_id):
         flash('You must accept the terms of service before downloading files.', 'warning')
         return redirect(url_for('customer.accept_terms'))
     
-    file = File.query.get_or_404(file_id)
+    with span('file.load', **{'file.id': file_id}):
+        file = File.query.get_or_404(file_id)
     
     # Verify user has access to this file
-    if not file.is_assigned_to_user(current_user.id):
+    with span('file.entitlement'):
+        entitled = file.is_assigned_to_user(current_user.id)
+    if not entitled:
         flash('You do not have access to this file.', 'danger')
         return redirect(url_for('customer.files'))
     
     # Generate download token
-    token = file.get_download_token(current_user.id)
+    with span('token.sign'):
+        token = file.get_download_token(current_user.id)
     
     # Redirect to secure download endpoint
     return redirect(url_for('customer.secure_download', token=token))
 
 
+@customer_bp.route('/files/<int:file_id>/preview')
+@login_required
+@customer_required
+def file_preview(file_id):
+    """Show the low-resolution page previews for a file"""
+    if not current_user.terms_accepted:
+        return redirect(url_for('customer.accept_terms'))
+    
+    file = File.query.get_or_404(file_id)
+    
+    if not file.is_active or not file.is_assigned_to_user(current_user.id):
+        flash('You do not have access to this file.', 'danger')
+        return redirect(url_for('customer.files'))
+    
+    if not file.has_preview():
+        flash('A preview is not available for this file yet.', 'info')
+        return redirect(url_for('customer.files'))
+    
+    return render_template('customer/preview.html', file=file)
+
+
+@customer_bp.route('/files/<int:file_id>/preview/<name>')
+@login_required
+@customer_required
+def preview_image(file_id, name):
+    """Serve a cached preview image with long-lived caching headers"""
+    # An image request can't follow a redirect to the terms page, so refuse it outright
+    if not current_user.terms_accepted:
+        abort(403)
+    
+    file = File.query.get_or_404(file_id)
+    
+    if not file.is_active or not file.has_preview() or not file.is_assigned_to_user(current_user.id):
+        abort(404)
+    
+    # Only the thumbnail and rendered pages are servable
+    valid_names = {THUMBNAIL_NAME} | {f"page-{n}" for n in range(1, (file.preview_pages or 0) + 1)}
+    if name not in valid_names:
+        abort(404)
+    
+    response = send_from_directory(
+        get_preview_dir(file),
+        f"{name}.{current_app.config['PREVIEW_FORMAT']}",
+        max_age=current_app.config['PREVIEW_CACHE_MAX_AGE']
+    )
+    
+    # URLs carry the file checksum, so the image behind a URL never changes
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
 @customer_bp.route('/secure-download/<token>')
 def secure_download(token):
     """Secure file download with token verification"""
     # Verify token
-    payload = File.verify_download_token(token)
+    with span('token.verify'):
+        payload = File.verify_download_token(token)
     
     if not payload:
         flash('Invalid or expired download link.', 'danger')
@@ -171,42 +206,56 @@ def secure_download(token):
     user_id = payload.get('user_id')
     
     # Get file
-    file = File.query.get_or_404(file_id)
+    with span('file.load', **{'file.id': file_id}):
+        file = File.query.get_or_404(file_id)
     
-    # Verify file still exists and is accessible
-    if not os.path.exists(file.file_path):
-        # Log failed download
-        log = DownloadLog(
+    # Trust the scrubber's verdict instead of stat-ing the file on every request
+    if file.failed_integrity_check():
+        log_download(user_id, file_id, success=False,
+                     error_message=f'File failed integrity check ({file.integrity_status})')
+        
+        flash('This file is temporarily unavailable. Please contact support.', 'danger')
+        return redirect(url_for('customer.files'))
+    
+    # Opening the blob surfaces a missing file as an OSError here
+    try:
+        with span('storage.open', **{'storage.backend': file.storage_backend, 'storage.tier': file.storage_tier}):
+            response = send_stored_file(file)
+    except OSError:
+        log_download(user_id, file_id, success=False, error_message='File not found on server')
+        
+        flash('File not found on server. Please contact support.', 'danger')
+        return redirect(url_for('customer.files'))
+    
+    # Read before logging: the log's commit expires the row, and reloading it costs a query
+    tier = file.storage_tier
+    
+    # Log successful download
+    log_download(user_id, file_id, success=True, served_tier=tier)
+    record_download(response, tier)
+    record_cache('storage_tier', tier != TIER_COLD)
+    
+    # Popular again - move it back to the hot tier without delaying this download
+    if tier == TIER_COLD and current_app.config['TIER_PROMOTE_ON_ACCESS']:
+        enqueue('promote_file', {'file_id': file_id}, dedupe_key=f"promote:{file_id}")
+    
+    return response
+
+
+def log_download(user_id, file_id, success, error_message=None, served_tier=None):
+    """Record a download attempt in the audit log"""
+    with span('download_log.insert', success=success):
+        record_log(
+            DownloadLog,
             user_id=user_id,
             file_id=file_id,
             ip_address=get_client_ip(),
             user_agent=get_user_agent(),
-            success=False,
-            error_message='File not found on server'
+            success=success,
+            error_message=error_message,
+            served_tier=served_tier
         )
-        db.session.add(log)
         db.session.commit()
-        
-        flash('File not found on server. Please contact support.', 'danger')
-        return redirect(url_for('customer.files'))
-    
-    # Log successful download
-    log = DownloadLog(
-        user_id=user_id,
-        file_id=file_id,
-        ip_address=get_client_ip(),
-        user_agent=get_user_agent(),
-        success=True
-    )
-    db.session.add(log)
-    db.session.commit()
-    
-    # Send file
-    return send_file(
-        file.file_path,
-        as_attachment=True,
-        download_name=file.original_filename
-    )
 
 
 @customer_bp.route('/download-history')
@@ -0,0 +1,69 @@
+"""Gunicorn configuration - `gunicorn -c gunicorn.conf.py wsgi:app`, tuned through GUNICORN_* variables"""
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+# Read .env before the defaults below, so its DB_POOL_SIZE and WEB_CONCURRENCY win
+load_dotenv()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Threaded workers keep serving other requests while some threads stream large downloads
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# One pooled connection per request thread, the overflow is left for log flushes and
+# the slow-query recorder; WEB_CONCURRENCY also splits DB_MAX_CONNECTIONS across workers
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+os.environ.setdefault('WEB_CONCURRENCY', str(workers))
+
+# Build the app once in the master and compile its templates there; workers fork with
+# them in place. Code changes need a restart (or USR2) because HUP reuses the preloaded app
+preload_app = True
+
+# Recycle workers against slow memory growth; the jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# A recycled, reloaded or stopped worker stops accepting connections and gives in-flight
+# requests (large downloads above all) this long to finish before it is killed
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 300))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def when_ready(server):
+    """Compile templates and mappers in the master so every worker inherits them"""
+    from utils.warmup import warm_shared
+
+    if server.cfg.preload_app:
+        seconds = warm_shared(server.app.wsgi())
+        server.log.info(f"Warmed shared caches in {seconds * 1000:.0f} ms")
+
+
+def post_worker_init(worker):
+    """Fill this worker's connection pools and caches before it accepts requests"""
+    from utils.warmup import warm_worker
+
+    seconds = warm_worker(worker.wsgi, include_shared=not worker.cfg.preload_app)
+    worker.log.info(f"Worker {worker.pid} warmed up in {seconds * 1000:.0f} ms")
+
+
+def worker_exit(server, worker):
+    """Write this worker's buffered log rows before it goes away"""
+    from utils.log_ingest import flush_logs
+
+    with worker.wsgi.app_context():
+        flushed = flush_logs()
+    if flushed:
+        worker.log.info(f"Worker {worker.pid} flushed {flushed} buffered log rows")
+
+
+def child_exit(server, worker):
+    """Remove a dead worker's live metric files"""
+    from utils.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
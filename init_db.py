@@ -12,6 +12,7 @@ from models.user import User
 from models.file import File
 from models.file_assignment import FileAssignment
 from auth.utils import generate_activation_token
+from utils.database import add_missing_columns, create_missing_indexes
 from utils.email_service import send_welcome_email
 
 
@@ -22,6 +23,16 @@ def init_database():
     with app.app_context():
         print("Creating database tables...")
         db.create_all()
+        added, skipped_columns = add_missing_columns(db.engine, db.metadata)
+        for name in added:
+            print(f"✓ Added column {name}")
+        for name in skipped_columns:
+            print(f"✗ Column {name} needs a manual migration (NOT NULL without a default)")
+        created, skipped_indexes = create_missing_indexes(db.engine, db.metadata)
+        for name in created:
+            print(f"✓ Created index {name}")
+        for name in skipped_indexes:
+            print(f"✗ Index {name} skipped: its columns are missing")
         
         # Check if admin already exists
         admin = User.query.filter_by(username='admin').first()
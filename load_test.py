@@ -0,0 +1,490 @@
+"""Load test - drive the portal with scripted customer and admin sessions and report per-endpoint latency"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit, urlencode, parse_qsl
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pyotp
+
+
+CSRF_FIELD = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+NUMBER_SEGMENT = re.compile(r'^\d+$')
+TOKEN_SEGMENT = re.compile(r'^[\w.-]{24,}$')
+SEARCH_TERMS = ['Manual', 'Guide', 'Model 1', 'Firmware', 'Specification', 'v2']
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+
+
+def endpoint_label(method, path):
+    """'GET /customer/files?search' from '/customer/files?search=x': ids, tokens and values dropped"""
+    parts = urlsplit(path)
+    segments = ['<id>' if NUMBER_SEGMENT.match(s) else '<token>' if TOKEN_SEGMENT.match(s) else s
+                for s in parts.path.split('/')]
+    label = f"{method} {'/'.join(segments)}"
+    keys = sorted({key for key, _ in parse_qsl(parts.query)})
+    return f"{label}?{'&'.join(keys)}" if keys else label
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Stats:
+    """Latencies, errors and bytes per endpoint, shared by all virtual users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def _entry(self, label):
+        return self.endpoints.setdefault(label, {'latencies': [], 'errors': Counter(), 'bytes': 0})
+
+    def record(self, label, seconds, nbytes, error=None):
+        with self.lock:
+            entry = self._entry(label)
+            entry['latencies'].append(seconds * 1000)
+            entry['bytes'] += nbytes
+            if error:
+                entry['errors'][error] += 1
+
+    def fail(self, label, error):
+        """Count a failed check against a request that already has its latency recorded"""
+        with self.lock:
+            self._entry(label)['errors'][error] += 1
+
+    def summary(self, elapsed):
+        results = {}
+        with self.lock:
+            for label, entry in sorted(self.endpoints.items()):
+                ordered = sorted(entry['latencies'])
+                count = len(ordered)
+                errors = sum(entry['errors'].values())
+                results[label] = {
+                    'requests': count,
+                    'rps': count / elapsed,
+                    'error_rate': errors / count if count else 1.0,
+                    'errors': dict(entry['errors']),
+                    'p50_ms': percentile(ordered, 50),
+                    'p90_ms': percentile(ordered, 90),
+                    'p95_ms': percentile(ordered, 95),
+                    'p99_ms': percentile(ordered, 99),
+                    'max_ms': ordered[-1] if ordered else 0.0,
+                    'bytes': entry['bytes'],
+                }
+        return results
+
+
+class Page:
+    __slots__ = ('status', 'path', 'headers', 'body', 'label')
+
+    def __init__(self, status, path, headers, body, label):
+        self.status = status
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.label = label
+
+
+class Browser:
+    """One virtual user: a keep-alive connection, a cookie jar and manual redirects"""
+
+    def __init__(self, base_url, stats, headers=None):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = None
+        self.stats = stats
+        self.headers = headers or {}  # Sent with every request, e.g. User-Agent
+        self.cookies = {}
+
+    def _send(self, method, path, body, headers):
+        if self.connection is None:
+            self.connection = self.connection_class(self.host, self.port, timeout=60)
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            return self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            self.connection = None
+            raise
+
+    def _read(self, response, slow_kbps):
+        """
+        Read the whole body, no faster than slow_kbps when simulating a slow client
+
+        Only text bodies (pages and their forms) are kept; downloads are
+        counted and dropped. Returns: (body, bytes received)
+        """
+        keep = (response.getheader('Content-Type') or '').startswith('text/')
+        chunks, received, started = [], 0, time.perf_counter()
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                return b''.join(chunks), received
+            received += len(chunk)
+            if keep:
+                chunks.append(chunk)
+            if slow_kbps:
+                ahead = received / (slow_kbps * 1024) - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def request(self, method, path, data=None, slow_kbps=None, label_suffix=''):
+        """Send a request and follow same-host redirects, recording each hop; returns the final Page"""
+        for _ in range(MAX_REDIRECTS + 1):
+            label = endpoint_label(method, path) + label_suffix
+            headers = dict(self.headers, Cookie='; '.join(f"{k}={v}" for k, v in self.cookies.items()))
+            body = None
+            if data is not None:
+                body = urlencode(data)
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+            started = time.perf_counter()
+            try:
+                response = self._send(method, path, body, headers)
+                content, nbytes = self._read(response, slow_kbps)
+            except (http.client.HTTPException, OSError) as e:
+                self.stats.record(label, time.perf_counter() - started, 0, type(e).__name__)
+                return None
+            elapsed = time.perf_counter() - started
+
+            for header in response.msg.get_all('Set-Cookie') or []:
+                for name, morsel in SimpleCookie(header).items():
+                    if morsel.value:
+                        self.cookies[name] = morsel.value
+                    else:
+                        self.cookies.pop(name, None)
+
+            status = response.status
+            self.stats.record(label, elapsed, nbytes, f"HTTP {status}" if status >= 400 else None)
+
+            location = response.getheader('Location')
+            if status not in (301, 302, 303, 307, 308) or not location:
+                return Page(status, path, response.msg, content, label)
+
+            target = urlsplit(location)
+            if target.netloc and target.hostname != self.host:
+                # e.g. a presigned S3 URL: the portal's part of the download is done
+                return Page(status, path, response.msg, content, label)
+            path = target.path + (f"?{target.query}" if target.query else '')
+            if status in (301, 302, 303):
+                method, data = 'GET', None
+
+        return Page(status, path, response.msg, content, label)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.cookies.clear()
+
+
+def csrf_token(page):
+    match = CSRF_FIELD.search(page.body.decode('utf-8', 'replace')) if page else None
+    return match.group(1) if match else ''
+
+
+def login(browser, account):
+    """Sign in through the login form (and the MFA form if the account has a secret); True on success"""
+    form = browser.get('/auth/login')
+    if form is None:
+        return False
+
+    page = browser.request('POST', '/auth/login', data={
+        'csrf_token': csrf_token(form), 'username': account['username'], 'password': account['password'],
+    })
+    if page is not None and page.path.startswith('/auth/verify-mfa') and account.get('mfa_secret'):
+        page = browser.request('POST', '/auth/verify-mfa', data={
+            'csrf_token': csrf_token(page), 'token': pyotp.TOTP(account['mfa_secret']).now(),
+        })
+
+    if page is None or page.path.startswith('/auth/'):
+        browser.stats.fail('POST /auth/login', 'login failed')
+        return False
+    return True
+
+
+def customer_scenario(browser, account, rng, options, think):
+    """Log in, browse and search the file list, download a file, check history, log out"""
+    if not login(browser, account):
+        return
+    think()
+    browser.get('/customer/files')
+    think()
+    browser.get(f"/customer/files?{urlencode({'search': rng.choice(SEARCH_TERMS)})}")
+    think()
+
+    if account['files']:
+        slow = rng.random() < options.slow_fraction
+        if slow:
+            # Slow clients fetch the largest file they have, read at --slow-client-kbps
+            file_id = max(account['files'], key=lambda f: f[1])[0]
+            page = browser.get(f"/customer/download/{file_id}", slow_kbps=options.slow_client_kbps,
+                               label_suffix=' (slow client)')
+        else:
+            file_id = rng.choice(account['files'])[0]
+            page = browser.get(f"/customer/download/{file_id}")
+        if page is not None and page.status == 200 and page.path.startswith('/customer/files'):
+            browser.stats.fail(page.label, 'download redirected to file list')
+        think()
+
+    browser.get('/customer/download-history')
+    think()
+    browser.get('/auth/logout')
+
+
+def admin_scenario(browser, account, rng, options, think):
+    """Log in, review the dashboard, activity and a customer, log out"""
+    if not login(browser, account):
+        return
+    think()
+    browser.get('/admin/activity')
+    think()
+    browser.get(f"/admin/customers?{urlencode({'search': 'seed'})}")
+    think()
+    if options.customer_ids:
+        browser.get(f"/admin/customers/{rng.choice(options.customer_ids)}")
+        think()
+    browser.get('/admin/files')
+    think()
+    browser.get('/auth/logout')
+
+
+SCENARIOS = {'customer': customer_scenario, 'admin': admin_scenario}
+
+
+def load_accounts(config_name, count, password, admin_username, admin_password):
+    """Seeded customers with their MFA secrets and assigned files, plus the admin account, from the database"""
+    from sqlalchemy import select, func
+    from app import create_app
+    from models import db
+    from models.user import User
+    from models.file import File
+    from models.file_assignment import FileAssignment
+
+    app = create_app(config_name)
+    with app.app_context():
+        users = db.session.execute(
+            select(User.id, User.username, User.mfa_secret)
+            .where(User.role == 'customer', User.is_active == True, User.terms_accepted == True,
+                   User.username.like('seed_customer%'))
+            .order_by(func.random())
+            .limit(count)
+        ).all()
+
+        files = {}
+        if users:
+            rows = db.session.execute(
+                select(FileAssignment.user_id, File.id, File.file_size)
+                .join(File, File.id == FileAssignment.file_id)
+                .where(FileAssignment.user_id.in_([user.id for user in users]),
+                       FileAssignment.is_active == True, File.is_active == True)
+            ).all()
+            for user_id, file_id, size in rows:
+                files.setdefault(user_id, []).append((file_id, size))
+
+        admin = db.session.execute(
+            select(User.mfa_secret, User.mfa_enabled).where(User.username == admin_username)
+        ).first()
+
+    customers = [{'id': user.id, 'username': user.username, 'password': password,
+                  'mfa_secret': user.mfa_secret, 'files': files.get(user.id, [])} for user in users]
+    admin_account = {'username': admin_username, 'password': admin_password,
+                     'mfa_secret': admin.mfa_secret if admin and admin.mfa_enabled else None}
+    return customers, admin_account
+
+
+def start_server(config_name, url):
+    """Run the app with the Werkzeug threaded server, rate limits off, and wait until it answers"""
+    port = urlsplit(url).port or 5000
+    env = dict(os.environ, RATELIMIT_ENABLED='false')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', f"app:create_app('{config_name}')",
+         'run', '--port', str(port), '--with-threads', '--no-reload', '--no-debugger'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/auth/login')
+            connection.getresponse().read()
+            connection.close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.2)
+
+    server.terminate()
+    raise RuntimeError(f"App did not start on port {port}")
+
+
+def virtual_user(index, options, stats, customers, admin_account, deadline):
+    rng = random.Random(f"{options.seed}-{index}")
+    browser = Browser(options.url, stats)
+    names = list(options.mix)
+    weights = [options.mix[name] for name in names]
+
+    def think():
+        if options.think_time:
+            time.sleep(rng.uniform(0, options.think_time))
+
+    time.sleep(options.ramp_up * index / max(1, options.users))
+    while time.time() < deadline:
+        scenario = rng.choices(names, weights=weights)[0]
+        account = admin_account if scenario == 'admin' else rng.choice(customers)
+        SCENARIOS[scenario](browser, account, rng, options, think)
+        browser.close()
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a baseline: p95 latency, error rate and total throughput"""
+    regressions = []
+    for label, now in results['endpoints'].items():
+        before = baseline['endpoints'].get(label)
+        if before is None:
+            continue
+        if before['p95_ms'] and now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['p95_ms']:.1f} -> {now['p95_ms']:.1f} ms")
+        if now['error_rate'] > before['error_rate'] + 0.01:
+            regressions.append(f"{label}: errors {before['error_rate']:.1%} -> {now['error_rate']:.1%}")
+
+    before_rps, now_rps = baseline['totals']['rps'], results['totals']['rps']
+    if now_rps < before_rps * (1 - tolerance):
+        regressions.append(f"throughput {before_rps:.1f} -> {now_rps:.1f} req/s")
+    return regressions
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name} (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run scripted customer and admin sessions against the portal.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Portal base URL')
+    parser.add_argument('--start', action='store_true', help='Start the app locally (rate limits off) for the run')
+    parser.add_argument('--config', default=os.environ.get('FLASK_ENV', 'development'),
+                        help='Configuration whose database holds the seeded accounts (default: FLASK_ENV or development)')
+    parser.add_argument('--users', type=int, default=10, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which virtual users start')
+    parser.add_argument('--think-time', type=float, default=0.5, help='Max random pause between steps, in seconds')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('customer=9,admin=1'),
+                        help='Scenario weights (default: customer=9,admin=1)')
+    parser.add_argument('--accounts', type=int, default=200, help='Seeded customers to sample')
+    parser.add_argument('--password', default='Customer@123', help='Password of the seeded customers')
+    parser.add_argument('--admin-username', default='admin')
+    parser.add_argument('--admin-password', default='Admin@12345678')
+    parser.add_argument('--slow-fraction', type=float, default=0.05,
+                        help='Share of downloads made by a slow client')
+    parser.add_argument('--slow-client-kbps', type=float, default=256, help='Read speed of slow clients')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='load_results.json', help='Where to write the results')
+    parser.add_argument('--baseline', help='Compare with a previous results file and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against the baseline')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Also save the results as a baseline file')
+    options = parser.parse_args()
+
+    customers, admin_account = load_accounts(options.config, options.accounts, options.password,
+                                             options.admin_username, options.admin_password)
+    if not customers and 'customer' in options.mix:
+        print("✗ No seeded customers found (run seed_data.py first)")
+        return 1
+    options.customer_ids = [customer['id'] for customer in customers]
+
+    server = start_server(options.config, options.url) if options.start else None
+    stats = Stats()
+    print(f"Running {options.users} virtual users against {options.url} for {options.duration:.0f}s "
+          f"({', '.join(f'{k}={v:g}' for k, v in options.mix.items())})")
+
+    started = time.time()
+    deadline = started + options.duration
+    threads = [threading.Thread(target=virtual_user, daemon=True,
+                                args=(i, options, stats, customers, admin_account, deadline))
+               for i in range(options.users)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    elapsed = time.time() - started
+    endpoints = stats.summary(elapsed)
+    total = sum(e['requests'] for e in endpoints.values())
+    results = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'url': options.url,
+        'users': options.users,
+        'duration': elapsed,
+        'mix': options.mix,
+        'totals': {
+            'requests': total,
+            'rps': total / elapsed,
+            'error_rate': sum(e['error_rate'] * e['requests'] for e in endpoints.values()) / total if total else 0,
+        },
+        'endpoints': endpoints,
+    }
+
+    print(f"\n{'endpoint':<46} {'reqs':>6} {'req/s':>7} {'err%':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}")
+    for label, e in endpoints.items():
+        print(f"{label[:46]:<46} {e['requests']:>6} {e['rps']:>7.1f} {e['error_rate'] * 100:>6.1f} "
+              f"{e['p50_ms']:>7.1f} {e['p95_ms']:>7.1f} {e['p99_ms']:>7.1f} {e['max_ms']:>7.1f}")
+    print(f"\n{total} requests, {results['totals']['rps']:.1f} req/s, "
+          f"{results['totals']['error_rate']:.2%} errors (latencies in ms)")
+
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {options.output}")
+
+    if options.save_baseline:
+        with open(options.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {options.save_baseline}")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        if regressions:
+            print('\nRegressions against the baseline:')
+            for regression in regressions:
+                print(f"  ✗ {regression}")
+            return 1
+        print('\nNo regressions against the baseline')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Storage migration script - copy file blobs between storage backends in parallel"""
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from models import db
+from models.file import File
+from utils.file_handler import get_relative_storage_key
+from utils.storage import get_storage
+
+
+def copy_blob(source, destination, source_key, dest_key):
+    """Stream one blob from source to destination and verify its size"""
+    expected_size = source.size(source_key)
+    stream = source.open(source_key)
+    try:
+        written = destination.put(dest_key, stream)
+    finally:
+        stream.close()
+
+    if written != expected_size or destination.size(dest_key) != expected_size:
+        raise IOError(f"Size mismatch after copy: expected {expected_size}, wrote {written}")
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy file blobs from one storage backend to another.')
+    parser.add_argument('--from', dest='source', default='local', help='Source backend (default: local)')
+    parser.add_argument('--to', dest='destination', default='s3', help='Destination backend (default: s3)')
+    parser.add_argument('--config', default=os.environ.get('FLASK_ENV', 'development'),
+                        help='Configuration name (default: FLASK_ENV or development)')
+    parser.add_argument('--workers', type=int, default=8, help='Number of parallel copy threads')
+    parser.add_argument('--batch-size', type=int, default=500, help='Rows to load per batch')
+    parser.add_argument('--delete-source', action='store_true',
+                        help='Delete source blobs once the copy is verified and recorded')
+    parser.add_argument('--dry-run', action='store_true', help='List what would be copied without copying')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+
+    with app.app_context():
+        source = get_storage(args.source)
+        destination = get_storage(args.destination)
+
+        copied = failed = copied_bytes = 0
+        last_id = 0
+
+        print(f"Migrating blobs from '{args.source}' to '{args.destination}'...")
+
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='migrate') as executor:
+            while True:
+                batch = File.query.filter(File.storage_backend == args.source, File.id > last_id)\
+                    .order_by(File.id)\
+                    .limit(args.batch_size)\
+                    .all()
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                if args.dry_run:
+                    for file in batch:
+                        print(f"  would copy {file.file_path} -> {get_relative_storage_key(file)}")
+                    continue
+
+                futures = {}
+                for file in batch:
+                    dest_key = get_relative_storage_key(file)
+                    future = executor.submit(copy_blob, source, destination, file.file_path, dest_key)
+                    futures[future] = (file, dest_key)
+
+                source_keys = []
+                for future in as_completed(futures):
+                    file, dest_key = futures[future]
+                    try:
+                        copied_bytes += future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"  ✗ {file.file_path}: {str(e)}")
+                        continue
+
+                    source_keys.append(file.file_path)
+                    file.file_path = dest_key
+                    file.storage_backend = args.destination
+                    copied += 1
+
+                # Rows point at the new copies before any source blob is removed
+                db.session.commit()
+
+                if args.delete_source:
+                    for key in source_keys:
+                        source.delete(key)
+
+                print(f"  ✓ {copied} copied ({copied_bytes / (1024 * 1024):.1f} MB), {failed} failed")
+
+        print(f"\nMigration complete: {copied} copied, {failed} failed")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_mail import Mail
-from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from utils.database import RoutingSession
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 mail = Mail()
-migrate = Migrate()
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"]
@@ -21,3 +20,8 @@ from models.file import File
 from models.file_assignment import FileAssignment
 from models.download_log import DownloadLog
 from models.login_attempt import LoginAttempt
+from models.file_integrity import FileIntegrityCheck
+from models.job import Job
+from models.profile import Profile
+from models.profile_trigger import ProfileTrigger
+from models.slow_query import SlowQuery
@@ -16,6 +16,7 @@ class DownloadLog(db.Model):
     user_agent = db.Column(db.String(500))
     success = db.Column(db.Boolean, default=True, nullable=False)
     error_message = db.Column(db.String(500))
+    served_tier = db.Column(db.String(10))  # Storage tier the file was served from
     
     # Relationships
     user = db.relationship('User', back_populates='download_logs')
@@ -25,6 +26,9 @@ class DownloadLog(db.Model):
     __table_args__ = (
         db.Index('idx_user_date', 'user_id', 'download_date'),
         db.Index('idx_file_date', 'file_id', 'download_date'),
+        # Partial index: download counts and activity reports only count successes
+        db.Index('idx_success_file_date', 'file_id', 'download_date',
+                 postgresql_where=db.text('success'), sqlite_where=db.text('success = 1')),
     )
     
     def __repr__(self):
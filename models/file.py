@@ -1,6 +1,5 @@
 from datetime import datetime, timedelta
 from models import db
-import jwt
 from flask import current_app
 import os
 
@@ -13,9 +12,13 @@ class File(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)  # Stored filename (unique)
     original_filename = db.Column(db.String(255), nullable=False)  # Original upload name
-    file_path = db.Column(db.String(500), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)  # Storage key (absolute path for legacy local files)
+    storage_backend = db.Column(db.String(20), nullable=False, default='local')  # 'local', 'cold' or 's3'
+    storage_tier = db.Column(db.String(10), nullable=False, default='hot', index=True)  # 'hot' or 'cold'
+    is_compressed = db.Column(db.Boolean, nullable=False, default=False)  # Blob stored gzip-compressed
     file_size = db.Column(db.BigInteger, nullable=False)  # Size in bytes
     file_type = db.Column(db.String(50), nullable=False)  # Extension
+    checksum = db.Column(db.String(64))  # SHA-256 hex digest of the stored blob
     
     # Categorization
     category = db.Column(db.String(100))  # e.g., "User Manual", "Technical Specification"
@@ -23,11 +26,20 @@ class File(db.Model):
     version = db.Column(db.String(50))  # e.g., "v2.1", "Rev C"
     description = db.Column(db.Text)
     
+    # Previews (generated in the background for supported types)
+    preview_status = db.Column(db.String(20))  # 'pending', 'ready' or 'failed'
+    page_count = db.Column(db.Integer)
+    preview_pages = db.Column(db.Integer)  # Number of low-res page images rendered
+    
     # Metadata
     upload_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     uploaded_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
+    # Integrity (latest verdict from the background scrubber)
+    integrity_status = db.Column(db.String(20))
+    integrity_checked_at = db.Column(db.DateTime)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -36,9 +48,12 @@ class File(db.Model):
     uploaded_by = db.relationship('User', foreign_keys=[uploaded_by_id])
     assigned_to_users = db.relationship('FileAssignment', back_populates='file', lazy='dynamic')
     download_logs = db.relationship('DownloadLog', back_populates='file', lazy='dynamic')
+    integrity_checks = db.relationship('FileIntegrityCheck', back_populates='file', lazy='dynamic')
     
     def get_download_token(self, user_id):
         """Generate a time-limited download token for this file"""
+        import jwt
+
         expiration = datetime.utcnow() + current_app.config['DOWNLOAD_TOKEN_EXPIRATION']
         
         payload = {
@@ -59,6 +74,8 @@ class File(db.Model):
     @staticmethod
     def verify_download_token(token):
         """Verify and decode a download token"""
+        import jwt
+
         try:
             payload = jwt.decode(
                 token,
@@ -80,6 +97,15 @@ class File(db.Model):
             size /= 1024.0
         return f"{size:.2f} TB"
     
+    def failed_integrity_check(self):
+        """Check if the scrubber's latest verdict says the blob cannot be served"""
+        from models.file_integrity import FileIntegrityCheck
+        return self.integrity_status in FileIntegrityCheck.FAILED_STATUSES
+    
+    def has_preview(self):
+        """Check if preview images are available for this file"""
+        return self.preview_status == 'ready'
+    
     def is_assigned_to_user(self, user_id):
         """Check if this file is assigned to a specific user"""
         from models.file_assignment import FileAssignment
@@ -24,6 +24,9 @@ class FileAssignment(db.Model):
     # Composite index for efficient queries
     __table_args__ = (
         db.Index('idx_user_file', 'user_id', 'file_id'),
+        # Partial index: entitlement checks only ever look at active assignments
+        db.Index('idx_active_user_file', 'user_id', 'file_id',
+                 postgresql_where=db.text('is_active'), sqlite_where=db.text('is_active = 1')),
     )
     
     def is_expired(self):
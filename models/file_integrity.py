@@ -0,0 +1,45 @@
+from datetime import datetime
+from models import db
+
+
+class FileIntegrityCheck(db.Model):
+    """Result of a background integrity scrub for a stored file"""
+    __tablename__ = 'file_integrity_checks'
+
+    # Verdicts recorded by the scrubber
+    STATUS_OK = 'ok'
+    STATUS_MISSING = 'missing'
+    STATUS_SIZE_MISMATCH = 'size_mismatch'
+    STATUS_CHECKSUM_MISMATCH = 'checksum_mismatch'
+    STATUS_ERROR = 'error'
+
+    # Verdicts that mean the stored blob cannot be served
+    FAILED_STATUSES = (STATUS_MISSING, STATUS_SIZE_MISMATCH, STATUS_CHECKSUM_MISMATCH)
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('files.id'), nullable=False, index=True)
+
+    # Check details
+    checked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, index=True)
+    expected_size = db.Column(db.BigInteger)
+    actual_size = db.Column(db.BigInteger)
+    expected_checksum = db.Column(db.String(64))
+    actual_checksum = db.Column(db.String(64))
+    duration_ms = db.Column(db.Integer)
+    error_message = db.Column(db.String(500))
+
+    # Relationships
+    file = db.relationship('File', back_populates='integrity_checks')
+
+    # Composite index for efficient queries
+    __table_args__ = (
+        db.Index('idx_integrity_file_checked', 'file_id', 'checked_at'),
+    )
+
+    def is_failure(self):
+        """Check if this result means the file cannot be served"""
+        return self.status in self.FAILED_STATUSES
+
+    def __repr__(self):
+        return f'<FileIntegrityCheck file_id={self.file_id} status={self.status} at={self.checked_at}>'
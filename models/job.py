@@ -0,0 +1,72 @@
+import json
+from datetime import datetime
+from models import db
+
+
+class Job(db.Model):
+    """Durable background job processed by worker.py"""
+    __tablename__ = 'jobs'
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    # Rows the unique dedupe index covers: active jobs, and periodic runs whatever
+    # their status, so a run that already finished is not enqueued again that minute
+    DEDUPE_SCOPE = ("dedupe_key IS NOT NULL AND (status IN ('queued', 'running') "
+                    "OR dedupe_key LIKE 'periodic:%')")
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+
+    # Scheduling
+    status = db.Column(db.String(20), nullable=False, default=STATUS_QUEUED)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    dedupe_key = db.Column(db.String(255), index=True)  # At most one active job per key (unique index below)
+
+    # Retries
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    last_error = db.Column(db.Text)
+
+    # Execution
+    worker_id = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Refreshed by the running worker; stale means the worker died
+    finished_at = db.Column(db.DateTime)
+    trace_parent = db.Column(db.String(55))  # W3C traceparent of the span that enqueued the job
+
+    # Composite index for efficient queries
+    __table_args__ = (
+        db.Index('idx_job_status_run_at', 'status', 'run_at'),
+        # Partial index: workers poll for due queued jobs, a small slice of the table
+        db.Index('idx_job_queued_run_at', 'run_at',
+                 postgresql_where=db.text("status = 'queued'"), sqlite_where=db.text("status = 'queued'")),
+        # Makes dedupe atomic: a concurrent enqueue of the same key fails instead of duplicating
+        db.Index('uq_job_dedupe_key', 'dedupe_key', unique=True,
+                 postgresql_where=db.text(DEDUPE_SCOPE), sqlite_where=db.text(DEDUPE_SCOPE)),
+    )
+
+    def get_payload(self):
+        """Return the decoded job arguments"""
+        return json.loads(self.payload or '{}')
+
+    def wait_seconds(self):
+        """Seconds the job waited between becoming due and starting"""
+        if not self.started_at:
+            return None
+        return max((self.started_at - self.run_at).total_seconds(), 0)
+
+    def run_seconds(self):
+        """Seconds the last attempt took to run"""
+        if not self.started_at or not self.finished_at:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} status={self.status}>'
@@ -0,0 +1,38 @@
+from datetime import datetime
+from models import db
+
+
+class Profile(db.Model):
+    """Captured profile of a single request (sampled stacks or memory)"""
+    __tablename__ = 'profiles'
+
+    MODE_CPU = 'cpu'
+    MODE_MEMORY = 'memory'
+    MODES = (MODE_CPU, MODE_MEMORY)
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    mode = db.Column(db.String(10), nullable=False)
+
+    # Request details
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    endpoint = db.Column(db.String(100), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    status_code = db.Column(db.Integer)
+
+    # Summary
+    duration_ms = db.Column(db.Float)
+    sample_count = db.Column(db.Integer, default=0)
+    sql_count = db.Column(db.Integer, default=0)
+    sql_ms = db.Column(db.Float, default=0)
+    peak_memory = db.Column(db.BigInteger)  # Bytes, memory mode only
+
+    # Result file under PROFILE_FOLDER
+    result_file = db.Column(db.String(255), nullable=False)
+
+    # Relationships
+    user = db.relationship('User')
+
+    def __repr__(self):
+        return f'<Profile {self.id} {self.mode} {self.method} {self.path}>'
@@ -0,0 +1,28 @@
+from datetime import datetime
+from models import db
+
+
+class ProfileTrigger(db.Model):
+    """Admin request to profile the next requests made by a given user"""
+    __tablename__ = 'profile_triggers'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    endpoint = db.Column(db.String(100))  # Only matching requests when set, e.g. 'customer.files'
+    mode = db.Column(db.String(10), nullable=False)
+    remaining = db.Column(db.Integer, nullable=False, default=1)
+
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    # Relationships
+    user = db.relationship('User', foreign_keys=[user_id])
+    created_by = db.relationship('User', foreign_keys=[created_by_id])
+
+    def is_active(self):
+        """Check if the trigger still has captures left and has not expired"""
+        return self.remaining > 0 and self.expires_at > datetime.utcnow()
+
+    def __repr__(self):
+        return f'<ProfileTrigger user_id={self.user_id} endpoint={self.endpoint} remaining={self.remaining}>'
@@ -0,0 +1,38 @@
+from datetime import datetime
+from models import db
+
+
+class SlowQuery(db.Model):
+    """SQL statement that ran longer than SLOW_QUERY_THRESHOLD_MS, with its query plan"""
+    __tablename__ = 'slow_queries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    bind = db.Column(db.String(50), nullable=False)
+
+    # Statements differing only in literal values share a fingerprint
+    fingerprint = db.Column(db.String(16), nullable=False, index=True)
+    normalized_sql = db.Column(db.Text, nullable=False)
+    params_fingerprint = db.Column(db.String(16))  # Hash of the bound values, never the values themselves
+    duration_ms = db.Column(db.Float, nullable=False)
+
+    # Where it ran
+    endpoint = db.Column(db.String(100))  # Route endpoint or job name
+    call_site = db.Column(db.String(255))  # First application frame, e.g. admin/routes.py:42 in customers
+
+    plan = db.Column(db.Text)  # EXPLAIN / EXPLAIN QUERY PLAN output
+
+    def has_table_scan(self):
+        """Check if the plan reads a whole table (SQLite SCAN without an index, PostgreSQL Seq Scan)"""
+        if not self.plan:
+            return False
+        for line in self.plan.splitlines():
+            line = line.strip()
+            if 'Seq Scan' in line:
+                return True
+            if line.startswith('SCAN') and 'USING' not in line and 'CONSTANT ROW' not in line:
+                return True
+        return False
+
+    def __repr__(self):
+        return f'<SlowQuery {self.fingerprint} {self.duration_ms:.1f}ms>'
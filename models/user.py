@@ -2,6 +2,7 @@ from datetime import datetime
 from models import db
 from flask_login import UserMixin
 import bcrypt
+from utils.metrics import PASSWORD_HASH_SECONDS
 
 
 class User(UserMixin, db.Model):
@@ -44,11 +45,13 @@ class User(UserMixin, db.Model):
     
     def set_password(self, password):
         """Hash and set the user's password"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        with PASSWORD_HASH_SECONDS.labels('hash').time():
+            self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     
     def check_password(self, password):
         """Verify the user's password"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        with PASSWORD_HASH_SECONDS.labels('check').time():
+            return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
     
     def lock_account(self, duration):
         """Lock the user account for a specified duration"""
@@ -0,0 +1,269 @@
+"""Traffic replay - re-issue recorded logins and downloads against a staging instance and compare builds"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import Browser, Stats, login, percentile, compare, start_server
+
+
+class Event:
+    __slots__ = ('timestamp', 'kind', 'username', 'file_id', 'success', 'user_agent', 'ip_address')
+
+    def __init__(self, timestamp, kind, username, file_id, success, user_agent, ip_address):
+        self.timestamp = timestamp
+        self.kind = kind
+        self.username = username
+        self.file_id = file_id
+        self.success = success
+        self.user_agent = user_agent
+        self.ip_address = ip_address
+
+
+def load_events(config_name, window_from, window_to, last_minutes, include_failed_logins):
+    """
+    Customer logins and downloads recorded in a time window, grouped per user in time order
+
+    Without --from/--to the window is the last `last_minutes` before the
+    newest recorded event. Returns: (window start, window end, {username: [Event]}, {username: MFA secret})
+    """
+    from sqlalchemy import select, func
+    from app import create_app
+    from models import db
+    from models.user import User
+    from models.download_log import DownloadLog
+    from models.login_attempt import LoginAttempt
+
+    app = create_app(config_name)
+    with app.app_context():
+        if window_to is None:
+            window_to = max(filter(None, [
+                db.session.execute(select(func.max(DownloadLog.download_date))).scalar(),
+                db.session.execute(select(func.max(LoginAttempt.timestamp))).scalar(),
+            ]), default=datetime.utcnow())
+        if window_from is None:
+            window_from = window_to - timedelta(minutes=last_minutes)
+
+        logins = select(LoginAttempt.timestamp, LoginAttempt.username, LoginAttempt.success,
+                        LoginAttempt.user_agent, LoginAttempt.ip_address)\
+            .join(User, User.username == LoginAttempt.username)\
+            .where(User.role == 'customer', LoginAttempt.timestamp.between(window_from, window_to))
+        if not include_failed_logins:
+            logins = logins.where(LoginAttempt.success == True)
+
+        downloads = select(DownloadLog.download_date, User.username, DownloadLog.file_id, DownloadLog.success,
+                           DownloadLog.user_agent, DownloadLog.ip_address)\
+            .join(User, User.id == DownloadLog.user_id)\
+            .where(User.role == 'customer', DownloadLog.download_date.between(window_from, window_to))
+
+        sessions = {}
+        for timestamp, username, success, user_agent, ip_address in db.session.execute(logins):
+            sessions.setdefault(username, []).append(
+                Event(timestamp, 'login', username, None, success, user_agent, ip_address))
+        for timestamp, username, file_id, success, user_agent, ip_address in db.session.execute(downloads):
+            sessions.setdefault(username, []).append(
+                Event(timestamp, 'download', username, file_id, success, user_agent, ip_address))
+
+        secrets = dict(db.session.execute(
+            select(User.username, User.mfa_secret)
+            .where(User.mfa_enabled == True, User.username.in_(list(sessions)))
+        ).all()) if sessions else {}
+
+    for events in sessions.values():
+        # Logins sort before downloads recorded in the same second
+        events.sort(key=lambda event: (event.timestamp, event.kind != 'login'))
+    return window_from, window_to, sessions, secrets
+
+
+class Schedule:
+    """Maps recorded timestamps to wall-clock times at a given speed (0 = as fast as possible)"""
+
+    def __init__(self, window_from, speed):
+        self.window_from = window_from
+        self.speed = speed
+        self.origin = time.time()
+        self.lock = threading.Lock()
+        self.lag_ms = []
+
+    def due(self, timestamp):
+        if not self.speed:
+            return self.origin
+        return self.origin + (timestamp - self.window_from).total_seconds() / self.speed
+
+    def wait_until(self, timestamp):
+        """Sleep until an event is due; events that start late add to the lag statistics"""
+        if not self.speed:
+            return
+        delay = self.due(timestamp) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            with self.lock:
+                self.lag_ms.append(-delay * 1000)
+
+
+def replay_user(username, events, options, stats, schedule, slots, mfa_secret):
+    """Replay one user's events in their recorded order on one browser session"""
+    account = {'username': username, 'password': options.password, 'mfa_secret': mfa_secret}
+    browser = Browser(options.url, stats)
+    logged_in = False
+
+    with slots:
+        for event in events:
+            schedule.wait_until(event.timestamp)
+            browser.headers = {'User-Agent': event.user_agent or 'replay_traffic.py'}
+            if options.forward_ip and event.ip_address:
+                browser.headers['X-Forwarded-For'] = event.ip_address
+
+            if event.kind == 'login':
+                browser.close()
+                if event.success:
+                    logged_in = login(browser, account)
+                else:
+                    logged_in = False
+                    login(browser, dict(account, password=options.password + '-wrong', mfa_secret=None))
+                continue
+
+            if not logged_in:
+                # The session started before the window; sign in the way the user did then
+                logged_in = login(browser, account)
+                if not logged_in:
+                    continue
+            browser.get(f"/customer/download/{event.file_id}")
+
+    browser.close()
+
+
+def print_comparison(before, after):
+    """Side-by-side p50 / p95 / error rate per endpoint for two result files"""
+    print(f"{'endpoint':<40} {before['label'][:17]:>17} {after['label'][:17]:>17} {'p95 change':>11}")
+    print(f"{'':<40} {'p50/p95 ms  err%':>17} {'p50/p95 ms  err%':>17}")
+    for label in sorted(set(before['endpoints']) | set(after['endpoints'])):
+        a, b = before['endpoints'].get(label), after['endpoints'].get(label)
+
+        def cell(e):
+            return f"{e['p50_ms']:.0f}/{e['p95_ms']:.0f} {e['error_rate'] * 100:5.1f}" if e else '-'
+
+        change = f"{(b['p95_ms'] / a['p95_ms'] - 1) * 100:+.0f}%" if a and b and a['p95_ms'] else ''
+        print(f"{label[:40]:<40} {cell(a):>17} {cell(b):>17} {change:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded customer traffic against a portal instance.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Instance to replay against')
+    parser.add_argument('--start', action='store_true', help='Start the app locally (rate limits off) for the run')
+    parser.add_argument('--config', default=os.environ.get('FLASK_ENV', 'development'),
+                        help='Configuration whose database holds the recorded traffic (default: FLASK_ENV or development)')
+    parser.add_argument('--from', dest='window_from', type=datetime.fromisoformat,
+                        help='Window start (UTC, ISO format)')
+    parser.add_argument('--to', dest='window_to', type=datetime.fromisoformat, help='Window end (UTC, ISO format)')
+    parser.add_argument('--last-minutes', type=float, default=60,
+                        help='Window length ending at the newest recorded event when --from is not given')
+    parser.add_argument('--speed', default='1', help="Replay speed: 1, 10, ... or 'max'")
+    parser.add_argument('--max-concurrency', type=int, default=200,
+                        help='Users replaying at once; users waiting for a slot start late')
+    parser.add_argument('--password', default='Customer@123', help='Password of the replayed accounts on the target')
+    parser.add_argument('--include-failed-logins', action='store_true',
+                        help='Also replay failed logins (as wrong passwords; may lock accounts)')
+    parser.add_argument('--forward-ip', action='store_true', help='Send each recorded IP as X-Forwarded-For')
+    parser.add_argument('--label', default='replay', help='Name of the build under test, shown in comparisons')
+    parser.add_argument('--output', default='replay_results.json', help='Where to write the results')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='Compare two result files instead of replaying')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown when comparing')
+    options = parser.parse_args()
+
+    if options.compare:
+        with open(options.compare[0]) as f:
+            before = json.load(f)
+        with open(options.compare[1]) as f:
+            after = json.load(f)
+        print_comparison(before, after)
+        regressions = compare(after, before, options.tolerance)
+        if regressions:
+            print(f"\nRegressions in {after['label']}:")
+            for regression in regressions:
+                print(f"  ✗ {regression}")
+            return 1
+        print(f"\nNo regressions in {after['label']}")
+        return 0
+
+    speed = 0 if options.speed == 'max' else float(options.speed)
+    window_from, window_to, sessions, secrets = load_events(
+        options.config, options.window_from, options.window_to, options.last_minutes, options.include_failed_logins)
+    total_events = sum(len(events) for events in sessions.values())
+    if not total_events:
+        print(f"✗ No recorded customer traffic between {window_from} and {window_to}")
+        return 1
+
+    server = start_server(options.config, options.url) if options.start else None
+    print(f"Replaying {total_events} events from {len(sessions)} users ({window_from} - {window_to}) "
+          f"against {options.url} at {'maximum speed' if not speed else f'{options.speed}x'}")
+
+    stats = Stats()
+    slots = threading.BoundedSemaphore(options.max_concurrency)
+    schedule = Schedule(window_from, speed)
+    threads = []
+    try:
+        # Start each user's thread when their first event is due, so idle users hold no thread
+        for username, events in sorted(sessions.items(), key=lambda item: item[1][0].timestamp):
+            delay = schedule.due(events[0].timestamp) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            thread = threading.Thread(target=replay_user, daemon=True,
+                                      args=(username, events, options, stats, schedule, slots,
+                                            secrets.get(username)))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    elapsed = time.time() - schedule.origin
+    endpoints = stats.summary(elapsed)
+    total = sum(e['requests'] for e in endpoints.values())
+    lag = sorted(schedule.lag_ms)
+    results = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'label': options.label,
+        'url': options.url,
+        'speed': options.speed,
+        'window': [window_from.isoformat(), window_to.isoformat()],
+        'events': total_events,
+        'users': len(sessions),
+        'duration': elapsed,
+        'lag': {'late_events': len(lag), 'p95_ms': percentile(lag, 95), 'max_ms': lag[-1] if lag else 0.0},
+        'totals': {
+            'requests': total,
+            'rps': total / elapsed,
+            'error_rate': sum(e['error_rate'] * e['requests'] for e in endpoints.values()) / total if total else 0,
+        },
+        'endpoints': endpoints,
+    }
+
+    print(f"\n{'endpoint':<46} {'reqs':>6} {'req/s':>7} {'err%':>6} {'p50':>7} {'p95':>7} {'p99':>7}")
+    for label, e in endpoints.items():
+        print(f"{label[:46]:<46} {e['requests']:>6} {e['rps']:>7.1f} {e['error_rate'] * 100:>6.1f} "
+              f"{e['p50_ms']:>7.1f} {e['p95_ms']:>7.1f} {e['p99_ms']:>7.1f}")
+    print(f"\n{total} requests in {elapsed:.1f}s, {results['totals']['error_rate']:.2%} errors (latencies in ms)")
+    if speed:
+        print(f"{len(lag)} events started late (p95 {results['lag']['p95_ms']:.0f} ms): "
+              f"large values mean the replay could not keep up with {options.speed}x")
+
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {options.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
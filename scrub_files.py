@@ -0,0 +1,46 @@
+"""Integrity scrub script - verify every stored file against its size and checksum"""
+import argparse
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from utils.integrity import run_scrub
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify stored files against recorded sizes and checksums.')
+    parser.add_argument('--config', default=os.environ.get('FLASK_ENV', 'development'),
+                        help='Configuration name (default: FLASK_ENV or development)')
+    parser.add_argument('--workers', type=int, help='Number of scrubber threads')
+    parser.add_argument('--max-mb-per-second', type=int,
+                        help='Total read bandwidth cap across threads (0 = unthrottled)')
+    parser.add_argument('--file-id', type=int, action='append', dest='file_ids',
+                        help='Only check this file (may be repeated)')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+
+    max_bytes_per_second = None
+    if args.max_mb_per_second is not None:
+        max_bytes_per_second = args.max_mb_per_second * 1024 * 1024
+
+    with app.app_context():
+        print("Scrubbing stored files...")
+        summary = run_scrub(max_workers=args.workers,
+                            max_bytes_per_second=max_bytes_per_second,
+                            file_ids=args.file_ids)
+
+        for status, count in sorted(summary.items()):
+            print(f"  {status}: {count}")
+
+        failures = sum(count for status, count in summary.items() if status != 'ok')
+        print(f"\n{sum(summary.values())} file(s) checked, {failures} problem(s) found")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
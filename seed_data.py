@@ -0,0 +1,415 @@
+"""Synthetic data seeding - bulk-generate production-sized volumes of customers, files, assignments and logs"""
+import argparse
+import base64
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import select, func, text
+from app import create_app
+from config import config
+from models import db
+from models.user import User
+from models.file import File
+from models.file_assignment import FileAssignment
+from models.download_log import DownloadLog
+from models.login_attempt import LoginAttempt
+from utils.log_ingest import bulk_insert
+from utils.database import analyze_database, create_missing_indexes
+from utils.file_handler import get_file_category_key
+from migrate_database import reset_sequence
+
+
+CATEGORIES = ['User Manual', 'Technical Specification', 'Installation Guide', 'Service Bulletin',
+              'Parts Catalog', 'Safety Data Sheet', 'Firmware', 'Wiring Diagram']
+FILE_TYPES = ['pdf'] * 8 + ['docx', 'xlsx', 'zip', 'png']
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_4) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148',
+    'curl/8.5.0',
+]
+LOGIN_FAILURES = ['Invalid password'] * 8 + ['Account locked', 'Invalid MFA code']
+DOWNLOAD_ERRORS = ['Token expired', 'File not assigned', 'Storage unavailable']
+
+# Relative activity per hour of day (UTC): office hours with a lunch dip
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 14, 18, 20, 19, 12, 16, 19, 18, 14, 9, 5, 4, 3, 2, 2, 1]
+WEEKEND_ACTIVITY = 0.25  # Weekend days see a quarter of a weekday's traffic
+
+MAX_FILE_SIZE = 500 * 1024 * 1024
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative Zipf weights for ranks 1..n, for random.choices(cum_weights=...)"""
+    weights, total = [], 0.0
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** exponent
+        weights.append(total)
+    return weights
+
+
+class RowGenerator:
+    """
+    Builds the rows of one chunk at a time
+
+    Each chunk seeds its own random generator from (seed, kind, chunk), so
+    worker processes can build chunks in any order and a given seed always
+    produces the same data. Popularity follows a Zipf distribution over a
+    shuffled ranking, so busy customers and hot files are spread across
+    the id range rather than being the lowest ids.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.now = params['now']
+        self.customer_ids = list(range(params['first_user_id'], params['first_user_id'] + params['customers']))
+        self.file_ids = list(range(params['first_file_id'], params['first_file_id'] + params['files']))
+
+        ranking = random.Random(params['seed'])
+        self.customers_by_rank = self.customer_ids[:]
+        ranking.shuffle(self.customers_by_rank)
+        self.files_by_rank = self.file_ids[:]
+        ranking.shuffle(self.files_by_rank)
+
+        self.customer_weights = zipf_cum_weights(params['customers'], params['zipf'])
+        self.file_weights = zipf_cum_weights(params['files'], params['zipf'])
+        self.hour_weights = list(accumulate(HOUR_WEIGHTS))
+
+    def _rng(self, kind, chunk):
+        return random.Random(f"{self.params['seed']}-{kind}-{chunk}")
+
+    def _timestamp(self, rng):
+        """A moment on one of the `days` days before today, weighted by weekday and hour of day"""
+        while True:
+            # Whole days before today, so picking the hour never lands in the future
+            day = self.now - timedelta(days=rng.randrange(self.params['days']) + 1)
+            if day.weekday() < 5 or rng.random() < WEEKEND_ACTIVITY:
+                break
+        hour = rng.choices(range(24), cum_weights=self.hour_weights)[0]
+        return day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60), microsecond=0)
+
+    def _pick_customers(self, rng, count):
+        return rng.choices(self.customers_by_rank, cum_weights=self.customer_weights, k=count)
+
+    def _pick_files(self, rng, count):
+        return rng.choices(self.files_by_rank, cum_weights=self.file_weights, k=count)
+
+    def customers(self, chunk, start, count):
+        rng = self._rng('customers', chunk)
+        rows = []
+        for user_id in self.customer_ids[start:start + count]:
+            created = self._timestamp(rng)
+            mfa_secret = None
+            if rng.random() < self.params['mfa_fraction']:
+                mfa_secret = base64.b32encode(rng.randbytes(20)).decode()  # 32 characters, like pyotp.random_base32()
+            rows.append({
+                'id': user_id,
+                'username': f'seed_customer{user_id}',
+                'email': f'seed_customer{user_id}@example.test',
+                'password_hash': self.params['password_hash'],
+                'role': 'customer',
+                'company_name': f'Company {user_id}',
+                'contact_info': None,
+                'is_active': rng.random() < 0.97,
+                'is_locked': False,
+                'failed_login_attempts': 0,
+                'mfa_enabled': mfa_secret is not None,
+                'mfa_secret': mfa_secret,
+                'terms_accepted': True,
+                'terms_accepted_date': created,
+                'created_at': created,
+                'updated_at': created,
+            })
+        return rows
+
+    def files(self, chunk, start, count):
+        rng = self._rng('files', chunk)
+        blob_root = self.params['blob_root']
+        rows = []
+        for file_id in self.file_ids[start:start + count]:
+            category = rng.choice(CATEGORIES)
+            file_type = rng.choice(FILE_TYPES)
+            product = f'Model {rng.randrange(1, 400)}'
+            version = f'v{rng.randrange(1, 6)}.{rng.randrange(10)}'
+            # Log-normal sizes: median around 2 MB with a long tail of large bundles
+            size = min(MAX_FILE_SIZE, max(1024, int(rng.lognormvariate(math.log(2 * 1024 * 1024), 1.2))))
+            key = f"{get_file_category_key(category)}/seed_{file_id}.{file_type}"
+            uploaded = self._timestamp(rng)
+
+            if blob_root:
+                # Sparse file: the right size on paper, next to no disk space
+                path = os.path.join(blob_root, *key.split('/'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.truncate(size)
+
+            rows.append({
+                'id': file_id,
+                'filename': f'seed_{file_id}.{file_type}',
+                'original_filename': f'{product} {category} {version}.{file_type}',
+                'file_path': key,
+                'storage_backend': 'local',
+                'storage_tier': 'hot',
+                'is_compressed': False,
+                'file_size': size,
+                'file_type': file_type,
+                'checksum': None,  # Backfilled by the integrity scrubber
+                'category': category,
+                'product_type': product,
+                'version': version,
+                'upload_date': uploaded,
+                'uploaded_by_id': self.params['admin_id'],
+                'is_active': rng.random() < 0.98,
+                'created_at': uploaded,
+                'updated_at': uploaded,
+            })
+        return rows
+
+    def assignments(self, chunk, start, count):
+        """Assignments for customers [start, start + count): exponential counts, Zipf-popular files"""
+        rng = self._rng('assignments', chunk)
+        mean = self.params['assignments'] / self.params['customers']
+        limit = max(1, self.params['files'] // 2)
+        rows = []
+        for user_id in self.customer_ids[start:start + count]:
+            wanted = min(limit, int(rng.expovariate(1 / mean)) if mean else 0)
+            picked = set()
+            while len(picked) < wanted:
+                picked.update(self._pick_files(rng, wanted - len(picked)))
+            for file_id in picked:
+                assigned = self._timestamp(rng)
+                rows.append({
+                    'user_id': user_id,
+                    'file_id': file_id,
+                    'assigned_date': assigned,
+                    'assigned_by_id': self.params['admin_id'],
+                    'expiration_date': assigned + timedelta(days=365) if rng.random() < 0.1 else None,
+                    'is_active': rng.random() < 0.95,
+                })
+        return rows
+
+    def downloads(self, chunk, start, count):
+        rng = self._rng('downloads', chunk)
+        rows = []
+        for user_id, file_id in zip(self._pick_customers(rng, count), self._pick_files(rng, count)):
+            success = rng.random() < 0.97
+            rows.append({
+                'user_id': user_id,
+                'file_id': file_id,
+                'download_date': self._timestamp(rng),
+                'ip_address': f'10.{user_id % 256}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+                'user_agent': rng.choice(USER_AGENTS),
+                'success': success,
+                'error_message': None if success else rng.choice(DOWNLOAD_ERRORS),
+                'served_tier': 'hot' if success else None,
+            })
+        return rows
+
+    def logins(self, chunk, start, count):
+        rng = self._rng('logins', chunk)
+        rows = []
+        for user_id in self._pick_customers(rng, count):
+            success = rng.random() < 0.9
+            rows.append({
+                'username': f'seed_customer{user_id}',
+                'ip_address': f'10.{user_id % 256}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+                'user_agent': rng.choice(USER_AGENTS),
+                'success': success,
+                'failure_reason': None if success else rng.choice(LOGIN_FAILURES),
+                'timestamp': self._timestamp(rng),
+            })
+        return rows
+
+
+# Per-process generator, set up once by the pool initializer
+_generator = None
+
+
+def _init_worker(params):
+    global _generator
+    _generator = RowGenerator(params)
+
+
+def _build(task):
+    kind, chunk, start, count = task
+    return kind, getattr(_generator, kind)(chunk, start, count)
+
+
+def plan_tasks(kind, total, chunk_size):
+    """(kind, chunk, start, count) for each chunk of a table"""
+    return [(kind, chunk, start, min(chunk_size, total - start))
+            for chunk, start in enumerate(range(0, total, chunk_size))]
+
+
+def generate(tasks, params, workers):
+    """Yield (kind, rows) in task order, building up to 2 * workers chunks ahead of the inserts"""
+    if workers <= 1:
+        _init_worker(params)
+        for task in tasks:
+            yield _build(task)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(params,)) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_build, (task,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def seeding_config(base):
+    """The chosen configuration with features that would log or trace every bulk insert turned off"""
+    class SeedConfig(base):
+        SLOW_QUERY_ENABLED = False
+        PROFILE_ENABLED = False
+        TRACING_ENABLED = False
+    return SeedConfig
+
+
+def drop_indexes(connection, tables):
+    """Drop secondary indexes so bulk inserts skip index maintenance; returns their names"""
+    dropped = []
+    for table in tables:
+        for index in table.indexes:
+            index.drop(connection, checkfirst=True)
+            dropped.append(index.name)
+    return dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill the database with large volumes of realistic synthetic data.')
+    parser.add_argument('--config', default=os.environ.get('FLASK_ENV', 'development'),
+                        help='Configuration to seed (default: FLASK_ENV or development)')
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--assignments', type=int, default=20000, help='Approximate total; spread per customer')
+    parser.add_argument('--downloads', type=int, default=200000)
+    parser.add_argument('--logins', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=365, help='Spread timestamps over this many past days')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Popularity skew of customers and files')
+    parser.add_argument('--blobs', action='store_true', help='Create sparse blobs in the upload folder')
+    parser.add_argument('--password', default='Customer@123', help='Password shared by every seeded customer')
+    parser.add_argument('--mfa-fraction', type=float, default=0.1,
+                        help='Share of customers with MFA turned on (secrets are stored as usual for load tests)')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='Rows per generated chunk and transaction')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) - 1),
+                        help='Generator processes (default: one per CPU, less the inserting process)')
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help='Drop assignment and log indexes during the load and rebuild them afterwards')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+    args = parser.parse_args()
+
+    config['seed'] = seeding_config(config[args.config])
+    app = create_app('seed')
+
+    with app.app_context():
+        db.create_all()
+        admin_id = db.session.execute(select(func.min(User.id)).where(User.role == 'admin')).scalar()
+        if admin_id is None:
+            print("✗ No admin account found (run init_db.py first)")
+            return 1
+
+        # One hash for every customer: bcrypt per row would take hours at this scale
+        template = User()
+        template.set_password(args.password)
+
+        params = {
+            'seed': args.seed,
+            'now': datetime.utcnow(),
+            'customers': args.customers,
+            'files': args.files,
+            'assignments': args.assignments,
+            'days': args.days,
+            'zipf': args.zipf,
+            'mfa_fraction': args.mfa_fraction,
+            'admin_id': admin_id,
+            'password_hash': template.password_hash,
+            'first_user_id': (db.session.execute(select(func.max(User.id))).scalar() or 0) + 1,
+            'first_file_id': (db.session.execute(select(func.max(File.id))).scalar() or 0) + 1,
+            'blob_root': app.config['UPLOAD_FOLDER'] if args.blobs else None,
+        }
+        db.session.remove()
+
+        tables = {
+            'customers': User.__table__,
+            'files': File.__table__,
+            'assignments': FileAssignment.__table__,
+            'downloads': DownloadLog.__table__,
+            'logins': LoginAttempt.__table__,
+        }
+        # Assignment chunks cover whole customers, sized to about chunk-size rows each
+        per_customer = max(1, args.assignments // max(1, args.customers))
+        tasks = (plan_tasks('customers', args.customers, args.chunk_size)
+                 + plan_tasks('files', args.files, args.chunk_size)
+                 + plan_tasks('assignments', args.customers, max(1, args.chunk_size // per_customer))
+                 + plan_tasks('downloads', args.downloads, args.chunk_size)
+                 + plan_tasks('logins', args.logins, args.chunk_size))
+
+        print(f"Seeding {db.engine.url.render_as_string(hide_password=True)} with {args.workers} worker(s)")
+        started = time.time()
+        inserted = dict.fromkeys(tables, 0)
+        table_started = {}
+
+        # Rebuild dropped indexes even when the load fails, so the database is never left without them
+        try:
+            with db.engine.connect() as connection:
+                if connection.dialect.name == 'sqlite':
+                    # Bulk load: a crash mid-seed only loses seed data, so skip the per-commit fsync
+                    connection.execute(text("PRAGMA synchronous=OFF"))
+                if args.defer_indexes:
+                    dropped = drop_indexes(connection,
+                                           [tables['assignments'], tables['downloads'], tables['logins']])
+                    connection.commit()
+                    print(f"  Dropped {len(dropped)} indexes until the load finishes")
+
+                current = None
+                for kind, rows in generate(tasks, params, args.workers):
+                    if kind != current:
+                        if current is not None:
+                            print(f"  ✓ {current}: {inserted[current]} rows "
+                                  f"({time.time() - table_started[current]:.1f}s)")
+                        current = kind
+                        table_started[kind] = time.time()
+
+                    inserted[kind] += bulk_insert(connection, tables[kind], rows)
+                    connection.commit()  # One transaction per chunk keeps memory and lock time flat
+
+                    rate = inserted[kind] / max(time.time() - table_started[kind], 1e-6)
+                    print(f"  {kind}: {inserted[kind]} rows ({rate:,.0f} rows/s)", end='\r')
+
+                if current is not None:
+                    print(f"  ✓ {current}: {inserted[current]} rows ({time.time() - table_started[current]:.1f}s)")
+
+                if connection.dialect.name == 'postgresql':
+                    # Customers and files were inserted with explicit ids
+                    reset_sequence(connection, User.__table__)
+                    reset_sequence(connection, File.__table__)
+                    connection.commit()
+        finally:
+            if args.defer_indexes:
+                index_started = time.time()
+                rebuilt, _ = create_missing_indexes(db.engine, db.metadata)
+                print(f"  ✓ Rebuilt {len(rebuilt)} indexes ({time.time() - index_started:.1f}s)")
+
+        print("\nRefreshing planner statistics...")
+        analyze_database()
+
+    print(f"\nSeeded {sum(inserted.values())} rows in {time.time() - started:.1f}s")
+    print(f"Seeded customers log in as seed_customer<id> with password {args.password}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
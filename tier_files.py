@@ -0,0 +1,49 @@
+"""Storage tiering script - move rarely downloaded files to the cold tier"""
+import argparse
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from utils.tiering import plan_demotions, run_tiering, promote_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move unpopular files to cold storage, or promote a file back.')
+    parser.add_argument('--config', default=os.environ.get('FLASK_ENV', 'development'),
+                        help='Configuration name (default: FLASK_ENV or development)')
+    parser.add_argument('--promote', type=int, metavar='FILE_ID', action='append',
+                        help='Promote this file back to the hot tier (may be repeated)')
+    parser.add_argument('--dry-run', action='store_true', help='List files that would be demoted')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+
+    with app.app_context():
+        if args.promote:
+            for file_id in args.promote:
+                moved = promote_file(file_id)
+                print(f"  {'✓ Promoted' if moved else '- Not cold:'} file {file_id}")
+            return 0
+
+        if args.dry_run:
+            demotions = plan_demotions()
+            for file in demotions:
+                print(f"  would demote {file.original_filename} ({file.get_file_size_formatted()})")
+            print(f"\n{len(demotions)} file(s) would be demoted")
+            return 0
+
+        print("Moving cold files...")
+        summary = run_tiering()
+        print(f"\n{summary['demoted']} file(s) demoted ({summary['bytes'] / (1024 * 1024):.1f} MB), "
+              f"{summary['failed']} failed")
+        if summary['demoted']:
+            print(f"Replaced blobs will be deleted by the job worker after {app.config['TIER_DELETE_GRACE_SECONDS']}s")
+
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
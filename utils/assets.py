@@ -0,0 +1,72 @@
+"""Fingerprinted static assets - hashed URLs from the build_assets.py manifest and precompressed responses"""
+import json
+import mimetypes
+import os
+from flask import request, send_from_directory
+
+MANIFEST_PATH = os.path.join('dist', 'manifest.json')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # Preferred first
+IMMUTABLE_MAX_AGE = 31536000  # One year: a fingerprinted file never changes
+
+
+def load_manifest(static_folder):
+    """Source path -> fingerprinted path, or None when no build is present"""
+    path = os.path.join(static_folder, MANIFEST_PATH)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def init_assets(app):
+    """
+    Serve the fingerprinted build when there is one
+
+    url_for('static', filename='css/style.css') then returns the hashed
+    file's URL, and hashed files are sent precompressed (when the client
+    accepts it) with immutable cache headers. Without a build, or with
+    ASSETS_USE_MANIFEST off, static files are served as before.
+    """
+    if not app.config['ASSETS_USE_MANIFEST']:
+        return
+
+    manifest = load_manifest(app.static_folder)
+    if not manifest:
+        return
+
+    # Look the precompressed variants up once instead of on every request
+    variants = {
+        target: [(encoding, suffix) for encoding, suffix in ENCODINGS
+                 if os.path.exists(os.path.join(app.static_folder, target + suffix))]
+        for target in manifest.values()
+    }
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    serve_static = app.view_functions['static']
+
+    def static(filename):
+        if filename not in variants:
+            return serve_static(filename=filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in variants[filename]:
+            if request.accept_encodings[encoding]:
+                response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype,
+                                               max_age=IMMUTABLE_MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(app.static_folder, filename, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
@@ -0,0 +1,84 @@
+"""Dynamic response compression - gzip/brotli for rendered pages and JSON, with weak ETags and 304s"""
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def available_encodings():
+    """Content codings this process can produce"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, level):
+    """Compress a body with 'gzip' or 'br' at the given level (brotli quality)"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def init_compression(app):
+    """
+    Compress buffered responses and answer unchanged pages with 304
+
+    GET responses with an ETAG_MIMETYPES type get a weak ETag of their
+    uncompressed body and `Cache-Control: private, no-cache`, so browsers
+    revalidate and receive 304 Not Modified when the page is unchanged.
+    Bodies with a COMPRESS_MIMETYPES type and a size between the two
+    thresholds are then compressed when the client accepts it and the
+    result is smaller. send_file and other streamed responses (downloads,
+    static files) are never touched.
+    """
+    config = app.config
+    if not config['COMPRESS_ENABLED'] and not config['RESPONSE_ETAGS']:
+        return
+
+    compress_types = frozenset(config['COMPRESS_MIMETYPES'])
+    etag_types = frozenset(config['ETAG_MIMETYPES'])
+    encodings = [encoding for encoding in config['COMPRESS_ALGORITHMS'] if encoding in available_encodings()]
+    levels = {'gzip': config['COMPRESS_GZIP_LEVEL'], 'br': config['COMPRESS_BROTLI_QUALITY']}
+
+    @app.after_request
+    def compress_response(response):
+        from utils.metrics import record_compression
+
+        if response.direct_passthrough or response.is_streamed or response.status_code != 200:
+            return response
+
+        if (config['RESPONSE_ETAGS'] and request.method == 'GET' and response.mimetype in etag_types
+                and 'ETag' not in response.headers):
+            # Weak: the gzip, brotli and identity bodies all share it
+            response.add_etag(weak=True)
+            if 'Cache-Control' not in response.headers:
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+
+        if (not config['COMPRESS_ENABLED'] or response.mimetype not in compress_types
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        data = response.get_data()
+        if not config['COMPRESS_MIN_SIZE'] <= len(data) <= config['COMPRESS_MAX_SIZE']:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = next((encoding for encoding in encodings if request.accept_encodings[encoding]), None)
+        if encoding is None:
+            return response
+
+        compressed = compress(data, encoding, levels[encoding])
+        if len(compressed) >= len(data):
+            # Sent as is: count the bytes that went out, not the discarded attempt
+            record_compression(encoding, len(data), len(data))
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        record_compression(encoding, len(data), len(compressed))
+        return response
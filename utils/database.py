@@ -0,0 +1,426 @@
+"""Database engine configuration, read replica routing and maintenance"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, literal, make_url, text
+from sqlalchemy.sql import Select
+
+
+REPLICA_BIND = 'replica'
+
+
+def get_sqlite_pragmas(config):
+    """Return the PRAGMA statements applied to every new SQLite connection"""
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KB'])}",  # Negative = KiB, not pages
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if config['SQLITE_WAL']:
+        # Readers no longer block the writer, and vice versa
+        pragmas.insert(0, "PRAGMA journal_mode = WAL")
+
+    return pragmas
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """Run PRAGMA statements on a raw DB-API connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in pragmas:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def is_sqlite(uri):
+    """Check if a database URI points at SQLite"""
+    return uri.startswith('sqlite')
+
+
+def is_postgres(uri):
+    """Check if a database URI points at PostgreSQL"""
+    return uri.startswith('postgres')
+
+
+def normalize_database_uri(uri):
+    """Accept the postgres:// scheme some hosting providers hand out"""
+    if uri.startswith('postgres://'):
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def get_pool_limits(config):
+    """
+    Return (pool_size, max_overflow) for one process
+
+    With DB_MAX_CONNECTIONS set, the budget is split across DB_PROCESSES
+    so a fleet of workers cannot exhaust the server's max_connections.
+    """
+    pool_size = config['DB_POOL_SIZE']
+    max_overflow = config['DB_MAX_OVERFLOW']
+
+    if config['DB_MAX_CONNECTIONS']:
+        per_process = max(config['DB_MAX_CONNECTIONS'] // max(config['DB_PROCESSES'], 1), 1)
+        pool_size = min(pool_size, per_process)
+        max_overflow = min(max_overflow, per_process - pool_size)
+
+    return pool_size, max_overflow
+
+
+def get_replica_uri(app, uri):
+    """
+    Return the URI for the read-only replica bind, or None if there is none
+
+    DATABASE_REPLICA_URL wins; otherwise a SQLite file database gets a second,
+    read-only connection pool to the same file (SQLITE_READ_REPLICA).
+    """
+    if app.config['DATABASE_REPLICA_URL']:
+        return normalize_database_uri(app.config['DATABASE_REPLICA_URL'])
+
+    if not is_sqlite(uri) or not app.config['SQLITE_READ_REPLICA']:
+        return None
+
+    url = make_url(uri)
+    if not url.database or url.database == ':memory:' or url.query.get('uri'):
+        return None
+
+    return url.set(database=f"file:{url.database}", query={'mode': 'ro', 'uri': 'true'})\
+        .render_as_string(hide_password=False)
+
+
+def _build_engine_options(config, uri, options, pool_size=None, max_overflow=None, statement_timeout_ms=None):
+    """Fill in driver-specific engine options for one bind"""
+    connect_args = dict(options.get('connect_args') or {})
+
+    if pool_size is not None:
+        options.setdefault('pool_size', pool_size)
+        options.setdefault('max_overflow', max_overflow)
+
+    if is_sqlite(uri):
+        # Python's sqlite3 waits this long for a lock before raising "database is locked"
+        connect_args.setdefault('timeout', config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0)
+    elif is_postgres(uri):
+        options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+        options.setdefault('pool_pre_ping', True)  # Drop connections killed by failovers or idle timeouts
+
+        # Server-side limits so a runaway query or abandoned transaction cannot hold locks
+        connect_args.setdefault('options', (
+            f"-c statement_timeout={statement_timeout_ms} "
+            f"-c idle_in_transaction_session_timeout={config['DB_IDLE_IN_TRANSACTION_TIMEOUT_MS']}"
+        ))
+        connect_args.setdefault('application_name', config['COMPANY_NAME'].lower())
+    else:
+        return options
+
+    options['connect_args'] = connect_args
+    return options
+
+
+def init_engine_options(app):
+    """Set engine options and binds that must be in place before the engines are created"""
+    config = app.config
+    uri = normalize_database_uri(config['SQLALCHEMY_DATABASE_URI'])
+    config['SQLALCHEMY_DATABASE_URI'] = uri
+
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if is_postgres(uri):
+        pool_size, max_overflow = get_pool_limits(config)
+        options = _build_engine_options(config, uri, options, pool_size, max_overflow,
+                                        config['DB_STATEMENT_TIMEOUT_MS'])
+    else:
+        options = _build_engine_options(config, uri, options)
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    replica_uri = get_replica_uri(app, uri)
+    if replica_uri:
+        # Own pool and a tighter statement timeout, so reports cannot starve the primary
+        replica_options = _build_engine_options(config, replica_uri, {},
+                                                config['REPLICA_POOL_SIZE'],
+                                                config['REPLICA_MAX_OVERFLOW'],
+                                                config['REPLICA_STATEMENT_TIMEOUT_MS'])
+        replica_options['url'] = replica_uri
+
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = replica_options
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+def configure_engine(app, db):
+    """Apply per-connection settings and latency tracking to every bind (call after db.init_app)"""
+    with app.app_context():
+        engines = dict(db.engines)
+
+    primary = engines[None]
+    if primary.dialect.name == 'sqlite':
+        pragmas = get_sqlite_pragmas(app.config)
+
+        @event.listens_for(primary, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    replica = engines.get(REPLICA_BIND)
+    if replica is not None and replica.dialect.name == 'sqlite':
+        _configure_sqlite_replica(replica, app.config)
+
+    stats = app.extensions.setdefault('db_latency', {})
+    for key, engine in engines.items():
+        _track_latency(engine, key or 'primary', stats.setdefault(key or 'primary', LatencyStats()))
+
+
+def _configure_sqlite_replica(engine, config):
+    """Make a SQLite replica pool read-only and give it a statement timeout"""
+    pragmas = [pragma for pragma in get_sqlite_pragmas(config)
+               if 'journal_mode' not in pragma and 'synchronous' not in pragma]
+    pragmas.append("PRAGMA query_only = 1")
+    timeout = config['REPLICA_STATEMENT_TIMEOUT_MS'] / 1000.0
+
+    @event.listens_for(engine, 'connect')
+    def set_replica_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+        # SQLite has no statement_timeout; abort from the progress handler instead
+        deadline = connection_record.info['deadline'] = [None]
+        dbapi_connection.set_progress_handler(
+            lambda: 1 if deadline[0] and time.perf_counter() > deadline[0] else 0, 10000
+        )
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_deadline(conn, cursor, statement, parameters, context, executemany):
+        conn.info['deadline'][0] = time.perf_counter() + timeout
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def clear_deadline(conn, cursor, statement, parameters, context, executemany):
+        conn.info['deadline'][0] = None
+
+
+class LatencyStats:
+    """Statement latency for one bind, over the most recent statements"""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.recent.append(seconds)
+
+    def snapshot(self):
+        """Return count, average and recent p50/p95 in milliseconds"""
+        with self.lock:
+            recent = sorted(self.recent)
+            count, total, slowest = self.count, self.total, self.max
+
+        def percentile(percent):
+            if not recent:
+                return None
+            return recent[min(max(int(round(percent / 100.0 * len(recent))) - 1, 0), len(recent) - 1)] * 1000
+
+        return {
+            'count': count,
+            'avg_ms': total / count * 1000 if count else None,
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'max_ms': slowest * 1000 if count else None,
+        }
+
+
+# Callables(bind name, statement, parameters, seconds) told about every statement, e.g. metrics exporters
+_statement_observers = []
+
+
+def add_statement_observer(observer):
+    """Call observer(bind name, statement, parameters, seconds) after every SQL statement"""
+    if observer not in _statement_observers:
+        _statement_observers.append(observer)
+
+
+def _track_latency(engine, bind, stats):
+    """Record the execution time of every statement run on an engine"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        stats.record(elapsed)
+        for observer in _statement_observers:
+            observer(bind, statement, parameters, elapsed)
+
+    @event.listens_for(engine, 'handle_error')
+    def discard_timer(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('query_start'):
+            connection.info['query_start'].pop()
+
+
+def get_latency_stats():
+    """Return {bind name: latency snapshot} for the current app (requires app context)"""
+    return {name: stats.snapshot()
+            for name, stats in current_app.extensions.get('db_latency', {}).items()}
+
+
+def _replica_requested():
+    return has_app_context() and g.get('_db_use_replica', False)
+
+
+@contextmanager
+def replica_reads():
+    """Send plain SELECTs inside this block to the replica bind, if configured"""
+    previous = g.get('_db_use_replica', False)
+    g._db_use_replica = True
+    try:
+        yield
+    finally:
+        g._db_use_replica = previous
+
+
+def read_from_replica(f):
+    """Decorator routing a read-only view's queries to the replica bind"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with replica_reads():
+            return f(*args, **kwargs)
+
+    return decorated_function
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads made under read_from_replica to the replica bind
+
+    Flushes, INSERT/UPDATE/DELETE and SELECT ... FOR UPDATE always use the
+    primary, as does everything outside read_from_replica.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select)
+                and clause._for_update_arg is None and _replica_requested()):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def checkpoint_wal(mode='PASSIVE'):
+    """
+    Copy WAL pages back into the database file (requires app context)
+
+    PASSIVE never blocks readers or writers; TRUNCATE also resets the WAL
+    file to zero bytes but waits for active readers to finish.
+
+    Returns: (busy, wal pages, checkpointed pages)
+    """
+    from models import db
+
+    if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+
+    with db.engine.connect() as connection:
+        return tuple(connection.execute(text(f"PRAGMA wal_checkpoint({mode})")).one())
+
+
+def analyze_database():
+    """Refresh the query planner statistics (requires app context)"""
+    from models import db
+
+    with db.engine.connect() as connection:
+        connection.execute(text("ANALYZE"))
+        connection.commit()
+
+
+def _column_default_sql(column, dialect):
+    """A column's scalar Python default as a SQL literal, or None"""
+    if column.default is None or not column.default.is_scalar:
+        return None
+    return str(literal(column.default.arg, column.type).compile(dialect=dialect,
+                                                                compile_kwargs={'literal_binds': True}))
+
+
+def add_missing_columns(engine, metadata):
+    """
+    Add columns defined on the models but missing from existing tables
+
+    db.create_all() skips tables that already exist, so columns added to a
+    model later would otherwise never reach older databases. Nullable
+    columns are added as they are; NOT NULL ones only with a scalar default,
+    which also fills the existing rows. Anything else (primary keys, unique
+    columns, NOT NULL without a default) needs a hand-written migration and
+    is skipped.
+
+    Returns: (added "table.column" names, skipped "table.column" names)
+    """
+    added, skipped = [], []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        preparer = connection.dialect.identifier_preparer
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                name = f"{table.name}.{column.name}"
+                default = _column_default_sql(column, connection.dialect)
+                if column.primary_key or column.unique or (not column.nullable and default is None):
+                    skipped.append(name)
+                    continue
+
+                ddl = (f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} "
+                       f"{column.type.compile(dialect=connection.dialect)}")
+                if default is not None:
+                    ddl += f" DEFAULT {default}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                connection.execute(text(ddl))
+                added.append(name)
+
+    return added, skipped
+
+
+def create_missing_indexes(engine, metadata):
+    """
+    Create indexes defined on the models but missing from existing tables
+
+    db.create_all() skips tables that already exist, so indexes added to
+    a model later would otherwise never reach older databases. Indexes on
+    columns the table doesn't have yet (see add_missing_columns) are
+    skipped rather than failing the whole run.
+
+    Returns: (names of the indexes created, names of the indexes skipped)
+    """
+    created, skipped = [], []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if not {column.name for column in index.columns} <= columns:
+                    skipped.append(index.name)
+                    continue
+                index.create(connection)
+                created.append(index.name)
+
+    return created, skipped
@@ -3,21 +3,36 @@ from flask import current_app, render_template
 from flask_mail import Message
 from models import mail
 from threading import Thread
+import time
+from utils.metrics import EMAIL_SECONDS
+from utils.tracing import span, with_trace_context
+
+
+def deliver(msg):
+    """Send a message now, recording how long the SMTP handoff took"""
+    start = time.perf_counter()
+    try:
+        with span('email.send', **{'email.subject': msg.subject, 'email.recipients': len(msg.recipients)}):
+            mail.send(msg)
+    except Exception:
+        EMAIL_SECONDS.labels('error').observe(time.perf_counter() - start)
+        raise
+    EMAIL_SECONDS.labels('sent').observe(time.perf_counter() - start)
 
 
 def send_async_email(app, msg):
     """Send email asynchronously"""
     with app.app_context():
         try:
-            mail.send(msg)
+            deliver(msg)
         except Exception as e:
             # Log error (in production, use proper logging)
             print(f"Error sending email: {str(e)}")
 
 
-def send_email(to, subject, template, **kwargs):
+def build_email(to, subject, template, **kwargs):
     """
-    Send an email using a template
+    Build an email message from a template
     
     Args:
         to: Recipient email address
@@ -25,19 +40,33 @@ def send_email(to, subject, template, **kwargs):
         template: Path to email template
         **kwargs: Variables to pass to template
     """
-    app = current_app._get_current_object()
-    
     msg = Message(
-        subject=f"[{app.config['COMPANY_NAME']}] {subject}",
+        subject=f"[{current_app.config['COMPANY_NAME']}] {subject}",
         recipients=[to] if isinstance(to, str) else to,
-        sender=app.config['MAIL_DEFAULT_SENDER']
+        sender=current_app.config['MAIL_DEFAULT_SENDER']
     )
     
     # Render HTML template
     msg.html = render_template(template, **kwargs)
     
-    # Send asynchronously
-    thread = Thread(target=send_async_email, args=(app, msg))
+    return msg
+
+
+def send_email(to, subject, template, **kwargs):
+    """
+    Send an email using a template
+    
+    Args:
+        to: Recipient email address
+        subject: Email subject
+        template: Path to email template
+        **kwargs: Variables to pass to template
+    """
+    app = current_app._get_current_object()
+    msg = build_email(to, subject, template, **kwargs)
+    
+    # Send asynchronously; the thread's spans join the caller's trace
+    thread = Thread(target=with_trace_context(send_async_email), args=(app, msg))
     thread.start()
     
     return thread
@@ -66,15 +95,26 @@ def send_password_reset_email(user, reset_url):
 
 
 def send_new_file_notification(user, file, assigned_by):
-    """Send notification when new file is assigned"""
-    return send_email(
+    """Send notification when new file is assigned (called from the job worker)"""
+    deliver(build_email(
         to=user.email,
         subject='New File Available',
         template='emails/new_file.html',
         user=user,
         file=file,
         assigned_by=assigned_by
-    )
+    ))
+
+
+def queue_new_file_notification(user, file, assigned_by):
+    """Queue the new file notification for the job worker"""
+    from utils.jobs import enqueue
+
+    return enqueue('send_new_file_notification', {
+        'user_id': user.id,
+        'file_id': file.id,
+        'assigned_by_id': assigned_by.id
+    }, dedupe_key=f"notify:{user.id}:{file.id}")
 
 
 def send_file_update_notification(user, file, updated_by):
@@ -1,9 +1,15 @@
 """Utility functions for file handling"""
+import hashlib
 import os
 import secrets
+from collections import namedtuple
+from werkzeug.datastructures import ContentRange
 from werkzeug.utils import secure_filename
-from flask import current_app
+from flask import current_app, request, send_file, redirect, Response, stream_with_context
 from datetime import datetime
+from utils.metrics import UPLOAD_BYTES, UPLOAD_SECONDS
+from utils.storage import get_storage, content_disposition
+from utils.tracing import span
 
 
 def allowed_file(filename):
@@ -33,68 +39,156 @@ def generate_unique_filename(original_filename):
         return f"{timestamp}_{random_str}"
 
 
-def get_file_category_path(category):
-    """Get the directory path for a file category"""
-    upload_folder = current_app.config['UPLOAD_FOLDER']
+StoredFile = namedtuple('StoredFile', ['filename', 'storage_key', 'storage_backend', 'size', 'checksum'])
+
+
+class HashingReader:
+    """Stream wrapper that computes a SHA-256 digest of everything read"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
     
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.digest.update(data)
+        return data
+    
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def get_file_category_key(category):
+    """Get the storage key prefix for a file category"""
     if category:
         # Sanitize category name for use as directory
-        safe_category = secure_filename(category.replace(' ', '_'))
-        category_path = os.path.join(upload_folder, safe_category)
-    else:
-        category_path = os.path.join(upload_folder, 'uncategorized')
+        return secure_filename(category.replace(' ', '_'))
     
-    # Create directory if it doesn't exist
-    os.makedirs(category_path, exist_ok=True)
+    return 'uncategorized'
+
+
+def get_relative_storage_key(file):
+    """
+    Return a File's storage key relative to its backend root
     
-    return category_path
+    Legacy local rows hold absolute paths; those are mapped back under
+    the upload folder, falling back to <category>/<filename>.
+    """
+    if not os.path.isabs(file.file_path):
+        return file.file_path
+    
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    if os.path.commonpath([upload_folder, file.file_path]) == upload_folder:
+        return os.path.relpath(file.file_path, upload_folder).replace(os.sep, '/')
+    
+    return f"{get_file_category_key(file.category)}/{file.filename}"
 
 
 def save_uploaded_file(file, category=None):
     """
-    Save an uploaded file securely
+    Save an uploaded file securely to the configured storage backend
+    
+    The upload is streamed into storage once; size and checksum are
+    computed on the way through.
     
-    Returns: (success, filename, filepath, error_message)
+    Returns: (success, stored_file, error_message)
     """
     if not file:
-        return False, None, None, "No file provided"
+        return False, None, "No file provided"
     
     if file.filename == '':
-        return False, None, None, "No file selected"
+        return False, None, "No file selected"
     
     if not allowed_file(file.filename):
         allowed = ', '.join(current_app.config['ALLOWED_EXTENSIONS'])
-        return False, None, None, f"File type not allowed. Allowed types: {allowed}"
+        return False, None, f"File type not allowed. Allowed types: {allowed}"
     
     try:
         # Generate unique filename
         original_filename = secure_filename(file.filename)
         unique_filename = generate_unique_filename(original_filename)
         
-        # Get category path
-        category_path = get_file_category_path(category)
-        
-        # Full file path
-        filepath = os.path.join(category_path, unique_filename)
+        # Storage key: <category>/<unique filename>
+        storage_key = f"{get_file_category_key(category)}/{unique_filename}"
         
         # Save file
-        file.save(filepath)
+        storage = get_storage()
+        reader = HashingReader(file.stream)
+        with UPLOAD_SECONDS.time(), span('storage.put', **{'storage.backend': storage.name}) as put_span:
+            size = storage.put(storage_key, reader)
+            if put_span:
+                put_span.set_attribute('storage.bytes', size)
+        UPLOAD_BYTES.inc(size)
         
-        return True, unique_filename, filepath, None
+        return True, StoredFile(unique_filename, storage_key, storage.name, size, reader.hexdigest()), None
     
     except Exception as e:
-        return False, None, None, f"Error saving file: {str(e)}"
+        return False, None, f"Error saving file: {str(e)}"
+
+
+def send_stored_file(file):
+    """
+    Build a download response for a File record
+    
+    Local blobs go through send_file (conditional and range requests
+    included). Backends with presigned URLs redirect the client so the
+    bytes never pass through the app; other backends are streamed with
+    single-range support. Compressed (cold tier) blobs are decompressed
+    on the fly and served without range support.
+    
+    Raises FileNotFoundError if the blob is missing.
+    """
+    storage = get_storage(file.storage_backend)
+    
+    if file.is_compressed:
+        # Stat before streaming so a missing blob raises here rather than mid-response
+        storage.size(file.file_path)
+        response = Response(stream_with_context(storage.iter_chunks(file.file_path, decompress=True)),
+                            mimetype='application/octet-stream')
+        response.content_length = file.file_size
+        response.headers['Content-Disposition'] = content_disposition(file.original_filename)
+        response.accept_ranges = 'none'
+        return response
+    
+    local_path = storage.local_path(file.file_path)
+    if local_path:
+        return send_file(local_path, as_attachment=True, download_name=file.original_filename)
+    
+    if storage.supports_presigned_urls and current_app.config['STORAGE_PRESIGNED_REDIRECTS']:
+        url = storage.presigned_url(file.file_path, file.original_filename,
+                                    current_app.config['PRESIGNED_URL_EXPIRATION'])
+        return redirect(url)
+    
+    # Stat before streaming so a missing blob raises here rather than mid-response
+    size = storage.size(file.file_path)
+    byte_range = request.range.range_for_length(size) if request.range else None
+    
+    if byte_range:
+        start, stop = byte_range
+        response = Response(stream_with_context(storage.iter_chunks(file.file_path, start, stop - 1)),
+                            status=206, mimetype='application/octet-stream')
+        response.content_range = ContentRange('bytes', start, stop, size)
+        response.content_length = stop - start
+    else:
+        response = Response(stream_with_context(storage.iter_chunks(file.file_path)),
+                            mimetype='application/octet-stream')
+        response.content_length = size
+    
+    response.headers['Content-Disposition'] = content_disposition(file.original_filename)
+    response.accept_ranges = 'bytes'
+    return response
 
 
-def delete_file(filepath):
+def delete_file(storage_key, storage_backend=None):
     """
-    Delete a file from the filesystem
+    Delete a file from storage
     
     Returns: (success, error_message)
     """
     try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        storage = get_storage(storage_backend)
+        if storage.exists(storage_key):
+            storage.delete(storage_key)
             return True, None
         else:
             return False, "File not found"
@@ -0,0 +1,151 @@
+"""Template fragment cache - the {% cache %} tag, table-based invalidation and the Jinja bytecode cache"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class FragmentCache:
+    """
+    Rendered HTML fragments for one process, least recently used first
+
+    Each entry records the tables it was built from; invalidate() drops
+    every entry depending on a changed table. Other processes only see a
+    change once their own copy expires, so timeouts bound staleness.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires at, html, tables)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, html, timeout, tables):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, html, frozenset(tables))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, tables):
+        """Drop entries built from any of these tables; returns how many"""
+        tables = set(tables)
+        with self.lock:
+            stale = [key for key, (_, _, depends) in self.entries.items() if depends & tables]
+            for key in stale:
+                del self.entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache 'name', key, ... depends=['table', ...], timeout=60 %}...{% endcache %}
+
+    The name and the optional key values make up the cache key, so anything
+    the fragment varies by (the user, a selected filter) must be among them.
+    The fragment's data should be loaded inside the block, e.g. by calling a
+    function the view passed in, so a hit skips the queries as well.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        key, depends, timeout = [], nodes.List([]), nodes.Const(None)
+
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.type == 'name' and parser.stream.look().type == 'assign':
+                option = next(parser.stream).value
+                next(parser.stream)
+                value = parser.parse_expression()
+                if option == 'depends':
+                    depends = value
+                elif option == 'timeout':
+                    timeout = value
+                else:
+                    parser.fail(f"Unknown cache option '{option}'", lineno)
+            else:
+                key.append(parser.parse_expression())
+
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render', [name, nodes.List(key), depends, timeout])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, name, key, depends, timeout, caller):
+        from utils.metrics import record_cache
+
+        cache = current_app.extensions.get('fragment_cache')
+        if cache is None:
+            return caller()
+
+        cache_key = ':'.join([name, *map(str, key)])
+        html = cache.get(cache_key)
+        record_cache(f"fragment.{name}", html is not None)
+        if html is None:
+            html = caller()
+            cache.set(cache_key, html, timeout or current_app.config['FRAGMENT_CACHE_TIMEOUT'], depends)
+        return Markup(html)
+
+
+def invalidate_fragments(*tables):
+    """Drop this process's cached fragments built from these tables (requires app context)"""
+    cache = current_app.extensions.get('fragment_cache') if has_app_context() else None
+    if cache is not None:
+        cache.invalidate(tables)
+
+
+def _collect_changed_tables(session, flush_context):
+    changed = session.info.setdefault('fragment_tables', set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        changed.add(instance.__table__.name)
+
+
+def _invalidate_committed(session):
+    changed = session.info.pop('fragment_tables', None)
+    if changed:
+        invalidate_fragments(*changed)
+
+
+def _forget_rolled_back(session):
+    session.info.pop('fragment_tables', None)
+
+
+def init_fragment_cache(app):
+    """Register the {% cache %} tag and, when enabled, the cache and its invalidation hooks"""
+    # The tag is always registered so templates compile with the cache turned off
+    app.jinja_env.add_extension(FragmentCacheExtension)
+
+    if app.config['JINJA_BYTECODE_CACHE']:
+        # Compiled templates are shared by every worker and survive restarts
+        os.makedirs(app.config['JINJA_CACHE_FOLDER'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_FOLDER'])
+
+    if not app.config['FRAGMENT_CACHE_ENABLED']:
+        return
+
+    app.extensions['fragment_cache'] = FragmentCache(app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
+    if not event.contains(Session, 'after_flush', _collect_changed_tables):
+        event.listen(Session, 'after_flush', _collect_changed_tables)
+        event.listen(Session, 'after_commit', _invalidate_committed)
+        event.listen(Session, 'after_rollback', _forget_rolled_back)
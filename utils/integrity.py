@@ -0,0 +1,182 @@
+"""Background integrity scrubber for stored files"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from flask import current_app
+
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB reads keep memory flat on large manuals
+
+
+class IOThrottle:
+    """Token bucket shared by scrubber threads to cap total read bandwidth"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.allowance = bytes_per_second
+        self.last_check = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, num_bytes):
+        """Block until num_bytes may be read without exceeding the rate"""
+        if not self.rate:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last_check) * self.rate)
+            self.last_check = now
+            self.allowance -= num_bytes
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+
+
+def compute_checksum(storage, key, throttle=None, compressed=False):
+    """
+    Compute the SHA-256 hex digest of a stored blob, reading in chunks
+
+    Compressed blobs are hashed after decompression so the digest matches
+    the one recorded at upload.
+
+    Returns: (hex digest, bytes hashed)
+    """
+    digest = hashlib.sha256()
+    length = 0
+
+    for chunk in storage.iter_chunks(key, chunk_size=CHUNK_SIZE, decompress=compressed):
+        if throttle:
+            throttle.consume(len(chunk))
+        digest.update(chunk)
+        length += len(chunk)
+
+    return digest.hexdigest(), length
+
+
+def check_file(file_id, storage, key, expected_size, expected_checksum, throttle=None, compressed=False):
+    """
+    Verify a single stored blob against its recorded size and checksum
+
+    Runs without an app context so it can be executed in worker threads;
+    storage backends are safe to share between threads.
+
+    Returns: dict of FileIntegrityCheck column values
+    """
+    from models.file_integrity import FileIntegrityCheck
+
+    started = time.monotonic()
+    result = {
+        'file_id': file_id,
+        'checked_at': datetime.utcnow(),
+        'expected_size': expected_size,
+        'expected_checksum': expected_checksum,
+        'actual_size': None,
+        'actual_checksum': None,
+        'error_message': None,
+    }
+
+    try:
+        if compressed:
+            # The stored size is the compressed size; compare the decompressed length instead
+            result['actual_checksum'], result['actual_size'] = compute_checksum(storage, key, throttle, compressed)
+
+            if expected_size is not None and result['actual_size'] != expected_size:
+                result['status'] = FileIntegrityCheck.STATUS_SIZE_MISMATCH
+            elif expected_checksum and result['actual_checksum'] != expected_checksum:
+                result['status'] = FileIntegrityCheck.STATUS_CHECKSUM_MISMATCH
+            else:
+                result['status'] = FileIntegrityCheck.STATUS_OK
+        else:
+            result['actual_size'] = storage.size(key)
+
+            if expected_size is not None and result['actual_size'] != expected_size:
+                result['status'] = FileIntegrityCheck.STATUS_SIZE_MISMATCH
+            else:
+                result['actual_checksum'], _ = compute_checksum(storage, key, throttle)
+
+                if expected_checksum and result['actual_checksum'] != expected_checksum:
+                    result['status'] = FileIntegrityCheck.STATUS_CHECKSUM_MISMATCH
+                else:
+                    result['status'] = FileIntegrityCheck.STATUS_OK
+
+    except FileNotFoundError:
+        result['status'] = FileIntegrityCheck.STATUS_MISSING
+        result['error_message'] = 'File not found on server'
+    except (OSError, EOFError) as e:
+        # Truncated gzip streams raise EOFError
+        result['status'] = FileIntegrityCheck.STATUS_ERROR
+        result['error_message'] = f"Error reading file: {str(e)}"[:500]
+
+    result['duration_ms'] = int((time.monotonic() - started) * 1000)
+    return result
+
+
+def record_check_result(file, result):
+    """Store a check result and update the file's latest verdict (caller commits)"""
+    from models import db
+    from models.file_integrity import FileIntegrityCheck
+
+    check = FileIntegrityCheck(**result)
+    db.session.add(check)
+
+    # Backfill checksums for files uploaded before checksums were recorded
+    if not file.checksum and check.status == FileIntegrityCheck.STATUS_OK:
+        file.checksum = check.actual_checksum
+
+    file.integrity_status = check.status
+    file.integrity_checked_at = check.checked_at
+
+    return check
+
+
+def run_scrub(max_workers=None, max_bytes_per_second=None, file_ids=None):
+    """
+    Verify every active file using a thread pool (requires app context)
+
+    Reads are hashed in worker threads; database writes stay on the calling
+    thread so the session is never shared between threads.
+
+    Returns: dict of status -> count
+    """
+    from models import db
+    from models.file import File
+    from utils.storage import get_storage
+
+    if max_workers is None:
+        max_workers = current_app.config['SCRUB_MAX_WORKERS']
+    if max_bytes_per_second is None:
+        max_bytes_per_second = current_app.config['SCRUB_MAX_BYTES_PER_SECOND']
+
+    throttle = IOThrottle(max_bytes_per_second)
+
+    query = db.session.query(File.id, File.storage_backend, File.file_path, File.file_size,
+                             File.checksum, File.is_compressed)\
+        .filter(File.is_active == True)
+    if file_ids:
+        query = query.filter(File.id.in_(file_ids))
+    targets = query.all()
+
+    summary = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scrub') as executor:
+        futures = [
+            executor.submit(check_file, t.id, get_storage(t.storage_backend), t.file_path,
+                            t.file_size, t.checksum, throttle, t.is_compressed)
+            for t in targets
+        ]
+
+        for count, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            file = db.session.get(File, result['file_id'])
+            record_check_result(file, result)
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+
+            # Commit in batches to keep transactions short
+            if count % 100 == 0:
+                db.session.commit()
+
+    db.session.commit()
+    return summary
+
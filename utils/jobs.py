@@ -0,0 +1,491 @@
+"""Durable background job queue backed by the application database"""
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, g
+from sqlalchemy import case, func, text
+from sqlalchemy.exc import IntegrityError
+from utils.metrics import JOB_SECONDS
+from utils.tracing import start_trace, current_traceparent, activate, deactivate
+
+
+# Registered job handlers: name -> (function, max_attempts)
+_handlers = {}
+
+# Registered periodic jobs: name -> (CronSchedule, payload)
+_periodic = {}
+
+
+def job(name, max_attempts=3):
+    """Decorator registering a function as the handler for a job name"""
+    def decorator(f):
+        _handlers[name] = (f, max_attempts)
+        return f
+
+    return decorator
+
+
+def periodic(name, schedule, payload=None):
+    """Register a job to be enqueued on a cron-like schedule (e.g. '0 3 * * *')"""
+    _periodic[name] = (CronSchedule(schedule), payload or {})
+
+
+def get_handler(name):
+    """Return the handler function registered for a job name"""
+    if name not in _handlers:
+        raise KeyError(f"No handler registered for job '{name}'")
+    return _handlers[name][0]
+
+
+class CronSchedule:
+    """
+    Minimal five-field cron expression: minute hour day-of-month month day-of-week
+
+    Each field accepts '*', '*/n', 'a-b', 'a-b/n', numbers and comma-separated
+    lists. Day-of-week runs 0-6 with 0 = Sunday.
+    """
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression}")
+
+        self.fields = [self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)]
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step = part.split('/')
+                step = int(step)
+
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(v) for v in part.split('-'))
+            else:
+                start = end = int(part)
+
+            if start < low or end > high:
+                raise ValueError(f"Cron field value out of range {low}-{high}: {field}")
+            values.update(range(start, end + 1, step))
+
+        return values
+
+    def matches(self, when):
+        """Check if the schedule fires in the minute containing `when`"""
+        minute, hour, day, month, weekday = self.fields
+        return (when.minute in minute and when.hour in hour and when.day in day
+                and when.month in month and (when.isoweekday() % 7) in weekday)
+
+
+def enqueue(name, payload=None, dedupe_key=None, run_at=None, delay=None, max_attempts=None):
+    """
+    Add a job to the queue (requires app context)
+
+    If dedupe_key is given and a queued or running job already has it, that
+    job is returned instead of creating a duplicate. A unique index backs
+    this up, so concurrent callers racing on one key still get one job.
+    With JOBS_EAGER set the job runs immediately in the calling thread
+    (used by the test config).
+
+    Returns: the Job
+    """
+    from models import db
+    from models.job import Job
+    import utils.tasks  # noqa: F401 - registers job handlers
+
+    if dedupe_key:
+        existing = _find_deduplicated(dedupe_key)
+        if existing:
+            return existing
+
+    if run_at is None:
+        run_at = datetime.utcnow() + (delay or timedelta(0))
+
+    if max_attempts is None:
+        max_attempts = _handlers[name][1] if name in _handlers else current_app.config['JOB_MAX_ATTEMPTS']
+
+    queued = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        dedupe_key=dedupe_key,
+        run_at=run_at,
+        max_attempts=max_attempts,
+        trace_parent=current_traceparent()
+    )
+    try:
+        # A savepoint, so losing the race doesn't roll back the caller's changes
+        with db.session.begin_nested():
+            db.session.add(queued)
+    except IntegrityError:
+        existing = _find_deduplicated(dedupe_key) if dedupe_key else None
+        if existing is None:
+            raise
+        db.session.commit()
+        return existing
+    db.session.commit()
+
+    if current_app.config.get('JOBS_EAGER') and not delay:
+        execute_job(queued.id, 'eager')
+
+    return queued
+
+
+def _find_deduplicated(dedupe_key):
+    """The job holding dedupe_key in the unique index's scope, if any"""
+    from models.job import Job
+
+    return Job.query.filter(Job.dedupe_key == dedupe_key, text(Job.DEDUPE_SCOPE)).first()
+
+
+def claim_jobs(worker_id, limit):
+    """
+    Atomically claim up to `limit` due jobs for a worker (requires app context)
+
+    A conditional UPDATE makes the claim safe across worker processes on
+    both SQLite and Postgres.
+
+    Returns: list of claimed job ids
+    """
+    from models import db
+    from models.job import Job
+
+    now = datetime.utcnow()
+    candidates = db.session.query(Job.id)\
+        .filter(Job.status == Job.STATUS_QUEUED, Job.run_at <= now)\
+        .order_by(Job.run_at, Job.id)\
+        .limit(limit * 2)\
+        .all()
+
+    claimed = []
+    for (job_id,) in candidates:
+        if len(claimed) >= limit:
+            break
+
+        result = db.session.query(Job)\
+            .filter(Job.id == job_id, Job.status == Job.STATUS_QUEUED)\
+            .update({'status': Job.STATUS_RUNNING, 'worker_id': worker_id, 'started_at': now,
+                     'heartbeat_at': now}, synchronize_session=False)
+        db.session.commit()
+
+        if result:
+            claimed.append(job_id)
+
+    return claimed
+
+
+def execute_job(job_id, worker_id=None):
+    """
+    Run a claimed job and record the outcome (requires app context)
+
+    Writes a handler leaves uncommitted are committed together with the
+    job's success, so a job never counts as done without its work. Failures
+    (including that commit failing) are retried with exponential backoff
+    until max_attempts is reached, after which the job stays failed for an
+    admin to inspect.
+    """
+    from models import db
+    from models.job import Job
+    import utils.tasks  # noqa: F401 - registers job handlers
+
+    queued = db.session.get(Job, job_id)
+    if not queued:
+        return
+
+    if queued.status != Job.STATUS_RUNNING:
+        queued.status = Job.STATUS_RUNNING
+        queued.worker_id = worker_id
+        queued.started_at = queued.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+    name, payload = queued.name, queued.get_payload()
+    g.job_name = name  # Lets the slow-query log attribute statements to this job
+    start = time.perf_counter()
+
+    # Continue the enqueuing request's trace, so job time shows up under it
+    trace = start_trace(f"job {name}", traceparent=queued.trace_parent,
+                        **{'job.id': job_id, 'job.attempt': queued.attempts + 1})
+    token = activate(trace) if trace else None
+
+    try:
+        get_handler(name)(**payload)
+
+        queued = db.session.get(Job, job_id)
+        queued.attempts += 1
+        queued.status = Job.STATUS_SUCCEEDED
+        queued.finished_at = datetime.utcnow()
+        queued.last_error = None
+        db.session.commit()
+    except Exception as e:
+        if trace:
+            trace.record_error(e)
+        JOB_SECONDS.labels(name, 'failed').observe(time.perf_counter() - start)
+        db.session.rollback()
+        queued = db.session.get(Job, job_id)
+        queued.attempts += 1
+        queued.last_error = traceback.format_exc()[-4000:]
+        queued.finished_at = datetime.utcnow()
+
+        if queued.attempts < queued.max_attempts:
+            backoff = current_app.config['JOB_RETRY_BACKOFF_SECONDS'] * (2 ** (queued.attempts - 1))
+            queued.status = Job.STATUS_QUEUED
+            queued.run_at = datetime.utcnow() + timedelta(seconds=backoff)
+        else:
+            queued.status = Job.STATUS_FAILED
+
+        db.session.commit()
+        print(f"Job {job_id} ({name}) failed on attempt {queued.attempts}")
+        return
+    finally:
+        if trace:
+            deactivate(token)
+            trace.end()
+
+    JOB_SECONDS.labels(name, 'succeeded').observe(time.perf_counter() - start)
+
+
+def retry_job(job_id):
+    """Put a failed job back in the queue (requires app context)"""
+    from models import db
+    from models.job import Job
+
+    queued = db.session.get(Job, job_id)
+    if not queued or queued.status != Job.STATUS_FAILED:
+        return False
+
+    queued.status = Job.STATUS_QUEUED
+    queued.run_at = datetime.utcnow()
+    queued.max_attempts = queued.attempts + 1
+    db.session.commit()
+
+    return True
+
+
+def enqueue_periodic_jobs(now=None):
+    """
+    Enqueue periodic jobs whose schedule fires this minute (requires app context)
+
+    The dedupe key includes the minute, and the unique dedupe index keeps
+    periodic keys whatever the job's status, so several workers ticking in
+    the same minute enqueue each run once.
+    """
+    now = (now or datetime.utcnow()).replace(second=0, microsecond=0)
+    enqueued = []
+
+    for name, (schedule, payload) in _periodic.items():
+        if not schedule.matches(now):
+            continue
+
+        dedupe_key = f"periodic:{name}:{now.strftime('%Y%m%d%H%M')}"
+        if _find_deduplicated(dedupe_key):
+            continue
+
+        enqueued.append(enqueue(name, payload, dedupe_key=dedupe_key, run_at=now))
+
+    return enqueued
+
+
+def heartbeat_jobs(worker_id):
+    """Mark this worker's running jobs as still alive (requires app context)"""
+    from models import db
+    from models.job import Job
+
+    db.session.query(Job)\
+        .filter(Job.worker_id == worker_id, Job.status == Job.STATUS_RUNNING)\
+        .update({'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+
+
+def requeue_stale_jobs():
+    """
+    Recover jobs whose worker stopped sending heartbeats (e.g. it crashed)
+
+    Workers refresh heartbeat_at on their running jobs every
+    JOB_HEARTBEAT_SECONDS, so a long job on a live worker is never picked
+    up twice. A recovered job counts as a failed attempt: it is requeued,
+    or marked failed once it reaches max_attempts, so a job that kills its
+    worker every time is not retried forever. One UPDATE, so concurrent
+    workers can't both recover the same job.
+    """
+    from models import db
+    from models.job import Job
+
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=current_app.config['JOB_TIMEOUT_SECONDS'])
+    count = db.session.query(Job)\
+        .filter(Job.status == Job.STATUS_RUNNING, func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff)\
+        .update({
+            'attempts': Job.attempts + 1,
+            'status': case((Job.attempts + 1 >= Job.max_attempts, Job.STATUS_FAILED), else_=Job.STATUS_QUEUED),
+            'run_at': now,
+            'finished_at': now,
+            'last_error': 'Worker stopped sending heartbeats while running this job',
+        }, synchronize_session=False)
+    db.session.commit()
+
+    return count
+
+
+# Per-process app used by process-mode workers
+_process_app = None
+
+
+def _init_worker_process(config_name):
+    """Create an app once per worker process"""
+    global _process_app
+    from app import create_app
+
+    _process_app = create_app(config_name)
+
+
+def _execute_in_process(job_id, worker_id):
+    with _process_app.app_context():
+        execute_job(job_id, worker_id)
+
+
+def _execute_in_thread(app, job_id, worker_id):
+    with app.app_context():
+        execute_job(job_id, worker_id)
+
+
+def run_worker(app, config_name, concurrency=None, mode=None, poll_interval=None, burst=False):
+    """
+    Process jobs until interrupted
+
+    mode='thread' runs jobs on a thread pool in this process; mode='process'
+    runs them on a pool of worker processes, each with its own app.
+    With burst=True the worker exits once the queue is empty.
+    """
+    from utils.tasks import register_periodic_jobs
+
+    register_periodic_jobs(app)
+
+    concurrency = concurrency or app.config['JOB_WORKER_CONCURRENCY']
+    mode = mode or app.config['JOB_WORKER_MODE']
+    poll_interval = poll_interval or app.config['JOB_POLL_INTERVAL_SECONDS']
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    if mode == 'process':
+        executor = ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker_process,
+            initargs=(config_name,)
+        )
+    else:
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job')
+
+    in_flight = set()
+    in_flight_lock = threading.Lock()
+    last_tick = None
+    last_heartbeat = 0.0
+
+    def done(future):
+        with in_flight_lock:
+            in_flight.discard(future)
+
+    print(f"Worker {worker_id} started ({mode} pool, concurrency {concurrency})")
+
+    try:
+        with app.app_context():
+            while True:
+                # Scheduler tick once per minute
+                minute = datetime.utcnow().replace(second=0, microsecond=0)
+                if minute != last_tick:
+                    last_tick = minute
+                    enqueue_periodic_jobs(minute)
+                    requeue_stale_jobs()
+
+                if time.monotonic() - last_heartbeat >= app.config['JOB_HEARTBEAT_SECONDS']:
+                    last_heartbeat = time.monotonic()
+                    heartbeat_jobs(worker_id)
+
+                with in_flight_lock:
+                    capacity = concurrency - len(in_flight)
+
+                claimed = claim_jobs(worker_id, capacity) if capacity > 0 else []
+                for job_id in claimed:
+                    if mode == 'process':
+                        future = executor.submit(_execute_in_process, job_id, worker_id)
+                    else:
+                        future = executor.submit(_execute_in_thread, app, job_id, worker_id)
+                    with in_flight_lock:
+                        in_flight.add(future)
+                    future.add_done_callback(done)
+
+                with in_flight_lock:
+                    idle = not in_flight
+                if burst and not claimed and idle:
+                    break
+
+                if not claimed:
+                    time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Worker shutting down, waiting for running jobs...")
+    finally:
+        executor.shutdown(wait=True)
+
+
+def get_queue_stats(since):
+    """Return queue depth and latency figures for the admin view (requires app context)"""
+    from sqlalchemy import func
+    from models import db
+    from models.job import Job
+
+    depth = db.session.query(Job.name, Job.status, func.count(Job.id))\
+        .filter(db.or_(Job.status.in_(Job.ACTIVE_STATUSES + (Job.STATUS_FAILED,)), Job.finished_at >= since))\
+        .group_by(Job.name, Job.status)\
+        .all()
+
+    by_name = {}
+    for name, status, count in depth:
+        by_name.setdefault(name, {})[status] = count
+
+    finished = db.session.query(Job.name, Job.run_at, Job.started_at, Job.finished_at)\
+        .filter(Job.status == Job.STATUS_SUCCEEDED, Job.finished_at >= since)\
+        .all()
+
+    latencies = {}
+    for name, run_at, started_at, finished_at in finished:
+        entry = latencies.setdefault(name, {'wait': [], 'run': []})
+        entry['wait'].append(max((started_at - run_at).total_seconds(), 0))
+        entry['run'].append((finished_at - started_at).total_seconds())
+
+    for name, entry in latencies.items():
+        by_name.setdefault(name, {})
+        by_name[name]['wait_p50'] = _percentile(entry['wait'], 50)
+        by_name[name]['wait_p95'] = _percentile(entry['wait'], 95)
+        by_name[name]['run_p50'] = _percentile(entry['run'], 50)
+        by_name[name]['run_p95'] = _percentile(entry['run'], 95)
+
+    oldest_queued = db.session.query(func.min(Job.run_at))\
+        .filter(Job.status == Job.STATUS_QUEUED, Job.run_at <= datetime.utcnow())\
+        .scalar()
+
+    return {
+        'by_name': dict(sorted(by_name.items())),
+        'queued': sum(stats.get(Job.STATUS_QUEUED, 0) for stats in by_name.values()),
+        'running': sum(stats.get(Job.STATUS_RUNNING, 0) for stats in by_name.values()),
+        'failed': sum(stats.get(Job.STATUS_FAILED, 0) for stats in by_name.values()),
+        'oldest_queued_seconds': (datetime.utcnow() - oldest_queued).total_seconds() if oldest_queued else None,
+    }
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(int(round(percent / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
@@ -0,0 +1,193 @@
+"""Bulk insert paths for audit log rows"""
+import atexit
+import io
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert
+from utils.fragments import invalidate_fragments
+
+
+def _copy_value(value):
+    """Format one value for PostgreSQL's COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_rows(connection, table, columns, rows):
+    """Stream rows into a PostgreSQL table with COPY"""
+    statement = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN"
+    cursor = connection.connection.cursor()
+    try:
+        if connection.dialect.driver == 'psycopg2':
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write('\t'.join(_copy_value(row.get(column)) for column in columns) + '\n')
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+        else:
+            with cursor.copy(statement) as copy:
+                for row in rows:
+                    copy.write_row([row.get(column) for column in columns])
+    finally:
+        cursor.close()
+
+
+def bulk_insert(connection, table, rows, use_copy=True):
+    """
+    Insert many rows in as few round trips as the database allows
+
+    PostgreSQL (psycopg2 or psycopg 3) uses COPY; other databases get one
+    executemany of a cached INSERT, which the driver loops over without
+    recompiling a multi-row statement per chunk. Rows are dicts and must
+    all have the same keys.
+
+    Returns: number of rows inserted
+    """
+    if not rows:
+        return 0
+
+    columns = list(rows[0])
+
+    if use_copy and connection.dialect.name == 'postgresql' and connection.dialect.driver in ('psycopg2', 'psycopg'):
+        _copy_rows(connection, table, columns, rows)
+        return len(rows)
+
+    connection.execute(insert(table), rows)
+
+    return len(rows)
+
+
+class LogBuffer:
+    """
+    Collects log rows in memory and writes them in bulk
+
+    A background thread flushes every flush_interval seconds, or sooner
+    once max_rows are waiting. While flushes fail (database down) rows keep
+    accumulating up to capacity; past that the oldest are dropped, so an
+    outage costs log rows rather than the worker's memory. Rows still
+    buffered when the process is killed without a clean exit are lost.
+    """
+
+    def __init__(self, app, table, max_rows, flush_interval, capacity):
+        self.app = app
+        self.table = table
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.capacity = max(capacity, max_rows)
+        self.rows = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+        self.thread = threading.Thread(target=self._run, name=f"log-flush-{table.name}", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def add(self, row):
+        """Buffer one row"""
+        with self.lock:
+            self.rows.append(row)
+            self._trim()
+            full = len(self.rows) >= self.max_rows
+
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """Write all buffered rows in one transaction"""
+        from models import db
+
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if not rows:
+            return 0
+
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    inserted = bulk_insert(connection, self.table, rows)
+                invalidate_fragments(self.table.name)
+                return inserted
+        except Exception as e:
+            print(f"Error flushing {len(rows)} {self.table.name} rows: {str(e)}")
+            # Put them back for the next attempt, ahead of newer rows
+            with self.lock:
+                self.rows[:0] = rows
+                self._trim()
+            return 0
+
+    def _trim(self):
+        """Drop the oldest rows past capacity (caller holds the lock)"""
+        excess = len(self.rows) - self.capacity
+        if excess > 0:
+            del self.rows[:excess]
+            print(f"Dropped {excess} buffered {self.table.name} rows: buffer over {self.capacity} rows")
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+
+_buffers_lock = threading.Lock()
+
+
+def _get_buffer(model):
+    """Return the app's buffer for a model's table, or None when buffering is off"""
+    app = current_app._get_current_object()
+    if not app.config['LOG_BUFFER_SIZE']:
+        return None
+
+    buffers = app.extensions.setdefault('log_buffers', {})
+    with _buffers_lock:
+        if model.__tablename__ not in buffers:
+            buffers[model.__tablename__] = LogBuffer(
+                app,
+                model.__table__,
+                app.config['LOG_BUFFER_SIZE'],
+                app.config['LOG_FLUSH_INTERVAL'],
+                app.config['LOG_BUFFER_MAX_ROWS']
+            )
+
+    return buffers[model.__tablename__]
+
+
+def record_log(model, **values):
+    """
+    Record an audit log row (requires app context)
+
+    With LOG_BUFFER_SIZE set the row is buffered for a bulk insert;
+    otherwise it is added to the session and the caller commits as usual.
+    """
+    from models import db
+
+    buffer = _get_buffer(model)
+    if buffer is None:
+        db.session.add(model(**values))
+        return
+
+    # Every row gets every column so rows can share one INSERT/COPY; defaults
+    # (timestamps in particular) are taken now, not at flush time
+    for column in model.__table__.columns:
+        if column.name in values or column.primary_key:
+            continue
+        if column.default is not None and column.default.is_callable:
+            values[column.name] = column.default.arg(None)
+        elif column.default is not None and column.default.is_scalar:
+            values[column.name] = column.default.arg
+        else:
+            values[column.name] = None
+
+    buffer.add(values)
+
+
+def flush_logs():
+    """Write any buffered log rows now (requires app context)"""
+    buffers = current_app.extensions.get('log_buffers', {})
+    return sum(buffer.flush() for buffer in list(buffers.values()))
@@ -0,0 +1,164 @@
+"""Prometheus metrics for requests, SQL, downloads, uploads, email, hashing, jobs, caches and compression"""
+import hmac
+import os
+import time
+from flask import g, request, has_request_context, abort, Response
+from flask_login import current_user
+from prometheus_client import (Counter, Histogram, CollectorRegistry, REGISTRY,
+                               generate_latest, CONTENT_TYPE_LATEST)
+from prometheus_client import multiprocess
+from utils.database import add_statement_observer
+
+
+# Buckets for fast operations (SQL statements, cache lookups)
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time to build a response, by endpoint',
+    ['method', 'endpoint', 'status']
+)
+REQUEST_SQL_QUERIES = Histogram(
+    'http_request_sql_queries', 'SQL statements executed per request',
+    ['endpoint'], buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+REQUEST_SQL_SECONDS = Histogram(
+    'http_request_sql_seconds', 'Total SQL time per request',
+    ['endpoint'], buckets=FAST_BUCKETS
+)
+SQL_STATEMENT_SECONDS = Histogram(
+    'db_statement_duration_seconds', 'SQL statement execution time, by bind',
+    ['bind'], buckets=FAST_BUCKETS
+)
+DOWNLOAD_BYTES = Counter(
+    'download_bytes_total', 'Bytes served by secure_download (by Content-Length)',
+    ['tier', 'status']
+)
+DOWNLOAD_REDIRECTS = Counter(
+    'download_redirects_total', 'Downloads handed off to presigned storage URLs'
+)
+UPLOAD_BYTES = Counter(
+    'upload_bytes_total', 'Bytes written to storage by admin uploads'
+)
+UPLOAD_SECONDS = Histogram(
+    'upload_duration_seconds', 'Time to stream an upload into storage',
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+EMAIL_SECONDS = Histogram(
+    'email_send_duration_seconds', 'Time to hand an email to the SMTP server',
+    ['result']
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    'password_hash_duration_seconds', 'bcrypt hashing and verification time',
+    ['operation'], buckets=(.01, .025, .05, .1, .2, .3, .5, .75, 1, 2)
+)
+JOB_SECONDS = Histogram(
+    'job_duration_seconds', 'Background job run time',
+    ['name', 'result'], buckets=(.01, .05, .1, .5, 1, 5, 10, 30, 60, 300, 900, 3600)
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups; hit ratio = hit / (hit + miss)',
+    ['cache', 'result']
+)
+RESPONSE_COMPRESSION_BYTES = Counter(
+    'http_response_compression_bytes_total', 'Dynamically compressed response bodies, before and after',
+    ['encoding', 'stage']
+)
+
+
+def record_cache(cache, hit):
+    """Count a cache hit or miss"""
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def record_compression(encoding, original, compressed):
+    """Count a response body's bytes before and after compression"""
+    RESPONSE_COMPRESSION_BYTES.labels(encoding, 'original').inc(original)
+    RESPONSE_COMPRESSION_BYTES.labels(encoding, 'compressed').inc(compressed)
+
+
+def record_download(response, tier):
+    """Count the bytes a download response will send"""
+    if 300 <= response.status_code < 400:
+        DOWNLOAD_REDIRECTS.inc()
+    elif response.content_length:
+        DOWNLOAD_BYTES.labels(tier or 'unknown', str(response.status_code)).inc(response.content_length)
+
+
+def is_multiprocess():
+    """Check if metrics are shared between processes through PROMETHEUS_MULTIPROC_DIR"""
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def mark_process_dead(pid):
+    """Clean up a dead worker's live metric files (call from gunicorn's child_exit hook)"""
+    if is_multiprocess():
+        multiprocess.mark_process_dead(pid)
+
+
+def generate_metrics():
+    """Render all metrics in Prometheus text format, merged across processes when configured"""
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry)
+
+
+def _endpoint_label():
+    return request.endpoint or 'unmatched'
+
+
+def _authorized_for_metrics(app):
+    """Scrapers authenticate with METRICS_TOKEN; logged-in admins may also view"""
+    token = app.config['METRICS_TOKEN']
+    header = request.headers.get('Authorization', '')
+    if token and header.startswith('Bearer ') and hmac.compare_digest(header[len('Bearer '):], token):
+        return True
+
+    return current_user.is_authenticated and current_user.is_admin()
+
+
+def init_metrics(app):
+    """Register request hooks, SQL listeners and the /metrics endpoint"""
+    from models import limiter
+
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    @app.before_request
+    def start_request_timer():
+        g._metrics_start = time.perf_counter()
+        g._sql_queries = 0
+        g._sql_seconds = 0.0
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            endpoint = _endpoint_label()
+            REQUEST_SECONDS.labels(request.method, endpoint, str(response.status_code))\
+                .observe(time.perf_counter() - start)
+            REQUEST_SQL_QUERIES.labels(endpoint).observe(g.get('_sql_queries', 0))
+            REQUEST_SQL_SECONDS.labels(endpoint).observe(g.get('_sql_seconds', 0.0))
+        return response
+
+    add_statement_observer(_observe_statement)
+
+    @app.route(app.config['METRICS_PATH'])
+    @limiter.exempt
+    def metrics():
+        """Prometheus scrape endpoint"""
+        if not _authorized_for_metrics(app):
+            abort(403)
+        return Response(generate_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+def _observe_statement(bind, statement, parameters, seconds):
+    """Add one SQL statement to the bind histogram and the current request's totals"""
+    SQL_STATEMENT_SECONDS.labels(bind).observe(seconds)
+
+    if has_request_context() and '_sql_queries' in g:
+        g._sql_queries += 1
+        g._sql_seconds += seconds
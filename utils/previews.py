@@ -0,0 +1,176 @@
+"""Preview generation for uploaded documents"""
+import importlib.util
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+
+
+PREVIEW_PENDING = 'pending'
+PREVIEW_READY = 'ready'
+PREVIEW_FAILED = 'failed'
+
+PREVIEWABLE_TYPES = {'pdf'}
+
+THUMBNAIL_NAME = 'thumbnail'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def render_preview(source_path, output_dir, max_pages, thumbnail_width, page_width, image_format):
+    """
+    Render a thumbnail and low-resolution page images for a PDF
+
+    Runs in a worker process, so it only takes plain arguments and never
+    touches the app or database.
+
+    Returns: dict with page_count and pages_rendered
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        raise RuntimeError("Preview generation requires PyMuPDF (pip install pymupdf)")
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    with pymupdf.open(source_path) as document:
+        page_count = document.page_count
+        pages_rendered = min(page_count, max_pages)
+
+        for index in range(pages_rendered):
+            _render_page(document[index], page_width, image_format,
+                         os.path.join(output_dir, f"page-{index + 1}.{image_format}"))
+
+        if page_count:
+            _render_page(document[0], thumbnail_width, image_format,
+                         os.path.join(output_dir, f"{THUMBNAIL_NAME}.{image_format}"))
+
+    return {'page_count': page_count, 'pages_rendered': pages_rendered}
+
+
+def _render_page(page, width, image_format, path):
+    """Render one page scaled to the given pixel width"""
+    import pymupdf
+
+    zoom = width / page.rect.width
+    pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+    _save_pixmap(pixmap, path, image_format)
+
+
+def _save_pixmap(pixmap, path, image_format):
+    """Write a rendered page, going through Pillow for formats MuPDF cannot encode"""
+    if image_format == 'png':
+        pixmap.save(path)
+        return
+
+    from PIL import Image
+    image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    image.save(path, format=image_format.upper(), quality=80)
+
+
+def get_executor():
+    """Return the shared preview process pool, creating it on first use"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            # spawn avoids forking a process that already runs request threads
+            _executor = ProcessPoolExecutor(
+                max_workers=current_app.config['PREVIEW_MAX_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+
+    return _executor
+
+
+def get_preview_dir(file):
+    """Return the cache directory for a file's previews"""
+    # Keyed by checksum so a replaced blob never serves stale previews
+    cache_key = file.checksum or f"file-{file.id}"
+    return os.path.join(current_app.config['PREVIEW_FOLDER'], cache_key)
+
+
+def is_previewable(file):
+    """Check if previews can be generated for a file"""
+    return file.file_type in PREVIEWABLE_TYPES
+
+
+def previews_available():
+    """Check if PyMuPDF is installed, without importing it"""
+    return importlib.util.find_spec('pymupdf') is not None
+
+
+def _local_copy(file):
+    """
+    Return (path, is_temporary) for a local readable copy of a file's blob
+
+    Blobs on remote or compressed storage are copied to a temporary file
+    first, since the renderer needs random access.
+    """
+    from utils.storage import get_storage
+
+    storage = get_storage(file.storage_backend)
+    local_path = storage.local_path(file.file_path)
+    if local_path and not file.is_compressed:
+        return local_path, False
+
+    fd, tmp_path = tempfile.mkstemp(suffix=f".{file.file_type}")
+    with os.fdopen(fd, 'wb') as fh:
+        for chunk in storage.iter_chunks(file.file_path, decompress=file.is_compressed):
+            fh.write(chunk)
+
+    return tmp_path, True
+
+
+def generate_preview(file_id):
+    """
+    Generate previews for a file and record the result (requires app context)
+
+    Rendering happens in the process pool so a job worker thread only
+    waits on it; failures are recorded on the File row rather than retried.
+    Without PyMuPDF the file is left without a preview status, not failed.
+    """
+    from models import db
+    from models.file import File
+
+    file = db.session.get(File, file_id)
+    if not file or not is_previewable(file):
+        return None
+
+    if not previews_available():
+        print(f"Skipping preview for file {file_id}: PyMuPDF is not installed (pip install pymupdf)")
+        file.preview_status = None
+        db.session.commit()
+        return None
+
+    config = current_app.config
+    source_path = None
+    is_temporary = False
+    try:
+        source_path, is_temporary = _local_copy(file)
+        future = get_executor().submit(
+            render_preview,
+            source_path,
+            get_preview_dir(file),
+            config['PREVIEW_MAX_PAGES'],
+            config['PREVIEW_THUMBNAIL_WIDTH'],
+            config['PREVIEW_PAGE_WIDTH'],
+            config['PREVIEW_FORMAT']
+        )
+        result = future.result()
+
+        file.page_count = result['page_count']
+        file.preview_pages = result['pages_rendered']
+        file.preview_status = PREVIEW_READY
+    except Exception as e:
+        print(f"Error generating preview for file {file_id}: {str(e)}")
+        file.preview_status = PREVIEW_FAILED
+    finally:
+        if is_temporary and source_path:
+            os.remove(source_path)
+
+    db.session.commit()
+    return file.preview_status
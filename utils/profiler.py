@@ -0,0 +1,352 @@
+"""On-demand request profiler - sampled call stacks, SQL timings and tracemalloc snapshots"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from flask import g, request, session, has_request_context, current_app
+from flask_login import current_user
+from sqlalchemy import insert, update, select, delete, desc
+from utils.database import add_statement_observer
+
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+MEMORY_TOP_LINES = 50
+
+# tracemalloc is process-wide, so only one memory capture runs at a time
+_memory_lock = threading.Lock()
+
+
+class StackSampler:
+    """
+    Samples one thread's call stack from a background thread
+
+    Every interval the target thread's current frame is walked and the
+    stack counted; the target thread runs untouched in between, so cost
+    stays low and roughly constant whatever the request does.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.frames = []  # [(name, file, line)]
+        self._frame_index = {}  # code object -> index into frames
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self.root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _index(self, code):
+        index = self._frame_index.get(code)
+        if index is None:
+            filename = code.co_filename
+            if filename.startswith(self.root):
+                filename = os.path.relpath(filename, self.root)
+            index = self._frame_index[code] = len(self.frames)
+            self.frames.append((code.co_name, filename, code.co_firstlineno))
+        return index
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._index(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1  # Root first
+
+
+class RequestProfile:
+    """Profiling state for one request, kept on flask.g"""
+
+    def __init__(self, mode, app, trigger_id=None):
+        self.mode = mode
+        self.trigger_id = trigger_id
+        self.interval = app.config['PROFILE_INTERVAL_MS'] / 1000.0
+        self.statements = []
+        self.sampler = None
+        self.baseline = None
+        self.started_tracing = False
+        self.started = time.perf_counter()
+
+        if mode == 'cpu':
+            self.sampler = StackSampler(threading.get_ident(), self.interval)
+            self.sampler.start()
+        else:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(app.config['PROFILE_TRACEMALLOC_FRAMES'])
+                self.started_tracing = True
+            tracemalloc.reset_peak()
+            self.baseline = tracemalloc.take_snapshot()
+
+    def finish(self):
+        """Stop collecting and return the capture as a JSON-serialisable dict"""
+        duration = time.perf_counter() - self.started
+        capture = {
+            'mode': self.mode,
+            'duration_ms': duration * 1000,
+            'interval_ms': self.interval * 1000,
+            'sql': self.statements,
+        }
+
+        if self.sampler is not None:
+            self.sampler.stop()
+            capture['frames'] = [{'name': name, 'file': file, 'line': line}
+                                 for name, file, line in self.sampler.frames]
+            capture['stacks'] = [[list(stack), count] for stack, count in self.sampler.stacks.most_common()]
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            capture['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            if self.started_tracing:
+                tracemalloc.stop()
+            _memory_lock.release()
+
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            capture['memory'] = [{
+                'location': str(stat.traceback[0]),
+                'size_bytes': stat.size,
+                'size_diff_bytes': stat.size_diff,
+                'count': stat.count,
+                'count_diff': stat.count_diff,
+            } for stat in snapshot.compare_to(self.baseline, 'lineno')[:MEMORY_TOP_LINES]]
+
+        return capture
+
+    def sample_count(self):
+        return sum(self.sampler.stacks.values()) if self.sampler else 0
+
+
+def _requested_mode():
+    """Mode asked for by an admin through the query string or header, if any"""
+    mode = request.args.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+    if mode not in ('cpu', 'memory'):
+        return None
+    if not (current_user.is_authenticated and current_user.is_admin()):
+        return None
+    return mode
+
+
+def _active_triggers(app):
+    """Armed triggers, cached per process for PROFILE_TRIGGER_REFRESH_SECONDS"""
+    from models import db
+    from models.profile_trigger import ProfileTrigger
+
+    cache = app.extensions.setdefault('profile_triggers', {'loaded_at': 0, 'triggers': []})
+    if time.monotonic() - cache['loaded_at'] < app.config['PROFILE_TRIGGER_REFRESH_SECONDS']:
+        return cache['triggers']
+
+    table = ProfileTrigger.__table__
+    try:
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.user_id, table.c.endpoint, table.c.mode)
+                .where(table.c.remaining > 0, table.c.expires_at > datetime.utcnow())
+            ).all()
+        cache['triggers'] = [tuple(row) for row in rows]
+    except Exception as e:
+        print(f"Error loading profile triggers: {str(e)}")
+        cache['triggers'] = []
+
+    cache['loaded_at'] = time.monotonic()
+    return cache['triggers']
+
+
+def _claim_trigger(app):
+    """Use up one capture of an armed trigger matching this request; returns (id, mode) or None"""
+    from models import db
+    from models.profile_trigger import ProfileTrigger
+
+    triggers = _active_triggers(app)
+    user_id = session.get('_user_id')  # Avoids loading the user on every request
+    if not triggers or not user_id:
+        return None
+
+    table = ProfileTrigger.__table__
+    for trigger_id, trigger_user_id, endpoint, mode in triggers:
+        if str(trigger_user_id) != user_id or (endpoint and endpoint != request.endpoint):
+            continue
+
+        # Conditional decrement, so concurrent workers can't overshoot the count
+        with db.engine.begin() as connection:
+            claimed = connection.execute(
+                update(table)
+                .where(table.c.id == trigger_id, table.c.remaining > 0)
+                .values(remaining=table.c.remaining - 1)
+            ).rowcount
+        if claimed:
+            return trigger_id, mode
+
+    return None
+
+
+def refresh_triggers(app):
+    """Drop this process's cached trigger list so changes apply on the next request"""
+    app.extensions.pop('profile_triggers', None)
+
+
+def _observe_statement(bind, statement, parameters, seconds):
+    """Record a SQL statement against the request being profiled"""
+    if has_request_context():
+        profile = g.get('_profile')
+        if profile is not None:
+            profile.statements.append({'bind': bind, 'statement': statement, 'ms': seconds * 1000})
+
+
+def _save_capture(app, profile, response):
+    """Write the capture file and its profiles row; returns the new profile id"""
+    from models import db
+    from models.profile import Profile
+
+    capture = profile.finish()
+    capture.update({
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status_code': response.status_code,
+    })
+
+    os.makedirs(app.config['PROFILE_FOLDER'], exist_ok=True)
+    result_file = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.json"
+    with open(os.path.join(app.config['PROFILE_FOLDER'], result_file), 'w') as f:
+        json.dump(capture, f)
+
+    user_id = session.get('_user_id')
+    table = Profile.__table__
+    with db.engine.begin() as connection:
+        profile_id = connection.execute(insert(table).values(
+            created_at=datetime.utcnow(),
+            mode=profile.mode,
+            method=capture['method'],
+            path=capture['path'][:500],
+            endpoint=capture['endpoint'],
+            user_id=int(user_id) if user_id else None,
+            status_code=response.status_code,
+            duration_ms=capture['duration_ms'],
+            sample_count=profile.sample_count(),
+            sql_count=len(capture['sql']),
+            sql_ms=sum(statement['ms'] for statement in capture['sql']),
+            peak_memory=capture.get('peak_bytes'),
+            result_file=result_file,
+        )).inserted_primary_key[0]
+
+        # Keep only the newest PROFILE_MAX_CAPTURES
+        stale = connection.execute(
+            select(table.c.id, table.c.result_file)
+            .order_by(desc(table.c.created_at), desc(table.c.id))
+            .offset(app.config['PROFILE_MAX_CAPTURES'])
+        ).all()
+        if stale:
+            connection.execute(delete(table).where(table.c.id.in_([row.id for row in stale])))
+
+    for row in stale:
+        path = os.path.join(app.config['PROFILE_FOLDER'], row.result_file)
+        if os.path.exists(path):
+            os.remove(path)
+
+    return profile_id
+
+
+def init_profiler(app):
+    """Register the request hooks that start and save profiles"""
+    if not app.config['PROFILE_ENABLED']:
+        return
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint == 'static':
+            return
+
+        mode = _requested_mode()
+        trigger_id = None
+        if mode is None:
+            claimed = _claim_trigger(app)
+            if claimed is None:
+                return
+            trigger_id, mode = claimed
+
+        if mode == 'memory' and not _memory_lock.acquire(blocking=False):
+            print(f"Skipping memory profile of {request.path}: another capture is running")
+            return
+
+        g._profile = RequestProfile(mode, app, trigger_id)
+
+    @app.after_request
+    def save_profile(response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+
+        try:
+            response.headers['X-Profile-Id'] = str(_save_capture(app, profile, response))
+        except Exception as e:
+            print(f"Error saving profile of {request.path}: {str(e)}")
+        return response
+
+    @app.teardown_request
+    def discard_profile(exception=None):
+        # Requests that never produced a response still stop their sampler
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            profile.finish()
+
+    add_statement_observer(_observe_statement)
+
+
+def load_capture(profile):
+    """Read a profile's capture file (requires app context)"""
+    path = os.path.join(current_app.config['PROFILE_FOLDER'], profile.result_file)
+    with open(path) as f:
+        return json.load(f)
+
+
+def _frame_label(frame):
+    return f"{frame['name']} ({frame['file']}:{frame['line']})"
+
+
+def to_collapsed(capture):
+    """Render sampled stacks in Brendan Gregg's collapsed format (for flamegraph.pl and friends)"""
+    frames = capture.get('frames', [])
+    return ''.join(f"{';'.join(_frame_label(frames[i]) for i in stack)} {count}\n"
+                   for stack, count in capture.get('stacks', []))
+
+
+def to_speedscope(capture, name):
+    """Render sampled stacks as a speedscope file (https://www.speedscope.app)"""
+    stacks = capture.get('stacks', [])
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': capture.get('frames', [])},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': capture['duration_ms'],
+            'samples': [stack for stack, _ in stacks],
+            'weights': [count * capture['interval_ms'] for _, count in stacks],
+        }],
+        'exporter': 'DurinsGate profiler',
+    }
+
+
+def to_memory_report(capture):
+    """Render the tracemalloc comparison as plain text"""
+    lines = [f"Peak traced memory: {capture.get('peak_bytes', 0) / 1024:.1f} KiB",
+             f"Top {len(capture.get('memory', []))} lines by memory still allocated at the end of the request:", '']
+    for stat in capture.get('memory', []):
+        lines.append(f"{stat['location']}: size={stat['size_bytes'] / 1024:.1f} KiB "
+                     f"({stat['size_diff_bytes'] / 1024:+.1f} KiB), count={stat['count']} ({stat['count_diff']:+d})")
+    return '\n'.join(lines) + '\n'
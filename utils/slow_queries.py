@@ -0,0 +1,253 @@
+"""Slow-query log - statements over a threshold with their call site and query plan"""
+import hashlib
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from flask import current_app, has_app_context, has_request_context, request, g
+from sqlalchemy import insert, select, delete, desc
+
+
+# Statements that can be explained without side effects
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SKIP_FILES = (os.path.join(_ROOT, 'utils', 'database.py'), os.path.abspath(__file__))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+# Lets the recorder thread run its own EXPLAINs and inserts without logging them
+_local = threading.local()
+
+
+def normalize_sql(statement):
+    """Replace literals and placeholders with ? and collapse IN lists and whitespace"""
+    normalized = _STRING.sub('?', statement)
+    normalized = _PARAM.sub('?', normalized)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _IN_LIST.sub('(?, ...)', normalized)
+    return _SPACE.sub(' ', normalized).strip()
+
+
+def fingerprint(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def find_call_site():
+    """First frame in application code that led to the statement, e.g. 'admin/routes.py:42 in customers'"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_ROOT) and filename not in _SKIP_FILES and 'site-packages' not in filename:
+            return f"{os.path.relpath(filename, _ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def explain(connection, statement, parameters):
+    """Return the plan for a statement as text, or None if this database can't explain it"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        # Rows are (id, parent, notused, detail); indent children under their parent
+        depth = {0: -1}
+        lines = []
+        for row_id, parent, _, detail in rows:
+            depth[row_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[row_id] + detail)
+        return '\n'.join(lines)
+    if dialect == 'postgresql':
+        return '\n'.join(row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters))
+    return None
+
+
+class SlowQueryRecorder:
+    """
+    Explains and stores slow statements on a background thread
+
+    Request threads only queue what they saw; EXPLAIN and the insert
+    happen later on a separate connection. Each fingerprint is explained
+    at most once per explain_interval seconds; when the queue is full new
+    entries are dropped. The thread starts with the first entry in each
+    process, so a worker forked from a preloaded app gets its own.
+    """
+
+    MAX_QUEUE = 1000
+
+    def __init__(self, app):
+        self.app = app
+        self.max_rows = app.config['SLOW_QUERY_MAX_ROWS']
+        self.explain_enabled = app.config['SLOW_QUERY_EXPLAIN']
+        self.explain_interval = app.config['SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS']
+        self.entries = queue.Queue(self.MAX_QUEUE)
+        self.plans = {}  # fingerprint -> (explained at, plan)
+        self.inserted = 0
+        self.thread = None
+        self.pid = None
+        self.start_lock = threading.Lock()
+
+    def _ensure_thread(self):
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid != os.getpid():
+                self.thread = threading.Thread(target=self._run, name='slow-query-log', daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+
+    def add(self, entry):
+        self._ensure_thread()
+        try:
+            self.entries.put_nowait(entry)
+        except queue.Full:
+            pass
+
+    def _plan(self, entry):
+        from models import db
+
+        if not self.explain_enabled or entry['executemany']:
+            return None
+        if not entry['statement'].lstrip().upper().startswith(EXPLAINABLE):
+            return None
+
+        cached = self.plans.get(entry['fingerprint'])
+        if cached and time.monotonic() - cached[0] < self.explain_interval:
+            return cached[1]
+
+        engine = db.engines[None if entry['bind'] == 'primary' else entry['bind']]
+        try:
+            with engine.connect() as connection:
+                plan = explain(connection, entry['statement'], entry['parameters'])
+        except Exception as e:
+            plan = f"EXPLAIN failed: {str(e)}"
+
+        self.plans[entry['fingerprint']] = (time.monotonic(), plan)
+        return plan
+
+    def record(self, entry):
+        """Explain and store one slow statement (runs on the recorder thread)"""
+        from models import db
+        from models.slow_query import SlowQuery
+
+        table = SlowQuery.__table__
+        with self.app.app_context():
+            row = {
+                'created_at': entry['created_at'],
+                'bind': entry['bind'],
+                'fingerprint': entry['fingerprint'],
+                'normalized_sql': entry['normalized_sql'],
+                'params_fingerprint': entry['params_fingerprint'],
+                'duration_ms': entry['duration_ms'],
+                'endpoint': entry['endpoint'],
+                'call_site': entry['call_site'],
+                'plan': self._plan(entry),
+            }
+
+            with db.engine.begin() as connection:
+                connection.execute(insert(table).values(**row))
+                self.inserted += 1
+
+                # Rotate: every 100 inserts drop everything older than the newest max_rows
+                if self.inserted % 100 == 0:
+                    cutoff = connection.execute(
+                        select(table.c.id).order_by(desc(table.c.id)).offset(self.max_rows).limit(1)
+                    ).scalar()
+                    if cutoff is not None:
+                        connection.execute(delete(table).where(table.c.id <= cutoff))
+
+    def _run(self):
+        _local.suppressed = True
+        while True:
+            entry = self.entries.get()
+            try:
+                self.record(entry)
+            except Exception as e:
+                print(f"Error recording slow query {entry['fingerprint']}: {str(e)}")
+            finally:
+                self.entries.task_done()
+
+    def wait(self):
+        """Block until everything queued so far is stored"""
+        self.entries.join()
+
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint
+    return g.get('job_name') if has_app_context() else None
+
+
+def _observe_statement(bind, statement, parameters, seconds):
+    """Queue statements over the threshold for the recorder"""
+    if getattr(_local, 'suppressed', False) or not has_app_context():
+        return
+
+    recorder = current_app.extensions.get('slow_query_log')
+    if recorder is None or seconds * 1000 < current_app.config['SLOW_QUERY_THRESHOLD_MS']:
+        return
+
+    normalized = normalize_sql(statement)
+    recorder.add({
+        'created_at': datetime.utcnow(),
+        'bind': bind,
+        'statement': statement,
+        'parameters': parameters,
+        'executemany': isinstance(parameters, list),
+        'fingerprint': fingerprint(normalized),
+        'normalized_sql': normalized,
+        'params_fingerprint': fingerprint(repr(parameters)),
+        'duration_ms': seconds * 1000,
+        'endpoint': _current_endpoint(),
+        'call_site': find_call_site(),
+    })
+
+
+def init_slow_query_log(app):
+    """Start the recorder and watch every statement's duration"""
+    from utils.database import add_statement_observer
+
+    if not app.config['SLOW_QUERY_ENABLED']:
+        return
+
+    app.extensions['slow_query_log'] = SlowQueryRecorder(app)
+    add_statement_observer(_observe_statement)
+
+
+def get_slow_query_summary(limit=50):
+    """Slow statements grouped by fingerprint, worst total time first (requires app context)"""
+    from models import db
+    from models.slow_query import SlowQuery
+    from sqlalchemy import func
+
+    groups = db.session.query(
+        SlowQuery.fingerprint,
+        func.count(SlowQuery.id).label('count'),
+        func.sum(SlowQuery.duration_ms).label('total_ms'),
+        func.avg(SlowQuery.duration_ms).label('avg_ms'),
+        func.max(SlowQuery.duration_ms).label('max_ms'),
+        func.max(SlowQuery.created_at).label('last_seen'),
+        func.max(SlowQuery.id).label('latest_id'),
+    ).group_by(SlowQuery.fingerprint)\
+        .order_by(desc('total_ms'))\
+        .limit(limit)\
+        .all()
+
+    latest = {row.id: row for row in
+              SlowQuery.query.filter(SlowQuery.id.in_([group.latest_id for group in groups])).all()}
+
+    return [{
+        'fingerprint': group.fingerprint,
+        'count': group.count,
+        'total_ms': group.total_ms,
+        'avg_ms': group.avg_ms,
+        'max_ms': group.max_ms,
+        'last_seen': group.last_seen,
+        'sample': latest.get(group.latest_id),
+    } for group in groups]
@@ -0,0 +1,321 @@
+"""Pluggable storage backends for uploaded file blobs"""
+import gzip
+import io
+import os
+import shutil
+import tempfile
+from flask import current_app
+
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+
+class StorageBackend:
+    """
+    Interface implemented by every storage backend
+
+    Keys are '/'-separated paths relative to the backend root, e.g.
+    'User_Manual/20240101_120000_abcdef.pdf'. Missing blobs raise
+    FileNotFoundError regardless of backend.
+    """
+    name = None
+    supports_presigned_urls = False
+
+    def put(self, key, stream):
+        """Store a binary stream under key. Returns: bytes written"""
+        raise NotImplementedError
+
+    def put_compressed(self, key, stream):
+        """Store a binary stream gzip-compressed under key. Returns: bytes written"""
+        return self.put(key, _GzipReader(stream))
+
+    def open(self, key, start=None, end=None):
+        """Open a blob for reading, optionally limited to bytes start..end (inclusive)"""
+        raise NotImplementedError
+
+    def size(self, key):
+        """Return the size of a blob in bytes"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        """Check if a blob exists"""
+        try:
+            self.size(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def delete(self, key):
+        """Delete a blob (missing blobs are ignored)"""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Return a filesystem path for the blob, or None if it is not on local disk"""
+        return None
+
+    def presigned_url(self, key, download_name, expires_in):
+        """Return a time-limited URL the client can fetch directly, or None"""
+        return None
+
+    def iter_chunks(self, key, start=None, end=None, chunk_size=CHUNK_SIZE, decompress=False):
+        """
+        Yield a blob (or byte range) in chunks, closing the stream when done
+
+        With decompress=True the blob is treated as gzip data and the
+        original bytes are yielded; ranges are not supported in that mode.
+        """
+        stream = self.open(key, start, end)
+        if decompress:
+            stream = gzip.GzipFile(fileobj=stream, mode='rb')
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            stream.close()
+
+
+class _GzipReader:
+    """Stream wrapper that gzip-compresses another stream as it is read"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = io.BytesIO()
+        self.compressor = gzip.GzipFile(fileobj=self.buffer, mode='wb', compresslevel=6)
+        self.pending = b''
+        self.finished = False
+
+    def _fill(self, size):
+        while len(self.pending) < size and not self.finished:
+            chunk = self.stream.read(CHUNK_SIZE)
+            if chunk:
+                self.compressor.write(chunk)
+            else:
+                self.compressor.close()
+                self.finished = True
+            self.pending += self.buffer.getvalue()
+            self.buffer.seek(0)
+            self.buffer.truncate()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self._fill(float('inf'))
+            data, self.pending = self.pending, b''
+            return data
+
+        self._fill(size)
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+class _RangeReader:
+    """File wrapper that stops reading after a fixed number of bytes"""
+
+    def __init__(self, fh, remaining):
+        self.fh = fh
+        self.remaining = remaining
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fh.close()
+
+
+class LocalStorage(StorageBackend):
+    """Blobs stored on the local filesystem under a root directory"""
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        # Rows created before storage backends existed hold absolute paths
+        if os.path.isabs(key):
+            return key
+
+        path = os.path.abspath(os.path.join(self.root, *key.split('/')))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Storage key escapes storage root: {key}")
+        return path
+
+    def put(self, key, stream):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary name so readers never see a partial blob; each
+        # writer gets its own, so concurrent puts of one key never interleave
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.",
+                                        suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                shutil.copyfileobj(stream, fh, CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return os.path.getsize(path)
+
+    def open(self, key, start=None, end=None):
+        fh = open(self._path(key), 'rb')
+        if start is None:
+            return fh
+
+        fh.seek(start)
+        if end is None:
+            return fh
+        return _RangeReader(fh, end - start + 1)
+
+    def size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key):
+        return self._path(key)
+
+
+class S3Storage(StorageBackend):
+    """Blobs stored in an S3-compatible bucket (AWS S3, MinIO, Ceph RGW, ...)"""
+    name = 's3'
+    supports_presigned_urls = True
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None,
+                 access_key_id=None, secret_access_key=None):
+        try:
+            import boto3
+            from botocore.config import Config as BotoConfig
+        except ImportError:
+            raise RuntimeError("The S3 storage backend requires boto3 (pip install boto3)")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        # boto3 clients are thread-safe, so one client is shared by all threads
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+            config=BotoConfig(signature_version='s3v4', retries={'max_attempts': 5})
+        )
+
+    def _key(self, key):
+        key = key.lstrip('/')
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _not_found(self, error):
+        code = error.response.get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def put(self, key, stream):
+        # upload_fileobj streams in multipart chunks instead of buffering the whole file
+        counter = _CountingReader(stream)
+        self.client.upload_fileobj(counter, self.bucket, self._key(key))
+        return counter.count
+
+    def open(self, key, start=None, end=None):
+        from botocore.exceptions import ClientError
+
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if start is not None:
+            params['Range'] = f"bytes={start}-{'' if end is None else end}"
+
+        try:
+            return self.client.get_object(**params)['Body']
+        except ClientError as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def size(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['ContentLength']
+        except ClientError as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def presigned_url(self, key, download_name, expires_in):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': self.bucket,
+                'Key': self._key(key),
+                'ResponseContentDisposition': content_disposition(download_name)
+            },
+            ExpiresIn=int(expires_in.total_seconds())
+        )
+
+
+class _CountingReader:
+    """Stream wrapper that counts bytes read"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.count += len(data)
+        return data
+
+
+def content_disposition(download_name):
+    """Build an attachment Content-Disposition header for a download name"""
+    from urllib.parse import quote
+    ascii_name = download_name.encode('ascii', 'ignore').decode('ascii').replace('"', '')
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(download_name)}"
+
+
+def create_storage(name, config):
+    """Build a storage backend from configuration"""
+    if name == 'local':
+        return LocalStorage(config['UPLOAD_FOLDER'])
+
+    if name == 'cold':
+        return LocalStorage(config['COLD_STORAGE_FOLDER'])
+
+    if name == 's3':
+        return S3Storage(
+            bucket=config['S3_BUCKET'],
+            prefix=config['S3_PREFIX'],
+            endpoint_url=config['S3_ENDPOINT_URL'],
+            region=config['S3_REGION'],
+            access_key_id=config['S3_ACCESS_KEY_ID'],
+            secret_access_key=config['S3_SECRET_ACCESS_KEY']
+        )
+
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+def get_storage(name=None):
+    """Return the storage backend with the given name (default: STORAGE_BACKEND)"""
+    app = current_app._get_current_object()
+    if name is None:
+        name = app.config['STORAGE_BACKEND']
+
+    backends = app.extensions.setdefault('storage', {})
+    if name not in backends:
+        backends[name] = create_storage(name, app.config)
+
+    return backends[name]
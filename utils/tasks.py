@@ -0,0 +1,102 @@
+"""Job handlers run by the background worker"""
+from utils.database import is_sqlite
+from utils.jobs import job, periodic
+
+
+@job('verify_file')
+def verify_file(file_id):
+    """Re-read a freshly stored file and record an integrity check"""
+    from utils.integrity import run_scrub
+
+    summary = run_scrub(max_workers=1, file_ids=[file_id])
+    print(f"Verified file {file_id}: {summary}")
+
+
+@job('generate_preview', max_attempts=1)
+def generate_preview(file_id):
+    """Render previews for a file; failures are recorded on the row, not retried"""
+    from utils.previews import generate_preview as render
+
+    render(file_id)
+
+
+@job('scrub_files', max_attempts=1)
+def scrub_files():
+    """Full integrity scrub of all active files"""
+    from utils.integrity import run_scrub
+
+    summary = run_scrub()
+    print(f"Integrity scrub complete: {summary}")
+
+
+@job('tier_files', max_attempts=1)
+def tier_files():
+    """Demote unpopular files to the cold tier"""
+    from utils.tiering import run_tiering
+
+    summary = run_tiering()
+    print(f"Storage tiering complete: {summary}")
+
+
+@job('promote_file')
+def promote_file(file_id):
+    """Move a cold file back to the hot tier"""
+    from utils.tiering import promote_file as promote
+
+    promote(file_id)
+
+
+@job('delete_replaced_blobs')
+def delete_replaced_blobs(blobs):
+    """Delete blobs left behind by a tier move once the grace period is over"""
+    from utils.tiering import delete_replaced_blobs as delete
+
+    delete([tuple(blob) for blob in blobs])
+
+
+@job('send_new_file_notification')
+def send_new_file_notification(user_id, file_id, assigned_by_id):
+    """Email a customer about a newly assigned file"""
+    from models import db
+    from models.file import File
+    from models.user import User
+    from utils.email_service import send_new_file_notification as send
+
+    user = db.session.get(User, user_id)
+    file = db.session.get(File, file_id)
+    assigned_by = db.session.get(User, assigned_by_id)
+    if not user or not file or not assigned_by:
+        return
+
+    send(user, file, assigned_by)
+
+
+@job('checkpoint_database', max_attempts=1)
+def checkpoint_database(mode='PASSIVE'):
+    """Fold the SQLite WAL back into the database file so it does not grow unbounded"""
+    from utils.database import checkpoint_wal
+
+    busy, wal_pages, checkpointed = checkpoint_wal(mode)
+    if busy:
+        print(f"WAL checkpoint incomplete: {checkpointed}/{wal_pages} pages")
+
+
+@job('analyze_database', max_attempts=1)
+def analyze_database():
+    """Refresh SQLite query planner statistics"""
+    from utils.database import analyze_database as analyze
+
+    analyze()
+
+
+def register_periodic_jobs(app):
+    """Register cron-style periodic jobs from the app config (called once by the worker)"""
+    if app.config['SCRUB_SCHEDULE']:
+        periodic('scrub_files', app.config['SCRUB_SCHEDULE'])
+    if app.config['TIER_SCHEDULE']:
+        periodic('tier_files', app.config['TIER_SCHEDULE'])
+    if is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        if app.config['SQLITE_CHECKPOINT_SCHEDULE']:
+            periodic('checkpoint_database', app.config['SQLITE_CHECKPOINT_SCHEDULE'])
+        if app.config['SQLITE_ANALYZE_SCHEDULE']:
+            periodic('analyze_database', app.config['SQLITE_ANALYZE_SCHEDULE'])
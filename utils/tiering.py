@@ -0,0 +1,258 @@
+"""Popularity-driven hot/cold storage tiering"""
+import gzip
+import re
+import secrets
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, desc
+
+
+TIER_HOT = 'hot'
+TIER_COLD = 'cold'
+
+COLD_KEY_PREFIX = 'cold/'
+COMPRESSED_SUFFIX = '.gz'
+MOVE_TOKEN = re.compile(r'~[0-9a-f]{8}(?=(\.[^./]*)?$)')  # '~1a2b3c4d' before the extension
+
+
+def download_counts(since):
+    """Subquery of (file_id, downloads) for successful downloads since the given date"""
+    from models import db
+    from models.download_log import DownloadLog
+
+    # Aggregated in SQL: the window can hold thousands of downloaded files
+    return db.session.query(DownloadLog.file_id, func.count(DownloadLog.id).label('downloads'))\
+        .filter(DownloadLog.success == True)\
+        .filter(DownloadLog.download_date >= since)\
+        .group_by(DownloadLog.file_id)\
+        .subquery()
+
+
+def get_popular_cold_files(since, limit=50):
+    """Return [(file, downloads since the given date)] for the most downloaded active cold files"""
+    from models import db
+    from models.file import File
+
+    downloads = download_counts(since)
+    return db.session.query(File, downloads.c.downloads)\
+        .join(downloads, File.id == downloads.c.file_id)\
+        .filter(File.is_active == True, File.storage_tier == TIER_COLD)\
+        .order_by(desc(downloads.c.downloads), File.id)\
+        .limit(limit)\
+        .all()
+
+
+def plan_demotions():
+    """Return hot files whose recent download count makes them cold"""
+    from models.file import File
+
+    now = datetime.utcnow()
+    downloads = download_counts(now - current_app.config['TIER_WINDOW'])
+
+    # Files without a download in the window have no row in the subquery
+    return File.query.outerjoin(downloads, File.id == downloads.c.file_id)\
+        .filter(File.is_active == True, File.storage_tier == TIER_HOT)\
+        .filter(File.upload_date < now - current_app.config['TIER_MIN_AGE'])\
+        .filter(func.coalesce(downloads.c.downloads, 0) <= current_app.config['TIER_COLD_MAX_DOWNLOADS'])\
+        .order_by(File.id)\
+        .all()
+
+
+def _tier_key(file, tier, target_name, compress):
+    """
+    Work out a fresh storage key for a file in the target tier
+
+    Each move gets its own key (a random token before the extension), so
+    concurrent moves of one file never write to or delete each other's blob.
+    """
+    from utils.file_handler import get_relative_storage_key
+
+    key = get_relative_storage_key(file)
+    if file.is_compressed and key.endswith(COMPRESSED_SUFFIX):
+        key = key[:-len(COMPRESSED_SUFFIX)]
+    if key.startswith(COLD_KEY_PREFIX):
+        key = key[len(COLD_KEY_PREFIX):]
+
+    key = MOVE_TOKEN.sub('', key)
+    directory, _, name = key.rpartition('/')
+    stem, dot, extension = name.partition('.') if '.' in name else (name, '', '')
+    key = f"{directory + '/' if directory else ''}{stem}~{secrets.token_hex(4)}{dot}{extension}"
+
+    # Keep cold copies apart when both tiers share one backend
+    if tier == TIER_COLD and target_name == current_app.config['STORAGE_BACKEND']:
+        key = f"{COLD_KEY_PREFIX}{key}"
+    if compress:
+        key += COMPRESSED_SUFFIX
+
+    return key
+
+
+def move_file(file, tier):
+    """
+    Copy a file's blob into the given tier and repoint the File row
+
+    The old blob is left in place so downloads already streaming it are
+    not broken; the caller deletes it once in-flight requests have had
+    time to finish.
+
+    Returns: (old backend name, old storage key), or None if already in tier
+    or another process moved it first
+    """
+    from models import db
+    from models.file import File
+    from utils.integrity import compute_checksum
+    from utils.storage import get_storage
+
+    if file.storage_tier == tier:
+        return None
+
+    if tier == TIER_COLD:
+        target_name = current_app.config['COLD_STORAGE_BACKEND']
+        compress = current_app.config['TIER_COMPRESS_COLD']
+    else:
+        target_name = current_app.config['STORAGE_BACKEND']
+        compress = False
+
+    source = get_storage(file.storage_backend)
+    target = get_storage(target_name)
+    key = _tier_key(file, tier, target_name, compress)
+
+    stream = source.open(file.file_path)
+    if file.is_compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    try:
+        if compress:
+            target.put_compressed(key, stream)
+        else:
+            target.put(key, stream)
+    finally:
+        stream.close()
+
+    # Verify the copy before the row is switched over; the key is this call's own
+    checksum, size = compute_checksum(target, key, compressed=compress)
+    if size != file.file_size or (file.checksum and checksum != file.checksum):
+        target.delete(key)
+        raise IOError(f"Verification failed after moving file {file.id} to {tier} tier")
+
+    old_blob = (file.storage_backend, file.file_path)
+
+    # Switch the row only if it still points at the blob this copy was made from
+    switched = File.query.filter_by(id=file.id, storage_backend=old_blob[0], file_path=old_blob[1])\
+        .update({'storage_backend': target_name, 'file_path': key, 'storage_tier': tier,
+                 'is_compressed': compress}, synchronize_session=False)
+    db.session.commit()
+
+    if not switched:
+        # Another process moved the file first; nothing references this copy
+        target.delete(key)
+        return None
+
+    return old_blob
+
+
+def delete_replaced_blobs(blobs):
+    """Delete blobs a move replaced, unless a row points at them again (requires app context)"""
+    from models.file import File
+    from utils.storage import get_storage
+
+    for backend, key in blobs:
+        # A promotion may have written the same key again in the meantime
+        if File.query.filter_by(storage_backend=backend, file_path=key).first():
+            continue
+        try:
+            get_storage(backend).delete(key)
+        except Exception as e:
+            print(f"Error deleting replaced blob {key}: {str(e)}")
+
+
+def delete_blobs_later(blobs, delay=None):
+    """Queue deletion of replaced blobs after a grace period so in-flight downloads can finish"""
+    from utils.jobs import enqueue
+
+    if not blobs:
+        return None
+
+    if delay is None:
+        delay = current_app.config['TIER_DELETE_GRACE_SECONDS']
+
+    return enqueue('delete_replaced_blobs', {'blobs': [list(blob) for blob in blobs]},
+                   delay=timedelta(seconds=delay))
+
+
+def run_tiering():
+    """
+    Demote unpopular hot files to the cold tier (requires app context)
+
+    Returns: dict with demoted/failed counts and bytes moved
+    """
+    summary = {'demoted': 0, 'failed': 0, 'bytes': 0}
+    replaced = []
+
+    for file in plan_demotions():
+        try:
+            old_blob = move_file(file, TIER_COLD)
+        except Exception as e:
+            from models import db
+            db.session.rollback()
+            summary['failed'] += 1
+            print(f"Error demoting file {file.id}: {str(e)}")
+            continue
+
+        if old_blob:
+            replaced.append(old_blob)
+            summary['demoted'] += 1
+            summary['bytes'] += file.file_size
+
+    delete_blobs_later(replaced)
+    return summary
+
+
+def promote_file(file_id):
+    """Move a cold file back to the hot tier (requires app context)"""
+    from models import db
+    from models.file import File
+
+    file = db.session.get(File, file_id)
+    if not file or file.storage_tier != TIER_COLD:
+        return False
+
+    old_blob = move_file(file, TIER_HOT)
+    if old_blob is None:
+        return False  # Another process promoted it first
+
+    delete_blobs_later([old_blob])
+    return True
+
+
+def get_tier_stats():
+    """Return tier placement and download hit ratios for the admin report"""
+    from models import db
+    from models.download_log import DownloadLog
+    from models.file import File
+
+    placement = db.session.query(
+        File.storage_tier,
+        File.storage_backend,
+        func.count(File.id),
+        func.coalesce(func.sum(File.file_size), 0)
+    ).filter(File.is_active == True)\
+     .group_by(File.storage_tier, File.storage_backend)\
+     .all()
+
+    since = datetime.utcnow() - current_app.config['TIER_WINDOW']
+    served = dict(
+        db.session.query(DownloadLog.served_tier, func.count(DownloadLog.id))
+        .filter(DownloadLog.success == True)
+        .filter(DownloadLog.download_date >= since)
+        .filter(DownloadLog.served_tier.isnot(None))
+        .group_by(DownloadLog.served_tier)
+        .all()
+    )
+    total_served = sum(served.values())
+
+    return {
+        'placement': placement,
+        'served': served,
+        'hot_hit_ratio': served.get(TIER_HOT, 0) / total_served if total_served else None,
+        'total_served': total_served,
+    }
@@ -0,0 +1,391 @@
+"""Lightweight tracing - nested spans with context propagation and JSONL / OTLP export"""
+import atexit
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from flask import g, request
+from werkzeug.wsgi import ClosingIterator
+
+
+# Span currently active in this thread / context
+_current_span = contextvars.ContextVar('trace_span', default=None)
+
+# WSGI environ key holding the callback that ends a request's spans
+ON_CLOSE_KEY = 'durinsgate.tracing.on_close'
+
+# Process-wide exporter and sampling rate, set by init_tracing
+_exporter = None
+_sample_rate = 1.0
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, start_ns=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, exception):
+        self.error = f"{type(exception).__name__}: {exception}"
+
+    def end(self, end_ns=None):
+        """Finish the span and hand it to the exporter (later calls are ignored)"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if _exporter is not None:
+            _exporter.export(self)
+
+    def traceparent(self):
+        """W3C traceparent header value pointing at this span"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': (self.end_ns - self.start_ns) / 1e6,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+def parse_traceparent(value):
+    """Return (trace_id, parent span_id, sampled) from a traceparent header, or None if malformed"""
+    parts = (value or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+def start_trace(name, traceparent=None, **attributes):
+    """
+    Start a root span, or continue the trace named by a traceparent value
+
+    Returns None when tracing is off or the trace is not sampled; callers
+    then run untraced and nested span() calls cost next to nothing.
+    """
+    if _exporter is None:
+        return None
+
+    parent = parse_traceparent(traceparent)
+    if parent:
+        trace_id, parent_id, sampled = parent
+        if not sampled:
+            return None
+    else:
+        if random.random() >= _sample_rate:
+            return None
+        trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+
+    return Span(name, trace_id, parent_id, attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_traceparent():
+    """traceparent for the active span, for handing work to another thread or process"""
+    active = _current_span.get()
+    return active.traceparent() if active else None
+
+
+def activate(active):
+    """Make a span current; returns a token for deactivate()"""
+    return _current_span.set(active)
+
+
+def deactivate(token):
+    _current_span.reset(token)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a child of the active span (no-op outside a trace)"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, parent.trace_id, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def traced(name=None):
+    """Decorator form of span(), named after the function by default"""
+    def decorator(f):
+        span_name = name or f"{f.__module__}.{f.__qualname__}"
+
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            with span(span_name):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def record_span(name, seconds, **attributes):
+    """Add an already finished child span that ended just now (e.g. from an event hook)"""
+    parent = _current_span.get()
+    if parent is None:
+        return
+
+    end_ns = time.time_ns()
+    Span(name, parent.trace_id, parent.span_id, attributes, start_ns=end_ns - int(seconds * 1e9)).end(end_ns)
+
+
+def with_trace_context(f):
+    """Wrap a callable so it runs in the caller's trace context, e.g. as a Thread target"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(f)
+    def run_in_context(*args, **kwargs):
+        return context.run(f, *args, **kwargs)
+    return run_in_context
+
+
+class JsonlExporter:
+    """Appends one JSON object per finished span to a local file"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a', buffering=1)
+        self.lock = threading.Lock()
+
+    def export(self, finished):
+        line = json.dumps(finished.to_dict(), default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def shutdown(self):
+        with self.lock:
+            self.file.flush()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class OtlpExporter:
+    """
+    Sends spans to an OpenTelemetry collector over OTLP/HTTP (JSON encoding)
+
+    Spans are queued and posted in batches from a background thread every
+    interval seconds, so requests never wait on the collector. When the
+    queue is full new spans are dropped. The thread starts with the first
+    span in each process, so a worker forked from a preloaded app gets its own.
+    """
+
+    MAX_QUEUE = 10000
+    MAX_BATCH = 512
+
+    def __init__(self, endpoint, service_name, interval):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.service_name = service_name
+        self.interval = interval
+        self.spans = queue.Queue(self.MAX_QUEUE)
+        self.dropped = 0
+        self.thread = None
+        self.pid = None
+        self.start_lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def _ensure_thread(self):
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid != os.getpid():
+                self.thread = threading.Thread(target=self._run, name='otlp-exporter', daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+
+    def export(self, finished):
+        self._ensure_thread()
+        try:
+            self.spans.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _encode(self, batch):
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': _otlp_value(self.service_name)}]},
+            'scopeSpans': [{
+                'scope': {'name': 'durinsgate.tracing'},
+                'spans': [{
+                    'traceId': s.trace_id,
+                    'spanId': s.span_id,
+                    'parentSpanId': s.parent_id or '',
+                    'name': s.name,
+                    'kind': 1,  # SPAN_KIND_INTERNAL
+                    'startTimeUnixNano': str(s.start_ns),
+                    'endTimeUnixNano': str(s.end_ns),
+                    'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in s.attributes.items()],
+                    'status': {'code': 2, 'message': s.error} if s.error else {'code': 1},
+                } for s in batch],
+            }],
+        }]}
+
+    def flush(self):
+        """Post everything queued so far"""
+        while True:
+            batch = []
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    batch.append(self.spans.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+
+            body = json.dumps(self._encode(batch)).encode()
+            post = urllib.request.Request(self.url, data=body, method='POST',
+                                          headers={'Content-Type': 'application/json'})
+            try:
+                urllib.request.urlopen(post, timeout=5).close()
+            except Exception as e:
+                print(f"Error exporting {len(batch)} spans to {self.url}: {str(e)}")
+                return
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def shutdown(self):
+        self.flush()
+
+
+def _create_exporter(config):
+    exporter = config['TRACING_EXPORTER']
+    if exporter == 'jsonl':
+        return JsonlExporter(config['TRACING_JSONL_PATH'])
+    if exporter == 'otlp':
+        return OtlpExporter(config['TRACING_OTLP_ENDPOINT'], config['TRACING_SERVICE_NAME'],
+                            config['TRACING_EXPORT_INTERVAL_SECONDS'])
+    raise ValueError(f"Unknown TRACING_EXPORTER: {exporter}")
+
+
+def _observe_statement(bind, statement, parameters, seconds):
+    """Turn each SQL statement into a child span of the active span"""
+    if _current_span.get() is not None:
+        record_span('db.query', seconds, **{'db.bind': bind, 'db.statement': statement[:500]})
+
+
+def _end_spans_on_close(wsgi_app):
+    """
+    WSGI middleware ending request spans once the server has sent the body
+
+    Response.call_on_close is not enough: send_file responses hand their
+    file wrapper straight to the server and never call it.
+    """
+    @functools.wraps(wsgi_app)
+    def middleware(environ, start_response):
+        app_iter = wsgi_app(environ, start_response)
+        on_close = environ.pop(ON_CLOSE_KEY, None)
+        if on_close is None:
+            return app_iter
+        return ClosingIterator(app_iter, on_close)
+    return middleware
+
+
+def init_tracing(app):
+    """Set up the exporter and the request hooks that open a root span per request"""
+    global _exporter, _sample_rate
+    from utils.database import add_statement_observer
+
+    if not app.config['TRACING_ENABLED']:
+        return
+
+    if _exporter is None:
+        _exporter = _create_exporter(app.config)
+    _sample_rate = app.config['TRACING_SAMPLE_RATE']
+    add_statement_observer(_observe_statement)
+    app.wsgi_app = _end_spans_on_close(app.wsgi_app)
+
+    @app.before_request
+    def start_request_span():
+        root = start_trace(
+            f"{request.method} {request.endpoint or 'unmatched'}",
+            traceparent=request.headers.get('traceparent'),
+            **{'http.method': request.method, 'http.target': request.path}
+        )
+        if root is not None:
+            g._trace_span = root
+            g._trace_token = activate(root)
+
+    @app.after_request
+    def end_request_span(response):
+        root = g.pop('_trace_span', None)
+        if root is None:
+            return response
+
+        root.set_attribute('http.status_code', response.status_code)
+        if response.content_length is not None:
+            root.set_attribute('http.response_content_length', response.content_length)
+
+        # The body is sent after this hook returns (send_file streams from disk), so
+        # the request span and a response.send child end when the server closes it
+        send = Span('response.send', root.trace_id, root.span_id)
+
+        def end_spans():
+            send.end()
+            root.end()
+
+        request.environ[ON_CLOSE_KEY] = end_spans
+        return response
+
+    @app.teardown_request
+    def reset_request_span(exception=None):
+        # Only set if after_request never ran, i.e. an unhandled error
+        root = g.pop('_trace_span', None)
+        if root is not None:
+            if exception is not None:
+                root.record_error(exception)
+            root.end()
+
+        token = g.pop('_trace_token', None)
+        if token is not None:
+            deactivate(token)
@@ -0,0 +1,72 @@
+"""Worker warm-up - compile templates, configure mappers and fill connection pools before the first request"""
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+
+def warm_shared(app):
+    """
+    Warm what forked workers can share; run once in a preloading master
+
+    Compiles every template into the Jinja cache, configures the ORM
+    mappers and builds the URL matcher. Returns the seconds it took.
+    """
+    start = time.perf_counter()
+    for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html')):
+        app.jinja_env.get_template(name)
+    configure_mappers()
+    app.url_map.update()
+    return time.perf_counter() - start
+
+
+def warm_pools(app):
+    """
+    Open pool_size connections on every bind and return them to the pool
+
+    Connections inherited from a preloading master are dropped first
+    (without closing them, so the master's sockets stay intact). Returns
+    the number of connections opened.
+    """
+    from models import db
+
+    opened = 0
+    with app.app_context():
+        engines = dict(db.engines)
+
+    for key, engine in engines.items():
+        engine.dispose(close=False)
+        size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+        connections = []
+        try:
+            for _ in range(size):
+                connection = engine.connect()
+                connections.append(connection)
+                connection.execute(text("SELECT 1"))
+        except Exception as e:
+            print(f"Error warming the {key or 'primary'} connection pool: {str(e)}")
+        finally:
+            for connection in connections:
+                connection.close()
+        opened += len(connections)
+
+    return opened
+
+
+def warm_worker(app, include_shared=False):
+    """
+    Per-worker warm-up, run after the fork; returns the seconds it took
+
+    Fills the connection pools and the profiler's trigger cache. Pass
+    include_shared when no preloading master has run warm_shared.
+    """
+    start = time.perf_counter()
+    if include_shared:
+        warm_shared(app)
+    warm_pools(app)
+
+    if app.config['PROFILE_ENABLED']:
+        from utils.profiler import _active_triggers
+        with app.app_context():
+            _active_triggers(app)
+
+    return time.perf_counter() - start
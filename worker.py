@@ -0,0 +1,37 @@
+"""Background job worker - process queued jobs and enqueue periodic ones"""
+import argparse
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from utils.jobs import run_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the background job worker.')
+    parser.add_argument('--config', default=os.environ.get('FLASK_ENV', 'development'),
+                        help='Configuration name (default: FLASK_ENV or development)')
+    parser.add_argument('--concurrency', type=int, help='Jobs to run at once (default: JOB_WORKER_CONCURRENCY)')
+    parser.add_argument('--mode', choices=['thread', 'process'],
+                        help='Run jobs on a thread or process pool (default: JOB_WORKER_MODE)')
+    parser.add_argument('--poll-interval', type=float,
+                        help='Seconds to sleep when the queue is empty (default: JOB_POLL_INTERVAL_SECONDS)')
+    parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+
+    run_worker(app, args.config,
+               concurrency=args.concurrency,
+               mode=args.mode,
+               poll_interval=args.poll_interval,
+               burst=args.burst)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,7 @@
+"""WSGI entry point - `gunicorn wsgi:app`, with or without --preload"""
+import os
+from app import create_app
+
+# create_app opens no database connections and starts no threads, so the app
+# can be built once in a preloading master and shared by its forked workers
+app = create_app(os.environ.get('FLASK_ENV', 'production'))